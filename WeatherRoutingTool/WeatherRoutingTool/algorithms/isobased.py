@@ -1,4 +1,3 @@
-import datetime as dt
 import logging
 
 import cartopy.crs as ccrs
@@ -7,15 +6,15 @@ import numpy as np
 import matplotlib.pyplot as plt
 from geovectorslib import geod
 from global_land_mask import globe
-from scipy.stats import binned_statistic
 
 import WeatherRoutingTool.utils.graphics as graphics
 import WeatherRoutingTool.utils.formatting as form
 import WeatherRoutingTool.utils.unit_conversion as units
 from WeatherRoutingTool.constraints.constraints import *
 from WeatherRoutingTool.ship.ship import Boat
-from WeatherRoutingTool.ship.shipparams import ShipParams
+from WeatherRoutingTool.ship.shipparams import ShipParams, SHIPPARAMS_VARIABLES
 from WeatherRoutingTool.algorithms.routingalg import RoutingAlg
+from WeatherRoutingTool.algorithms.stephistory import StepHistory
 from WeatherRoutingTool.routeparams import RouteParams
 from WeatherRoutingTool.weather import WeatherCond
 
@@ -46,23 +45,29 @@ class IsoBased(RoutingAlg):
                - dist_per_step
                - speed_per_step
            are 0 to satisfy this definition.
+
+           The *_per_step variables are provided as properties. The values are stored in the StepHistory objects of
+           the dictionary 'history' which only keep the values of every routing step together with the index of the
+           parent variant. The (M,N) arrays are rebuilt by backtracking if they are requested:
+               - lats: lats_per_step, (M,N) array, N=headings+1, M=steps (M decreasing)
+               - lons: lons_per_step, (M,N) array, N=headings+1, M=steps
+               - azimuth: azimuth_per_step, heading
+               - dist: dist_per_step, geodesic distance traveled per time stamp
+               - starttime: starttime_per_step
+               - shipparams: shipparams_per_step, all variables of ShipParams (fuel, power, rpm, ...) in a single
+                 StepHistory with one array of length len(SHIPPARAMS_VARIABLES) per node
        '''
 
-    lats_per_step: np.ndarray  # lats: (M,N) array, N=headings+1, M=steps (M decreasing)    #
-    lons_per_step: np.ndarray  # longs: (M,N) array, N=headings+1, M=steps
-    azimuth_per_step: np.ndarray  # heading
-    dist_per_step: np.ndarray  # geodesic distance traveled per time stamp:
-    shipparams_per_step: ShipParams
-    starttime_per_step: np.ndarray
+    history: dict  # StepHistory objects for all per-step variables
 
     current_azimuth: np.ndarray  # current azimuth
     current_variant: np.ndarray  # current variant
 
     # the lenght of the following arrays depends on the number of variants (variant segments)
     full_dist_traveled: np.ndarray  # full geodesic distance since start for all variants
-    full_time_traveled: np.ndarray  # time elapsed since start for all variants
+    full_time_traveled: np.ndarray  # time elapsed since start for all variants (s)
     full_fuel_consumed: np.ndarray
-    time: np.ndarray  # current datetime for all variants
+    time: np.ndarray  # current time for all variants (datetime64[s])
 
     variant_segments: int  # number of variant segments in the range of -180° to 180°
     variant_increments_deg: int
@@ -73,20 +78,23 @@ class IsoBased(RoutingAlg):
     prune_bearings: bool
     minimisation_criterion: str
 
+    # multi-fidelity power estimation (see preselect_variants)
+    multi_fidelity_depth: int  # number of variants per pruning segment that are evaluated with the full power model
+    multi_fidelity_stats: dict  # number of power evaluations and agreement of surrogate and full power model
+    surrogate_survivors: np.ndarray  # indices of the variants that survived the pruning based on the surrogate
+
     def __init__(self, start, finish, departure_time, figurepath=""):
         super().__init__(start, finish, departure_time, figurepath)
 
-        self.lats_per_step = np.array([[start[0]]])
-        self.lons_per_step = np.array([[start[1]]])
-        self.azimuth_per_step = np.array([[None]])
-        self.dist_per_step = np.array([[0]])
-        sp = ShipParams.set_default_array()
-        self.shipparams_per_step = sp
-        self.starttime_per_step = np.array([[departure_time]])
-
-        self.time = np.array([departure_time])
-        self.full_time_traveled = np.array([0])
-        self.full_fuel_consumed = np.array([0])
+        self.history = {'lats': StepHistory([start[0]]), 'lons': StepHistory([start[1]]),
+                        'azimuth': StepHistory([None], dtype=object), 'dist': StepHistory([0]),
+                        'starttime': StepHistory([self.get_departure_time()], dtype='datetime64[s]')}
+        self.history['shipparams'] = StepHistory(np.zeros(len(SHIPPARAMS_VARIABLES)),
+                                                 value_shape=(len(SHIPPARAMS_VARIABLES),))
+
+        self.time = np.array([self.get_departure_time()])
+        self.full_time_traveled = np.array([0.])
+        self.full_fuel_consumed = np.array([0.])
         self.full_dist_traveled = np.array([0])
 
         self.current_variant = self.current_azimuth
@@ -99,6 +107,68 @@ class IsoBased(RoutingAlg):
 
         self.minimisation_criterion = 'squareddist_over_disttodest'
 
+        self.multi_fidelity_depth = 0
+        self.multi_fidelity_stats = {'evaluations_full': 0, 'evaluations_without_preselection': 0, 'survivors': 0,
+                                     'survivors_agreed': 0}
+        self.surrogate_survivors = None
+
+    @property
+    def lats_per_step(self):
+        return self.history['lats'].get_per_step()
+
+    @lats_per_step.setter
+    def lats_per_step(self, lats):
+        self.history['lats'].set_per_step(lats)
+
+    @property
+    def lons_per_step(self):
+        return self.history['lons'].get_per_step()
+
+    @lons_per_step.setter
+    def lons_per_step(self, lons):
+        self.history['lons'].set_per_step(lons)
+
+    @property
+    def azimuth_per_step(self):
+        return self.history['azimuth'].get_per_step()
+
+    @azimuth_per_step.setter
+    def azimuth_per_step(self, azimuth):
+        self.history['azimuth'].set_per_step(azimuth)
+
+    @property
+    def dist_per_step(self):
+        return self.history['dist'].get_per_step()
+
+    @dist_per_step.setter
+    def dist_per_step(self, dist):
+        self.history['dist'].set_per_step(dist)
+
+    @property
+    def starttime_per_step(self):
+        return self.history['starttime'].get_per_step()
+
+    @starttime_per_step.setter
+    def starttime_per_step(self, starttime):
+        self.history['starttime'].set_per_step(starttime)
+
+    @property
+    def shipparams_per_step(self):
+        per_step = self.history['shipparams'].get_per_step()
+        return ShipParams.from_array(np.ascontiguousarray(np.moveaxis(per_step, -1, 0)))
+
+    @shipparams_per_step.setter
+    def shipparams_per_step(self, ship_params):
+        self.history['shipparams'].set_per_step(np.moveaxis(ship_params.data, 0, -1))
+
+    ##
+    # allocate memory for the variants that survive the pruning of every routing step and the variants of a single
+    # unpruned routing step
+    def reserve_history(self):
+        nnodes = (self.ncount + 1) * self.prune_segments + self.prune_segments * (self.variant_segments + 1)
+        for hist in self.history.values():
+            hist.reserve(nnodes)
+
     def print_init(self):
         RoutingAlg.print_init(self)
         logger.info(form.get_log_step('pruning settings', 1))
@@ -109,6 +179,7 @@ class IsoBased(RoutingAlg):
         logger.info(form.get_log_step('ISOCHRONE_MINIMISATION_CRITERION: ' + str(self.minimisation_criterion), 2))
         logger.info(form.get_log_step('ROUTER_HDGS_SEGMENTS: ' + str(self.variant_segments), 2))
         logger.info(form.get_log_step('ROUTER_HDGS_INCREMENTS_DEG: ' + str(self.variant_increments_deg), 2))
+        logger.info(form.get_log_step('MULTI_FIDELITY_DEPTH: ' + str(self.multi_fidelity_depth), 2))
 
     def print_current_status(self):
         print('PRINTING ALG SETTINGS')
@@ -155,20 +226,15 @@ class IsoBased(RoutingAlg):
 
     def define_variants(self):
         # branch out for multiple headings
-        nof_input_routes = self.lats_per_step.shape[1]
+        nof_input_routes = self.get_current_lats().shape[0]
 
         new_finish_one = np.repeat(self.finish_temp[0], nof_input_routes)
         new_finish_two = np.repeat(self.finish_temp[1], nof_input_routes)
 
-        new_azi = geod.inverse(self.lats_per_step[0], self.lons_per_step[0], new_finish_one, new_finish_two)
+        new_azi = geod.inverse(self.get_current_lats(), self.get_current_lons(), new_finish_one, new_finish_two)
 
-        self.lats_per_step = np.repeat(self.lats_per_step, self.variant_segments + 1, axis=1)
-        self.lons_per_step = np.repeat(self.lons_per_step, self.variant_segments + 1, axis=1)
-        self.dist_per_step = np.repeat(self.dist_per_step, self.variant_segments + 1, axis=1)
-        self.azimuth_per_step = np.repeat(self.azimuth_per_step, self.variant_segments + 1, axis=1)
-        self.starttime_per_step = np.repeat(self.starttime_per_step, self.variant_segments + 1, axis=1)
-
-        self.shipparams_per_step.define_variants(self.variant_segments)
+        for hist in self.history.values():
+            hist.repeat(self.variant_segments + 1)
 
         self.full_time_traveled = np.repeat(self.full_time_traveled, self.variant_segments + 1, axis=0)
         self.full_fuel_consumed = np.repeat(self.full_fuel_consumed, self.variant_segments + 1, axis=0)
@@ -210,6 +276,7 @@ class IsoBased(RoutingAlg):
             """
 
         self.check_settings()
+        self.reserve_history()
         self.check_for_positive_constraints(constraints_list)
         self.define_initial_variants()
         # start_time=time.time()
@@ -253,7 +320,13 @@ class IsoBased(RoutingAlg):
         """
                 calculate new boat position for current time step based on wind and boat function
             """
+        if self.multi_fidelity_depth > 0:
+            self.preselect_variants(wt, boat, constraint_list)
+            self.multi_fidelity_stats['evaluations_full'] += self.get_current_lats().shape[0]
+
+        self.move_boat(wt, boat, constraint_list)
 
+    def move_boat(self, wt: WeatherCond, boat: Boat, constraint_list: ConstraintsList, use_surrogate=False):
         # get wind speed (tws) and angle (twa)
         debug = False
 
@@ -261,8 +334,16 @@ class IsoBased(RoutingAlg):
         bs = boat.boat_speed_function()
         bs = np.repeat(bs, (self.get_current_azimuth().shape[0]), axis=0)
 
-        ship_params = boat.get_fuel_per_time_netCDF(self.get_current_azimuth(), self.get_current_lats(),
-                                                    self.get_current_lons(), self.time, True)
+        if use_surrogate:
+            ship_params = boat.get_fuel_surrogate(self.get_current_azimuth(), self.get_current_lats(),
+                                                  self.get_current_lons(), self.time)
+        else:
+            # the variants of every position are stored consecutively (see define_variants) unless a subset of them
+            # has been preselected based on the surrogate (see preselect_variants)
+            unique_coords = self.surrogate_survivors is None
+            n_coords = self.get_current_lats().shape[0] // (self.variant_segments + 1) if unique_coords else None
+            ship_params = boat.get_fuel_per_time_netCDF(self.get_current_azimuth(), self.get_current_lats(),
+                                                        self.get_current_lons(), self.time, unique_coords, n_coords)
         units.cut_angles(self.current_variant)
 
         # ship_params.print()
@@ -287,44 +368,83 @@ class IsoBased(RoutingAlg):
         self.update_position(move, is_constrained, dist)
         self.update_time(delta_time)
         self.update_fuel(delta_fuel)
-        self.update_shipparams(ship_params)
+        self.update_shipparams(ship_params, delta_fuel)
         self.count += 1
 
-    def update_shipparams(self, ship_params_single_step):
-        new_rpm = np.vstack((ship_params_single_step.get_rpm(), self.shipparams_per_step.get_rpm()))
-        new_power = np.vstack((ship_params_single_step.get_power(), self.shipparams_per_step.get_power()))
-        new_speed = np.vstack((ship_params_single_step.get_speed(), self.shipparams_per_step.get_speed()))
-        new_rwind = np.vstack((ship_params_single_step.get_rwind(), self.shipparams_per_step.get_rwind()))
-        new_rcalm = np.vstack((ship_params_single_step.get_rcalm(), self.shipparams_per_step.get_rcalm()))
-        new_rwaves = np.vstack((ship_params_single_step.get_rwaves(), self.shipparams_per_step.get_rwaves()))
-        new_rshallow = np.vstack((ship_params_single_step.get_rshallow(), self.shipparams_per_step.get_rshallow()))
-        new_rroughness = np.vstack(
-            (ship_params_single_step.get_rroughness(), self.shipparams_per_step.get_rroughness()))
-
-        self.shipparams_per_step.set_rpm(new_rpm)
-        self.shipparams_per_step.set_power(new_power)
-        self.shipparams_per_step.set_speed(new_speed)
-        self.shipparams_per_step.set_rwind(new_rwind)
-        self.shipparams_per_step.set_rcalm(new_rcalm)
-        self.shipparams_per_step.set_rwaves(new_rwaves)
-        self.shipparams_per_step.set_rshallow(new_rshallow)
-        self.shipparams_per_step.set_rroughness(new_rroughness)
+    ##
+    # Multi-fidelity power estimation: all variants are moved based on the power estimate of the surrogate model of
+    # the boat (Boat.get_fuel_surrogate) and pruned. The routing step is undone afterwards and only the variants that
+    # are among the 'multi_fidelity_depth' best variants of their pruning segment are kept for the evaluation with the
+    # full power model. Steps that reach a destination or an intermediate waypoint are not preselected.
+    def preselect_variants(self, wt: WeatherCond, boat: Boat, constraint_list: ConstraintsList):
+        nvariants = self.get_current_lats().shape[0]
+        self.multi_fidelity_stats['evaluations_without_preselection'] += nvariants
+
+        history_state = {var: hist.get_state() for var, hist in self.history.items()}
+        state = (self.full_dist_traveled, self.full_time_traveled, self.full_fuel_consumed, self.time, self.count,
+                 self.current_variant.copy())
+
+        self.move_boat(wt, boat, constraint_list, use_surrogate=True)
+
+        candidates = np.array([], dtype=int)
+        surrogate_survivors = None
+        if not (self.is_last_step or self.is_pos_constraint_step):
+            for i in range(0, self.multi_fidelity_depth):
+                idxs = self.pruning_per_step(True, select=False)
+                if surrogate_survivors is None:
+                    surrogate_survivors = idxs
+                candidates = np.union1d(candidates, idxs)
+                # variants with zero distance are treated as constrained, i.e. they are excluded from the next round
+                self.full_dist_traveled = self.full_dist_traveled.copy()
+                self.full_dist_traveled[idxs] = 0
+
+        for var, hist in self.history.items():
+            hist.restore_state(history_state[var])
+        (self.full_dist_traveled, self.full_time_traveled, self.full_fuel_consumed, self.time, self.count,
+         self.current_variant) = state
+
+        if self.is_last_step or self.is_pos_constraint_step or candidates.shape[0] == 0:
+            self.is_last_step = False
+            self.is_pos_constraint_step = False
+            self.surrogate_survivors = None
+            return
+
+        self.select_variants(candidates)
+        self.surrogate_survivors = np.searchsorted(candidates, surrogate_survivors)
+
+    def get_multi_fidelity_summary(self):
+        stats = self.multi_fidelity_stats
+        agreement = stats['survivors_agreed'] / stats['survivors'] if stats['survivors'] > 0 else np.nan
+        return ('full power evaluations: ' + str(stats['evaluations_full']) + ' (without preselection: ' + str(
+            stats['evaluations_without_preselection']) + '), agreement of surrogate and full power model for ' + str(
+            stats['survivors']) + ' pruning survivors: ' + str(round(agreement * 100, 1)) + '%')
+
+    ##
+    # appends the ship parameters of the current routing step; the fuel rate of the power estimation is replaced by
+    # the fuel consumed during the step (delta_fuel) if provided
+    def update_shipparams(self, ship_params_single_step, delta_fuel=None):
+        row = np.moveaxis(ship_params_single_step.data, 0, -1).astype(float)
+        if delta_fuel is not None:
+            row[..., SHIPPARAMS_VARIABLES.index('fuel')] = delta_fuel
+        self.history['shipparams'].append(row)
 
     def check_variant_def(self):
-        if (not ((self.lats_per_step.shape[1] == self.lons_per_step.shape[1]) and (
-                self.lats_per_step.shape[1] == self.azimuth_per_step.shape[1]) and (
-                         self.lats_per_step.shape[1] == self.dist_per_step.shape[1]))):
-            raise 'define_variants: number of columns not matching!'
-
-        if (not ((self.lats_per_step.shape[0] == self.lons_per_step.shape[0]) and (
-                self.lats_per_step.shape[0] == self.azimuth_per_step.shape[0]) and (
-                         self.lats_per_step.shape[0] == self.dist_per_step.shape[0]) and (
-                         self.lats_per_step.shape[0] == (self.count + 1)))):
+        lats_shape = self.history['lats'].shape
+        lons_shape = self.history['lons'].shape
+        azimuth_shape = self.history['azimuth'].shape
+        dist_shape = self.history['dist'].shape
+
+        if (not ((lats_shape[1] == lons_shape[1]) and (lats_shape[1] == azimuth_shape[1]) and (
+                lats_shape[1] == dist_shape[1]))):
+            raise ValueError('define_variants: number of columns not matching!')
+
+        if (not ((lats_shape[0] == lons_shape[0]) and (lats_shape[0] == azimuth_shape[0]) and (
+                lats_shape[0] == dist_shape[0]) and (lats_shape[0] == (self.count + 1)))):
             raise ValueError(
                 'define_variants: number of rows not matching! count = ' + str(self.count) + ' lats per step ' + str(
-                    self.lats_per_step.shape[0]))
+                    lats_shape[0]))
 
-    def pruning(self, trim, bins, larger_direction_based=True):
+    def pruning(self, trim, bins, larger_direction_based=True, select=True):
         debug = False
         valid_pruning_segments = -99
 
@@ -333,36 +453,18 @@ class IsoBased(RoutingAlg):
             print('current courses', self.current_variant)
             print('full_dist_traveled', self.full_time_traveled)
 
-        idxs = []
-
-        bin_stat = None
-        bin_edges = None
-        bin_number = None
         if larger_direction_based:
-            bin_stat, bin_edges, bin_number = self.larger_direction_based_pruning(bins)
-        else:
-            bin_stat, bin_edges, bin_number = self.courses_based_pruning(bins)
-
-        if trim:
-            for i in range(len(bin_edges) - 1):
-                try:
-                    if (bin_stat[i] == 0):
-                        # form.print_step('Pruning: sector ' + str(i) + 'is null (binstat[i])=' + str(bin_stat[i]) +
-                        # 'full_dist_traveled=' + str(self.full_dist_traveled))
-                        continue
-                    idxs.append(np.where(self.full_dist_traveled == bin_stat[i])[0][0])
-                except IndexError:
-                    pass
-            idxs = list(set(idxs))
+            idxs = self.larger_direction_based_pruning(bins, trim)
         else:
-            for i in range(len(bin_edges) - 1):
-                idxs.append(np.where(self.full_dist_traveled == bin_stat[i])[0])
-            idxs = list(set([item for subl in idxs for item in subl]))
+            idxs = self.courses_based_pruning(bins, trim)
 
         if (debug):
             print('full_dist_traveled', self.full_dist_traveled)
             print('Indexes that passed', idxs)
 
+        if not select:
+            return idxs
+
         valid_pruning_segments = len(idxs)
         if (valid_pruning_segments == 0):
             logger.error(' All pruning segments fully constrained for step ' + str(self.count) + '!')
@@ -371,15 +473,18 @@ class IsoBased(RoutingAlg):
         elif (valid_pruning_segments < self.prune_segments * 0.5):
             logger.warning(' More than 50% of pruning segments constrained for step ' + str(self.count) + '!')
 
+        if self.surrogate_survivors is not None:
+            self.multi_fidelity_stats['survivors'] += len(idxs)
+            self.multi_fidelity_stats['survivors_agreed'] += np.intersect1d(idxs, self.surrogate_survivors).shape[0]
+            self.surrogate_survivors = None
+
         # Return a trimmed isochrone
-        try:
-            self.lats_per_step = self.lats_per_step[:, idxs]
-            self.lons_per_step = self.lons_per_step[:, idxs]
-            self.azimuth_per_step = self.azimuth_per_step[:, idxs]
-            self.dist_per_step = self.dist_per_step[:, idxs]
-            self.shipparams_per_step.select(idxs)
+        self.select_variants(idxs)
+        return idxs
 
-            self.starttime_per_step = self.starttime_per_step[:, idxs]
+    def select_variants(self, idxs):
+        try:
+            self.select_from_history(idxs)
 
             self.current_azimuth = self.current_variant[idxs]
             self.current_variant = self.current_variant[idxs]
@@ -390,27 +495,90 @@ class IsoBased(RoutingAlg):
         except IndexError:
             raise Exception('Pruned indices running out of bounds.')
 
-    def courses_based_pruning(self, bins):
-        bin_stat, bin_edges, bin_number = binned_statistic(self.current_variant, self.full_dist_traveled,
-                                                           statistic=np.nanmax, bins=bins)
-        return bin_stat, bin_edges, bin_number
-
-    def larger_direction_based_pruning(self, bins):
-        start_lats = np.repeat(self.start_temp[0], self.lats_per_step.shape[1])
-        start_lons = np.repeat(self.start_temp[1], self.lons_per_step.shape[1])
-        larger_direction = geod.inverse(start_lats, start_lons, self.lats_per_step[0], self.lons_per_step[0])
+    def select_from_history(self, idxs):
+        for hist in self.history.values():
+            hist.select(idxs)
+
+    ##
+    # Select the variants that survive the pruning. Variants are sorted into bins based on their course.
+    def courses_based_pruning(self, bins, trim=True):
+        return self.get_pruning_indices(self.current_variant, self.full_dist_traveled, bins, trim,
+                                        self.get_constrained_variants())
+
+    ##
+    # Select the variants that survive the pruning. Variants are sorted into bins based on the azimuth of the gcr
+    # connecting the starting point (or last intermediate waypoint) and their current position.
+    def larger_direction_based_pruning(self, bins, trim=True):
+        start_lats = np.repeat(self.start_temp[0], self.get_current_lats().shape[0])
+        start_lons = np.repeat(self.start_temp[1], self.get_current_lons().shape[0])
+        larger_direction = geod.inverse(start_lats, start_lons, self.get_current_lats(), self.get_current_lons())
         larger_direction = larger_direction['azi1']
-        bin_stat, bin_edges, bin_number = binned_statistic(larger_direction, self.full_dist_traveled,
-                                                           statistic=np.nanmax, bins=bins)
-        return bin_stat, bin_edges, bin_number
+        return self.get_pruning_indices(larger_direction, self.full_dist_traveled, bins, trim,
+                                        self.get_constrained_variants())
 
-    def pruning_per_step(self, trim=True):
+    ##
+    # constrained variants have been assigned a distance of zero in update_position()
+    def get_constrained_variants(self):
+        return self.full_dist_traveled == 0
+
+    @staticmethod
+    def get_pruning_indices(bin_variable, values, bins, trim=True, is_constrained=None):
+        '''
+        Determine the indices of the variants that maximise 'values' within the bins of 'bin_variable' that are
+        defined by the sorted bin edges 'bins'. As for scipy.stats.binned_statistic, all bins but the last are half-open
+        and variants outside of the bins are discarded. Variants for which 'values' or 'bin_variable' are NaN are
+        ignored.
+
+        trim = True: return the index of the (first) variant with the maximum value for every bin. Constrained
+            variants are never selected, i.e. bins that only contain constrained variants are dropped.
+        trim = False: return the indices of all variants that reach the maximum value of their bin.
+
+        The variants are grouped by a stable sort of their bin numbers and the maxima are obtained via
+        np.maximum.reduceat. Thus, there is no loop over the bins and, as the ordering within each bin is preserved,
+        ties are resolved within the correct bin. The indices are returned in ascending order.
+        '''
+        bin_variable = np.asarray(bin_variable, dtype=float)
+        values = np.asarray(values, dtype=float)
+        nbins = len(bins) - 1
+
+        bin_number = np.searchsorted(bins, bin_variable, side='right') - 1
+        bin_number[bin_variable == bins[-1]] = nbins - 1
+
+        is_valid = (bin_number >= 0) & (bin_number < nbins) & ~np.isnan(values) & ~np.isnan(bin_variable)
+        if trim and (is_constrained is not None):
+            is_valid = is_valid & ~np.asarray(is_constrained, dtype=bool)
+        candidates = np.flatnonzero(is_valid)
+        if candidates.shape[0] == 0:
+            return candidates
+
+        # stable sort keeps the variants of every bin in ascending order; numpy uses radix sort for int16
+        bin_dtype = np.int16 if nbins < np.iinfo(np.int16).max else int
+        order = np.argsort(bin_number[candidates].astype(bin_dtype), kind='stable')
+        candidates = candidates[order]
+        sorted_bins = bin_number[candidates]
+        sorted_values = values[candidates]
+
+        bin_start = np.flatnonzero(np.diff(sorted_bins, prepend=-1) != 0)
+        bin_size = np.diff(bin_start, append=candidates.shape[0])
+        bin_max = np.maximum.reduceat(sorted_values, bin_start)
+        is_max = sorted_values == np.repeat(bin_max, bin_size)
+
+        if trim:
+            # every bin contains at least one maximum, the first one is the one with the lowest index
+            max_position = np.flatnonzero(is_max)
+            first_max = max_position[np.searchsorted(max_position, bin_start)]
+            return np.sort(candidates[first_max])
+        return np.sort(candidates[is_max])
+
+    ##
+    # select=False: only return the indices of the variants that survive the pruning
+    def pruning_per_step(self, trim=True, select=True):
         if self.prune_gcr_centered:
-            self.pruning_gcr_centered(trim)
+            return self.pruning_gcr_centered(trim, select)
         else:
-            self.pruning_headings_centered(trim)
+            return self.pruning_headings_centered(trim, select)
 
-    def pruning_gcr_centered(self, trim=True):
+    def pruning_gcr_centered(self, trim=True, select=True):
         '''
         For every pruning segment, select the route that maximises the distance towards the starting point (or last
         intermediate waypoint). All other routes are discarded. The symmetry axis of the pruning segments is defined
@@ -428,9 +596,10 @@ class IsoBased(RoutingAlg):
         # of the azimuth defined by the distance between the start point and the destination for the mean distance
         # travelled
         # during the current routing step.
-        start_lats = np.repeat(self.start_temp[0], self.lats_per_step.shape[1])
-        start_lons = np.repeat(self.start_temp[1], self.lons_per_step.shape[1])
-        full_travel_dist = geod.inverse(start_lats, start_lons, self.lats_per_step[0], self.lons_per_step[1])
+        start_lats = np.repeat(self.start_temp[0], self.get_current_lats().shape[0])
+        start_lons = np.repeat(self.start_temp[1], self.get_current_lons().shape[0])
+        full_travel_dist = geod.inverse(start_lats, start_lons, self.get_current_lats(),
+                                        self.history['lons'].get_row(1))
         mean_dist = np.mean(full_travel_dist['s12'])
         gcr_point = geod.direct([self.start_temp[0]], [self.start_temp[1]], self.gcr_azi_temp, mean_dist)
 
@@ -450,14 +619,14 @@ class IsoBased(RoutingAlg):
         bins = np.sort(bins)
 
         if self.prune_bearings:
-            self.pruning(trim, bins, False)
+            return self.pruning(trim, bins, False, select)
         else:
             if ((self.ncount % 10) < 3) and (self.ncount > 10):
-                self.pruning(trim, bins, True)
+                return self.pruning(trim, bins, True, select)
             else:
-                self.pruning(trim, bins, False)
+                return self.pruning(trim, bins, False, select)
 
-    def pruning_headings_centered(self, trim=True):
+    def pruning_headings_centered(self, trim=True, select=True):
         '''
         For every pruning segment, select the route that maximises the distance towards the starting point (or last
         intermediate waypoint). All other routes are discarded. The symmetry axis of the pruning segments is given by
@@ -469,11 +638,11 @@ class IsoBased(RoutingAlg):
             print('Pruning... Pruning symmetry axis defined by median of considered headings.')
 
         # propagate current end points towards temporary destination
-        nof_input_routes = self.lats_per_step.shape[1]
+        nof_input_routes = self.get_current_lats().shape[0]
         new_finish_one = np.repeat(self.finish_temp[0], nof_input_routes)
         new_finish_two = np.repeat(self.finish_temp[1], nof_input_routes)
 
-        new_azi = geod.inverse(self.lats_per_step[0], self.lons_per_step[0], new_finish_one, new_finish_two)
+        new_azi = geod.inverse(self.get_current_lats(), self.get_current_lons(), new_finish_one, new_finish_two)
 
         # sort azimuths and select (approximate) median
         new_azi_sorted = np.sort(new_azi['azi1'])
@@ -516,12 +685,12 @@ class IsoBased(RoutingAlg):
             print('bins: ', bins)
 
         if self.prune_bearings:
-            self.pruning(trim, bins, False)
+            return self.pruning(trim, bins, False, select)
         else:
             if ((self.ncount % 10) < 3) and (self.ncount > 10):
-                self.pruning(trim, bins, True)
+                return self.pruning(trim, bins, True, select)
             else:
-                self.pruning(trim, bins, False)
+                return self.pruning(trim, bins, False, select)
 
     def define_variants_per_step(self):
         self.define_variants()
@@ -539,14 +708,17 @@ class IsoBased(RoutingAlg):
         self.variant_segments = seg
         self.variant_increments_deg = inc
 
+    def set_multi_fidelity_depth(self, depth):
+        self.multi_fidelity_depth = depth
+
     def get_current_azimuth(self):
         return self.current_variant
 
     def get_current_lats(self):
-        return self.lats_per_step[0, :]
+        return self.history['lats'].get_current()
 
     def get_current_lons(self):
-        return self.lons_per_step[0, :]
+        return self.history['lons'].get_current()
 
     def get_current_speed(self):
         return self.speed_per_step[0]
@@ -579,26 +751,34 @@ class IsoBased(RoutingAlg):
 
     def terminate(self):
         super().terminate()
+        if self.multi_fidelity_depth > 0:
+            logger.info(form.get_log_step('Multi-fidelity power estimation: ' + self.get_multi_fidelity_summary(), 1))
 
-        self.lats_per_step = np.flip(self.lats_per_step, 0)
-        self.lons_per_step = np.flip(self.lons_per_step, 0)
-        self.azimuth_per_step = np.flip(self.azimuth_per_step, 0)
-        self.dist_per_step = np.flip(self.dist_per_step, 0)
-        self.starttime_per_step = np.flip(self.starttime_per_step, 0)
-        self.shipparams_per_step.flip()
+        ship_params = self.shipparams_per_step
+        ship_params.flip()
 
         time = round(self.full_time_traveled / 3600, 2)
         route = RouteParams(count=self.count, start=self.start, finish=self.finish, gcr=self.full_dist_traveled,
-                            route_type='min_time_route', time=time, lats_per_step=self.lats_per_step[:],
-                            lons_per_step=self.lons_per_step[:], azimuths_per_step=self.azimuth_per_step[:],
-                            dists_per_step=self.dist_per_step[:], starttime_per_step=self.starttime_per_step[:],
-                            ship_params_per_step=self.shipparams_per_step)
+                            route_type='min_time_route', time=time, lats_per_step=self.history['lats'].get_route(),
+                            lons_per_step=self.history['lons'].get_route(),
+                            azimuths_per_step=self.history['azimuth'].get_route(),
+                            dists_per_step=self.history['dist'].get_route(),
+                            starttime_per_step=self.history['starttime'].get_route(), ship_params_per_step=ship_params)
 
         return route
 
+    def get_departure_time(self):
+        return np.datetime64(self.departure_time, 's')
+
+    ##
+    # The current time of all variants is obtained from the time elapsed since departure which is accumulated in
+    # seconds to avoid the accumulation of rounding errors.
     def update_time(self, delta_time):
-        self.full_time_traveled += delta_time
-        self.time += dt.timedelta(seconds=delta_time)
+        if not ((self.full_time_traveled.shape == delta_time.shape) and (self.time.shape == delta_time.shape)):
+            raise ValueError('shapes of delta_time, time and full_time_traveled not matching!')
+        self.full_time_traveled = self.full_time_traveled + delta_time
+        self.time = self.get_departure_time() + units.convert_s_to_nptd64(self.full_time_traveled)
+        self.history['starttime'].append(self.time)
 
     def check_bearing(self, dist):
         debug = False
@@ -640,10 +820,10 @@ class IsoBased(RoutingAlg):
     def check_constraints(self, move, constraint_list):
         debug = False
 
-        is_constrained = [False for i in range(0, self.lats_per_step.shape[1])]
+        is_constrained = [False for i in range(0, self.get_current_lats().shape[0])]
         if (debug):
             form.print_step('shape is_constraint before checking:' + str(len(is_constrained)), 1)
-        is_constrained = constraint_list.safe_crossing(self.lats_per_step[0], self.lons_per_step[0], move['lat2'],
+        is_constrained = constraint_list.safe_crossing(self.get_current_lats(), self.get_current_lons(), move['lat2'],
                                                        move['lon2'], self.time, is_constrained)
         if (debug):
             form.print_step('is_constrained after checking' + str(is_constrained), 1)
@@ -651,10 +831,10 @@ class IsoBased(RoutingAlg):
 
     def update_position(self, move, is_constrained, dist):
         debug = False
-        self.lats_per_step = np.vstack((move['lat2'], self.lats_per_step))
-        self.lons_per_step = np.vstack((move['lon2'], self.lons_per_step))
-        self.dist_per_step = np.vstack((dist, self.dist_per_step))
-        self.azimuth_per_step = np.vstack((self.current_variant, self.azimuth_per_step))
+        self.history['lats'].append(move['lat2'])
+        self.history['lons'].append(move['lon2'])
+        self.history['dist'].append(dist)
+        self.history['azimuth'].append(self.current_variant)
 
         if (debug):
             print('path of this step' +  # str(move['lat1']) +
@@ -663,11 +843,12 @@ class IsoBased(RoutingAlg):
             print('dist_per_step', self.dist_per_step)
             print('dist', dist)
 
-        start_lats = np.repeat(self.start_temp[0], self.lats_per_step.shape[1])
-        start_lons = np.repeat(self.start_temp[1], self.lons_per_step.shape[1])
+        nvariants = self.get_current_lats().shape[0]
+        start_lats = np.repeat(self.start_temp[0], nvariants)
+        start_lons = np.repeat(self.start_temp[1], nvariants)
         travel_dist = geod.inverse(start_lats, start_lons, move['lat2'], move['lon2'])  # calculate full distance
-        end_lats = np.repeat(self.finish_temp[0], self.lats_per_step.shape[1])
-        end_lons = np.repeat(self.finish_temp[1], self.lons_per_step.shape[1])
+        end_lats = np.repeat(self.finish_temp[0], nvariants)
+        end_lons = np.repeat(self.finish_temp[1], nvariants)
         dist_to_dest = geod.inverse(move['lat2'], move['lon2'], end_lats, end_lons)  # calculate full distance
 
         # traveled, azimuth of gcr connecting start and new position
@@ -676,9 +857,6 @@ class IsoBased(RoutingAlg):
         # gcrs['s12'][is_constrained] = 0
         travel_dist['s12'][is_constrained] = 0
 
-        concatenated_distance = np.sum(self.dist_per_step, axis=0)
-        concatenated_distance[is_constrained] = 0
-
         if np.all(dist_to_dest['s12']) > 0:
             if self.minimisation_criterion == 'squareddist_over_disttodest':
                 self.full_dist_traveled = travel_dist['s12'] * travel_dist['s12'] / dist_to_dest['s12']
@@ -689,10 +867,10 @@ class IsoBased(RoutingAlg):
         if (debug):
             print('full_dist_traveled:', self.full_dist_traveled)
 
+    ##
+    # the fuel consumed during the step is stored by update_shipparams()
     def update_fuel(self, delta_fuel):
-        self.shipparams_per_step.set_fuel(np.vstack((delta_fuel, self.shipparams_per_step.get_fuel())))
-        for i in range(0, self.full_fuel_consumed.shape[0]):
-            self.full_fuel_consumed[i] += delta_fuel[i]
+        self.full_fuel_consumed = self.full_fuel_consumed + delta_fuel
 
     def get_delta_variables(self, boat, wind, bs):
         pass
@@ -711,13 +889,7 @@ class IsoBased(RoutingAlg):
 
         if (self.showDepth):
             # decrease resolution and extend of depth data to prevent memory issues when plotting
-            ds_depth = water_depth.depth_data.coarsen(latitude=10, longitude=10, boundary='exact').mean()
-            ds_depth_coarsened = ds_depth.compute()
-
-            self.depth = ds_depth_coarsened.where(
-                (ds_depth_coarsened.latitude > map.lat1) & (ds_depth_coarsened.latitude < map.lat2) & (
-                        ds_depth_coarsened.longitude > map.lon1) & (ds_depth_coarsened.longitude < map.lon2) & (
-                        ds_depth_coarsened.depth < 0), drop=True)
+            self.depth = water_depth.get_plot_depth(map)
 
         self.generate_basemap()
 
@@ -759,15 +931,17 @@ class IsoBased(RoutingAlg):
         self.ax.remove()
         self.generate_basemap()
 
-        count_routeseg = self.lats_per_step.shape[1]
+        lats_per_step = self.lats_per_step
+        lons_per_step = self.lons_per_step
+        count_routeseg = lats_per_step.shape[1]
 
         for iRoute in range(0, count_routeseg):
-            route, = self.ax.plot(self.lons_per_step[:, 0], self.lats_per_step[:, 0], color="firebrick")
+            route, = self.ax.plot(lons_per_step[:, 0], lats_per_step[:, 0], color="firebrick")
             route_ensemble.append(route)
 
         for iRoute in range(0, count_routeseg):
-            route_ensemble[iRoute].set_xdata(self.lons_per_step[:, iRoute])
-            route_ensemble[iRoute].set_ydata(self.lats_per_step[:, iRoute])
+            route_ensemble[iRoute].set_xdata(lons_per_step[:, iRoute])
+            route_ensemble[iRoute].set_ydata(lats_per_step[:, iRoute])
             fig.canvas.draw()
             fig.canvas.flush_events()
 
@@ -776,13 +950,8 @@ class IsoBased(RoutingAlg):
         plt.savefig(final_path)
 
     def expand_axis_for_intermediate(self):
-        self.lats_per_step = np.expand_dims(self.lats_per_step, axis=1)
-        self.lons_per_step = np.expand_dims(self.lons_per_step, axis=1)
-        self.azimuth_per_step = np.expand_dims(self.azimuth_per_step, axis=1)
-        self.dist_per_step = np.expand_dims(self.dist_per_step, axis=1)
-        self.starttime_per_step = np.expand_dims(self.starttime_per_step, axis=1)
-
-        self.shipparams_per_step.expand_axis_for_intermediate()
+        for hist in self.history.values():
+            hist.expand_axis_for_intermediate()
 
     def final_pruning(self):
         pass
@@ -812,8 +981,8 @@ class IsoBased(RoutingAlg):
         print(self.finish_temp)
 
     def check_destination(self):
-        destination_lats = self.lats_per_step[0]
-        destination_lons = self.lons_per_step[0]
+        destination_lats = self.get_current_lats()
+        destination_lons = self.get_current_lons()
 
         arrived_at_destination = (destination_lats == self.finish[0]) & (destination_lons == self.finish[1])
         if not arrived_at_destination:
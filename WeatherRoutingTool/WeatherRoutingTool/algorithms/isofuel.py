@@ -1,4 +1,3 @@
-import datetime as dt
 import logging
 
 from geovectorslib import geod
@@ -79,14 +78,6 @@ class IsoFuel(IsoBased):
         print('delta_time', delta_time / 3600)
         print('spread of time: ' + str(mean / 3600) + '+-' + str(stddev / 3600))
 
-    def update_time(self, delta_time):
-        if not ((self.full_time_traveled.shape == delta_time.shape) and (self.time.shape == delta_time.shape)):
-            raise ValueError('shapes of delta_time, time and full_time_traveled not matching!')
-        for i in range(0, self.full_time_traveled.shape[0]):
-            self.full_time_traveled[i] += delta_time[i]
-            self.time[i] += dt.timedelta(seconds=delta_time[i])
-        self.starttime_per_step = np.vstack((self.time, self.starttime_per_step))
-
     def final_pruning(self):
         debug = False
         if (debug):
@@ -100,12 +91,7 @@ class IsoFuel(IsoBased):
 
         # Return a trimmed isochrone
         try:
-            self.lats_per_step = self.lats_per_step[:, idxs]
-            self.lons_per_step = self.lons_per_step[:, idxs]
-            self.azimuth_per_step = self.azimuth_per_step[:, idxs]
-            self.dist_per_step = self.dist_per_step[:, idxs]
-            self.starttime_per_step = self.starttime_per_step[:, idxs]
-            self.shipparams_per_step.select(idxs)
+            self.select_from_history(idxs)
 
             self.current_azimuth = self.current_variant[idxs]
             self.current_variant = self.current_variant[idxs]
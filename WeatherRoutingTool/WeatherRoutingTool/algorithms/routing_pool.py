@@ -0,0 +1,155 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import WeatherRoutingTool.utils.formatting as form
+from WeatherRoutingTool.utils.processes import get_context
+
+logger = logging.getLogger('WRT.routingpool')
+
+# Objects that are shared by all routing tasks within a worker process (see init_worker)
+shared_data = {}
+
+
+##
+# Executes several routing tasks (e.g. the same route for different departure times or the routes of a whole fleet)
+# in parallel worker processes.
+#
+# The boat, the weather data and the constraints are loaded once in the main process and are passed to the worker
+# processes on creation. With the start method 'fork' (see utils.processes.get_context), the workers inherit them
+# without pickling, and only the routing algorithm objects and the resulting RouteParams are transferred between the
+# processes. With 'spawn' or 'forkserver', the shared objects are pickled for every worker process. Every task is
+# executed in a fresh worker process (maxtasksperchild=1) such that modifications of the shared objects during the
+# routing, e.g. of the state of the positive constraints, do not affect other tasks.
+#
+# If the boat has a power cache, every task starts with the entries of the cache of the main process, and the entries
+# that have been inserted by the task are merged back into it afterwards. Thus, the cache of the main process covers
+# all routing tasks, e.g. for writing it to file, while the tasks that are executed at the same time do not share
+# their results.
+
+class RoutingPool:
+    processes: int  # maximum number of worker processes
+
+    def __init__(self, boat, wt, constraint_list, processes=None):
+        self.boat = boat
+        self.wt = wt
+        self.constraint_list = constraint_list
+
+        if processes is None:
+            processes = os.cpu_count()
+        self.processes = processes
+
+    ##
+    # executes the routing algorithms; optionally, 'jobs' provides the boat speed (BOAT_SPEED) and the boat draught
+    # (BOAT_DRAUGHT) for every routing algorithm. Settings that are not provided are taken from the shared objects.
+    def execute_routing(self, routing_algs, jobs=None):
+        ntasks = len(routing_algs)
+        if jobs is None:
+            jobs = [{}] * ntasks
+        if len(jobs) != ntasks:
+            raise ValueError('RoutingPool: number of jobs (' + str(len(jobs)) + ') not matching number of routing '
+                             'algorithms (' + str(ntasks) + ')!')
+
+        nprocesses = max(1, min(self.processes, ntasks))
+        logger.info(form.get_log_step('Starting ' + str(ntasks) + ' routing tasks on ' + str(nprocesses) +
+                                      ' processes', 0))
+
+        # rasters of the constraints are compiled once for every draught instead of once per routing task
+        draughts = sorted({job['BOAT_DRAUGHT'] for job in jobs if job.get('BOAT_DRAUGHT') is not None})
+        self.constraint_list.compile_draughts(draughts)
+
+        context = get_context()
+        with context.Pool(processes=nprocesses, maxtasksperchild=1, initializer=init_worker,
+                          initargs=(self.boat, self.wt, self.constraint_list)) as pool:
+            results = pool.map(execute_routing_task, zip(range(ntasks), routing_algs, jobs), chunksize=1)
+
+        routes = [route for route, power_cache_update in results]
+        power_cache = getattr(self.boat, 'power_cache', None)
+        if power_cache is not None:
+            for route, power_cache_update in results:
+                if power_cache_update is not None:
+                    power_cache.merge(power_cache_update)
+        return routes
+
+
+def init_worker(boat, wt, constraint_list):
+    shared_data['boat'] = boat
+    shared_data['wt'] = wt
+    shared_data['constraint_list'] = constraint_list
+
+
+##
+# Returns a separate path for intermediate files of every routing task, e.g. /path/courses_3.nc for /path/courses.nc
+def get_task_path(path, itask):
+    root, ext = os.path.splitext(path)
+    return root + '_' + str(itask) + ext
+
+
+##
+# Executes one routing task in a worker process. Returns the route (None if the task failed) and the entries that have
+# been inserted into the power cache of the boat by the task (None if there is no power cache).
+def execute_routing_task(task):
+    itask, routing_alg, job = task
+    boat = shared_data['boat']
+    constraint_list = shared_data['constraint_list']
+    power_cache = getattr(boat, 'power_cache', None)
+    power_cache_state = power_cache.get_state() if power_cache is not None else None
+
+    # modifications only affect the current worker process
+    if job.get('BOAT_SPEED') is not None:
+        boat.set_boat_speed(job['BOAT_SPEED'])
+    if job.get('BOAT_DRAUGHT') is not None:
+        constraint_list.set_draught(job['BOAT_DRAUGHT'])
+
+    # worker processes must not share the file which is used for the communication with mariPower
+    if hasattr(boat, 'courses_path'):
+        boat.set_courses_path(get_task_path(boat.courses_path, itask))
+
+    # a failing task must not abort the other tasks of the pool; it is returned as None and marked as failed in the
+    # ranking (see get_route_ranking)
+    try:
+        route = routing_alg.execute_routing(boat, shared_data['wt'], constraint_list)
+    except Exception:
+        logger.exception('Routing task ' + str(itask) + ' failed:')
+        route = None
+
+    power_cache_update = None
+    if power_cache is not None:
+        power_cache_update = power_cache.get_update(power_cache_state)
+    return route, power_cache_update
+
+
+##
+# Writes every route to routepath/<route_type>_<label>.json; failed routing tasks are skipped
+def write_routes(routes, labels, routepath):
+    for label, route in zip(labels, routes):
+        if route is not None:
+            route.return_route_to_API(routepath + '/' + str(route.route_type) + '_' + str(label) + '.json')
+
+
+##
+# Returns a table of the routes sorted by the amount of fuel that is consumed. Routes that do not arrive at the
+# destination and routing tasks that failed (route None, column 'failed') are ranked last.
+def get_route_ranking(routes, labels, label_name='departure_time'):
+    fuel = np.full(len(routes), np.nan)
+    travel_time = np.full(len(routes), np.nan)
+    arrived = np.full(len(routes), False)
+    failed = np.full(len(routes), False)
+
+    for iroute, route in enumerate(routes):
+        if route is None:
+            failed[iroute] = True
+            continue
+        fuel[iroute] = route.get_full_fuel()  # t
+        travel_time[iroute] = route.time  # h
+        arrived[iroute] = (route.lats_per_step[-1] == route.finish[0]) & (route.lons_per_step[-1] == route.finish[1])
+
+    ranking = pd.DataFrame({label_name: labels, 'fuel_consumed': fuel, 'travel_time': travel_time,
+                            'arrived': arrived, 'failed': failed, 'route': routes})
+    ranking = ranking.sort_values(by=['failed', 'arrived', 'fuel_consumed'], ascending=[True, False, True],
+                                  na_position='last')
+    ranking = ranking.reset_index(drop=True)
+    ranking.index.name = 'rank'
+    return ranking
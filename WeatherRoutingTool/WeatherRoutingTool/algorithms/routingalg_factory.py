@@ -7,13 +7,17 @@ from WeatherRoutingTool.algorithms.isofuel import IsoFuel
 class RoutingAlgFactory:
 
     @classmethod
-    def get_routing_alg(cls, config):
+    def get_routing_alg(cls, config, departure_time=None, route=None):
         ra = None
 
-        lat_start, lon_start, lat_end, lon_end = config.DEFAULT_ROUTE
+        if route is None:
+            route = config.DEFAULT_ROUTE
+        lat_start, lon_start, lat_end, lon_end = route
         start = (lat_start, lon_start)
         finish = (lat_end, lon_end)
-        departure_time = dt.datetime.strptime(config.DEPARTURE_TIME, '%Y-%m-%dT%H:%MZ')
+        if departure_time is None:
+            departure_time = config.DEPARTURE_TIME
+        departure_time = dt.datetime.strptime(departure_time, '%Y-%m-%dT%H:%MZ')
         delta_fuel = config.DELTA_FUEL
         fig_path = config.FIGURE_PATH
         routing_steps = config.ROUTING_STEPS
@@ -31,7 +35,38 @@ class RoutingAlgFactory:
                                     prune_gcr_centered=config.ISOCHRONE_PRUNE_GCR_CENTERED)
             ra.set_variant_segments(config.ROUTER_HDGS_SEGMENTS, config.ROUTER_HDGS_INCREMENTS_DEG)
             ra.set_minimisation_criterion(config.ISOCHRONE_MINIMISATION_CRITERION)
+            ra.set_multi_fidelity_depth(config.MULTI_FIDELITY_DEPTH)
 
         ra.print_init()
 
         return ra
+
+    ##
+    # returns one routing algorithm for every departure time of the departure-time sweep; figures are disabled for the
+    # sweep as the routing algorithms are executed in parallel processes
+    @classmethod
+    def get_departure_sweep(cls, config):
+        routing_algs = []
+        for departure_time in config.DEPARTURE_TIME_SWEEP:
+            ra = cls.get_routing_alg(config, departure_time=departure_time)
+            ra.figure_path = None
+            routing_algs.append(ra)
+        return routing_algs
+
+    ##
+    # returns one routing algorithm for every routing job; figures are disabled as the routing algorithms are executed
+    # in parallel processes
+    @classmethod
+    def get_routing_jobs(cls, config, jobs=None):
+        if jobs is None:
+            jobs = config.ROUTING_JOBS
+
+        routing_algs = []
+        for job in jobs:
+            if ('DEFAULT_ROUTE' not in job) or ('DEPARTURE_TIME' not in job):
+                raise ValueError('Every routing job needs to provide the route (DEFAULT_ROUTE) and the departure time '
+                                 '(DEPARTURE_TIME).')
+            ra = cls.get_routing_alg(config, departure_time=job['DEPARTURE_TIME'], route=job['DEFAULT_ROUTE'])
+            ra.figure_path = None
+            routing_algs.append(ra)
+        return routing_algs
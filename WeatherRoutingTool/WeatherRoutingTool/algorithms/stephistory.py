@@ -0,0 +1,163 @@
+import numpy as np
+
+
+class StepHistory:
+    '''
+        Storage for the values of a single routing quantity (e.g. the latitude) for all routing steps and all route
+        variants.
+
+        The history is stored as a tree: every routing step appends one row of nodes (one node per route variant) to
+        a node table. Next to its value, every node keeps the index of its parent node, i.e. the node of the previous
+        routing step from which the variant branched out. The node table is allocated up front via reserve() and
+        doubles its size if more nodes are needed. Branching (repeat) and pruning (select) of route variants only
+        modify the index array 'cols' that points to the nodes of the current variants. For pruning, the nodes of the
+        most recent row are additionally compacted to the surviving variants. Thus, memory scales with the number of
+        routing steps times the number of variants that survive the pruning.
+
+        The history of a variant is obtained by following the parent indices back to the first row.
+        get_per_step() returns the history of all current variants in the (M,N) layout of the *_per_step variables
+        of IsoBased, i.e. with the most recent step in the first row.
+
+        Every node can hold an array of shape 'value_shape' instead of a single value, e.g. all ship parameters of a
+        route variant. The per-step arrays then have the shape (M,N) + value_shape.
+    '''
+
+    values: np.ndarray  # value of every node, shape (number of allocated nodes,) + value_shape
+    parents: np.ndarray  # index of the parent node of every node, -1 for the first row
+    nnodes: int  # number of filled nodes
+    nrows: int  # number of routing steps
+    last_row_start: int  # index of the first node of the most recent row
+    cols: np.ndarray  # node index of every current variant
+
+    def __init__(self, first_row, dtype=float, nnodes=1, value_shape=()):
+        first_row = np.asarray(first_row).reshape((-1,) + tuple(value_shape))
+        nnodes = max(nnodes, first_row.shape[0])
+        self.values = np.empty((nnodes,) + tuple(value_shape), dtype=dtype)
+        self.parents = np.empty(nnodes, dtype=int)
+
+        self.values[:first_row.shape[0]] = first_row
+        self.parents[:first_row.shape[0]] = -1
+        self.nnodes = first_row.shape[0]
+        self.nrows = 1
+        self.last_row_start = 0
+        self.cols = np.arange(0, first_row.shape[0])
+
+    @property
+    def shape(self):
+        return (self.nrows,) + np.shape(self.cols)
+
+    @property
+    def value_shape(self):
+        return self.values.shape[1:]
+
+    ##
+    # allocate memory for at least nnodes nodes
+    def reserve(self, nnodes):
+        if nnodes > self.values.shape[0]:
+            self.resize(nnodes)
+
+    def resize(self, nnodes):
+        new_values = np.empty((nnodes,) + self.value_shape, dtype=self.values.dtype)
+        new_parents = np.empty(nnodes, dtype=int)
+        new_values[:self.nnodes] = self.values[:self.nnodes]
+        new_parents[:self.nnodes] = self.parents[:self.nnodes]
+        self.values = new_values
+        self.parents = new_parents
+
+    def add_nodes(self, start, values, parents):
+        end = start + values.shape[0]
+        if end > self.values.shape[0]:
+            self.resize(max(end, 2 * self.values.shape[0]))
+        self.values[start:end] = values
+        self.parents[start:end] = parents
+        self.nnodes = end
+        self.cols = np.arange(start, end)
+
+    def append(self, row):
+        row = np.asarray(row)
+        if row.ndim == len(self.value_shape):
+            row = row.reshape((1,) + self.value_shape)
+        cols = np.atleast_1d(self.cols)
+
+        if row.shape[0] != cols.shape[0]:
+            raise ValueError('StepHistory: number of variants not matching! Have ' + str(
+                cols.shape[0]) + ' variants but new row of length ' + str(row.shape[0]))
+
+        self.last_row_start = self.nnodes
+        self.add_nodes(self.nnodes, row, cols)
+        self.nrows += 1
+
+    ##
+    # branch out every variant into n variants
+    def repeat(self, n):
+        self.cols = np.repeat(self.cols, n)
+
+    ##
+    # keep only the variants with indices idxs; for a scalar index, get_per_step() returns a 1D array
+    def select(self, idxs):
+        self.cols = self.cols[idxs]
+        if np.ndim(self.cols) == 0:
+            return
+
+        # compact the most recent row; all current variants point to it
+        self.add_nodes(self.last_row_start, self.values[self.cols], self.parents[self.cols])
+
+    ##
+    # returns the state of the history; rows that are appended later can be discarded via restore_state() as long as
+    # no variants have been selected in the meantime
+    def get_state(self):
+        return self.nnodes, self.nrows, self.last_row_start, self.cols
+
+    def restore_state(self, state):
+        self.nnodes, self.nrows, self.last_row_start, self.cols = state
+
+    def expand_axis_for_intermediate(self):
+        self.cols = np.atleast_1d(self.cols)
+
+    ##
+    # values of all current variants 'steps_back' routing steps before the most recent one
+    def get_row(self, steps_back=0):
+        idxs = self.cols
+        for i in range(0, steps_back):
+            idxs = self.parents[idxs]
+        return self.values[idxs]
+
+    def get_current(self):
+        return self.values[self.cols]
+
+    ##
+    # (M,N) array with the most recent step in the first row
+    def get_per_step(self):
+        per_step = np.empty(self.shape + self.value_shape, dtype=self.values.dtype)
+        idxs = self.cols
+        for i in range(0, self.nrows):
+            per_step[i] = self.values[idxs]
+            idxs = self.parents[idxs]
+        return per_step
+
+    ##
+    # (M,N) array with the oldest step in the first row
+    def get_route(self):
+        return np.flip(self.get_per_step(), 0)
+
+    def set_per_step(self, per_step):
+        per_step = np.asarray(per_step)
+        is_1D = per_step.ndim == 1 + len(self.value_shape)
+        per_step = per_step.reshape((per_step.shape[0], -1) + self.value_shape)
+        nrows, ncols = per_step.shape[:2]
+
+        # every node of a row is the parent of the node in the same column of the next row
+        nodes = np.arange(0, nrows * ncols).reshape(nrows, ncols)
+        parents = nodes - ncols
+        parents[0] = -1
+
+        self.values = np.empty((max(self.values.shape[0], nrows * ncols),) + self.value_shape, dtype=self.values.dtype)
+        self.parents = np.empty(self.values.shape[0], dtype=int)
+        self.values[:nrows * ncols] = per_step[::-1].reshape((-1,) + self.value_shape)
+        self.parents[:nrows * ncols] = parents.ravel()
+        self.nnodes = nrows * ncols
+        self.nrows = nrows
+        self.last_row_start = (nrows - 1) * ncols
+        self.cols = nodes[-1]
+        if is_1D:
+            self.cols = self.cols[0]
@@ -17,8 +17,12 @@ RECOMMENDED_CONFIG_VARIABLES = {
 OPTIONAL_CONFIG_VARIABLES = {
     'ALGORITHM_TYPE': 'isofuel',
     'CONSTRAINTS_LIST': ['land_crossing_global_land_mask', 'water_depth'],
+    'CONSTRAINT_DATA_FILE': None,
+    'CONSTRAINT_RASTER_DIR': None,
+    'CONSTRAINT_RASTER_RESOLUTION': None,
     'DELTA_FUEL': 3000,
     'DELTA_TIME_FORECAST': 3,
+    'DEPARTURE_TIME_SWEEP': [],
     'FIGURE_PATH': None,
     'INTERMEDIATE_WAYPOINTS': [],
     'ISOCHRONE_MINIMISATION_CRITERION': 'squareddist_over_disttodest',
@@ -26,8 +30,18 @@ OPTIONAL_CONFIG_VARIABLES = {
     'ISOCHRONE_PRUNE_GCR_CENTERED': True,
     'ISOCHRONE_PRUNE_SECTOR_DEG_HALF': 91,
     'ISOCHRONE_PRUNE_SEGMENTS': 20,
+    'MARIPOWER_MODE': 'netCDF',
+    'MARIPOWER_PROCESSES': 1,
+    'MULTI_FIDELITY_DEPTH': 0,
+    'NUMBER_OF_PROCESSES': None,
+    'POWER_CACHE_FILE': None,
+    'POWER_CACHE_SIZE': 0,
+    'POWER_CACHE_TOLERANCES': {},
+    'POWER_TABLE_FILE': None,
+    'PROCESS_START_METHOD': None,
     'ROUTER_HDGS_INCREMENTS_DEG': 6,
     'ROUTER_HDGS_SEGMENTS': 30,
+    'ROUTING_JOBS': [],
     'ROUTING_STEPS': 60,
     'TIME_FORECAST': 90
 }
@@ -46,6 +60,10 @@ class Config:
         self.BOAT_SPEED = None  # in m/s
         self.CONSTRAINTS_LIST = None  # options: 'land_crossing_global_land_mask', 'land_crossing_polygons', 'seamarks',
         # 'water_depth', 'on_map', 'via_waypoints'
+        self.CONSTRAINT_DATA_FILE = None  # GeoPackage with seamarks and land polygons that replaces the database
+        self.CONSTRAINT_RASTER_DIR = None  # directory in which compiled constraint rasters are stored (optional)
+        self.CONSTRAINT_RASTER_RESOLUTION = None  # cell size of the raster of the static constraints (degrees,
+        # None: constraints are evaluated directly)
         self.COURSES_FILE = None  # path to file that acts as intermediate storage for courses per routing step
         self.DATA_MODE = None  # options: 'automatic', 'from_file', 'odc'
         self.DEFAULT_MAP = None  # bbox in which route optimization is performed (lat_min, lon_min, lat_max, lon_max)
@@ -53,6 +71,8 @@ class Config:
         self.DELTA_FUEL = None  # amount of fuel per routing step (kg)
         self.DELTA_TIME_FORECAST = None  # time resolution of weather forecast (hours)
         self.DEPARTURE_TIME = None  # start time of travelling, format: 'yyyy-mm-ddThh:mmZ'
+        self.DEPARTURE_TIME_SWEEP = None  # list of departure times for which the route is optimised in parallel,
+        # format: ['yyyy-mm-ddThh:mmZ', ...]
         self.DEPTH_DATA = None  # path to depth data
         self.FIGURE_PATH = None  # path to figure repository
         self.INTERMEDIATE_WAYPOINTS = None  # [[lat_one,lon_one], [lat_two,lon_two] ... ]
@@ -61,9 +81,25 @@ class Config:
         self.ISOCHRONE_PRUNE_GCR_CENTERED = None  # symmetry axis for pruning
         self.ISOCHRONE_PRUNE_SECTOR_DEG_HALF = None  # half of the angular range of azimuth angle considered for pruning
         self.ISOCHRONE_PRUNE_SEGMENTS = None  # total number of azimuth bins used for pruning in prune sector
+        self.MARIPOWER_MODE = None  # communication with mariPower, options: 'in_memory', 'netCDF', 'surrogate'
+        self.MARIPOWER_PROCESSES = None  # number of worker processes for the communication with mariPower
+        # (MARIPOWER_MODE='in_memory', 1: no worker processes)
+        self.MULTI_FIDELITY_DEPTH = None  # number of variants per pruning segment that are evaluated with mariPower
+        # after preselection with the power table (0: no preselection)
+        self.NUMBER_OF_PROCESSES = None  # maximum number of processes for parallel routing (default: number of CPUs)
+        self.POWER_CACHE_FILE = None  # file from which the power cache is read and to which it is written (optional)
+        self.POWER_CACHE_SIZE = None  # maximum number of entries of the power cache (0: no cache)
+        self.POWER_CACHE_TOLERANCES = None  # tolerances for the keys of the power cache, format: {'lat': 1e-5,
+        # 'lon': 1e-5, 'time': 1, 'course': 1e-3, 'speed': 1e-3} (degrees, s, m/s)
+        self.POWER_TABLE_FILE = None  # path to power table generated with mariPower (MARIPOWER_MODE='surrogate' or
+        # MULTI_FIDELITY_DEPTH > 0)
+        self.PROCESS_START_METHOD = None  # start method of worker processes, options: 'fork', 'forkserver', 'spawn',
+        # None (automatic)
         self.ROUTER_HDGS_INCREMENTS_DEG = None  # increment of headings
         self.ROUTER_HDGS_SEGMENTS = None  # total number of headings : put even number!!
         self.ROUTE_PATH = None  # path to json file to which the route will be written
+        self.ROUTING_JOBS = None  # list of routes that are optimised in parallel, format: [{'DEFAULT_ROUTE': [...],
+        # 'DEPARTURE_TIME': '...', 'BOAT_SPEED': ..., 'BOAT_DRAUGHT': ..., 'NAME': '...'}, ...]
         self.ROUTING_STEPS = None  # number of routing steps
         self.TIME_FORECAST = None  # forecast hours weather
         self.WEATHER_DATA = None  # path to weather data
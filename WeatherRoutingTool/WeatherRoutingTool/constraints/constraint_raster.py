@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+import WeatherRoutingTool.utils.formatting as form
+
+logger = logging.getLogger("WRT.Constraints")
+
+# maximum number of constraints that can be stored in the bit field of a ConstraintRaster
+MAX_RASTER_CONSTRAINTS = 8
+
+# offset (in units of the cell size) that is used to find the cells on both sides of a grid line
+GRID_LINE_OFFSET = 1e-9
+
+
+##
+# Raster of static negative constraints, i.e. constraints that do not change during the voyage (land, water depth,
+# map boundaries).
+#
+# The constraints are evaluated once at the centres of the cells of a regular latitude/longitude grid. The results are
+# stored as bit field: bit k of every cell is set if constraint k is violated. Checking whether a point is constrained
+# reduces to computing the index of the cell that contains the point. Points outside of the raster need to be checked
+# with the constraints directly (see ConstraintsList.safe_endpoint_raster).
+#
+# For every cell, the raster also stores the distance (in units of the cell size) between its centre and the centre of
+# the nearest cell in which any constraint is violated (hazard_distance). Segments that are shorter than this distance
+# cannot reach a constrained cell and are accepted without checking the cells that they touch.
+#
+# The raster can be written to and read from a directory; the file name contains a hash of the bounding box, the
+# resolution and the settings and data versions of all constraints (see Constraint.get_raster_settings).
+
+class ConstraintRaster:
+    lat1: float  # southern boundary
+    lon1: float  # western boundary
+    resolution: float  # cell size (degrees)
+    flags: np.ndarray  # bit field of violated constraints, shape (latitude, longitude)
+    names: list  # names of the constraints in the order of their bits
+    hazard_distance: np.ndarray  # distance to the nearest constrained cell (cell size), shape (latitude, longitude)
+
+    def __init__(self, lat1, lon1, resolution, flags, names, hazard_distance=None):
+        self.lat1 = lat1
+        self.lon1 = lon1
+        self.resolution = resolution
+        self.flags = flags
+        self.names = names
+        if hazard_distance is None:
+            hazard_distance = get_hazard_distance(flags)
+        self.hazard_distance = hazard_distance
+
+    ##
+    # evaluates the constraints at the cell centres of the grid that covers 'map_size' with cells of size
+    # 'resolution' (degrees)
+    @classmethod
+    def build(cls, constraints, map_size, resolution):
+        if len(constraints) > MAX_RASTER_CONSTRAINTS:
+            raise ValueError('At most ' + str(MAX_RASTER_CONSTRAINTS) + ' constraints can be rasterised, got ' + str(
+                len(constraints)) + '!')
+
+        nlats = int(np.ceil((map_size.lat2 - map_size.lat1) / resolution))
+        nlons = int(np.ceil((map_size.lon2 - map_size.lon1) / resolution))
+        lats = map_size.lat1 + (np.arange(nlats) + 0.5) * resolution
+        lons = map_size.lon1 + (np.arange(nlons) + 0.5) * resolution
+        logger.info(form.get_log_step('Rasterising ' + str(len(constraints)) + ' static constraints on ' + str(
+            nlats) + 'x' + str(nlons) + ' cells', 1))
+
+        flags = np.zeros((nlats, nlons), dtype=np.uint8)
+        for iconst, constr in enumerate(constraints):
+            is_constrained = np.asarray(constr.rasterise(lats, lons), dtype=bool)
+            flags |= is_constrained.astype(np.uint8) << iconst
+
+        return cls(map_size.lat1, map_size.lon1, resolution, flags, [constr.name for constr in constraints])
+
+    @classmethod
+    def from_file(cls, path):
+        with np.load(path) as data:
+            return cls(float(data['lat1']), float(data['lon1']), float(data['resolution']), data['flags'],
+                       list(data['names']), data['hazard_distance'])
+
+    def write(self, path):
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, lat1=self.lat1, lon1=self.lon1, resolution=self.resolution, flags=self.flags,
+                                names=np.array(self.names), hazard_distance=self.hazard_distance)
+
+    ##
+    # Returns the bit field of violated constraints for every point and a boolean array which marks the points that
+    # are located within the raster. The bit field of points outside of the raster is 0.
+    def lookup(self, lat, lon):
+        ilat = np.floor((np.asarray(lat) - self.lat1) / self.resolution).astype(int)
+        ilon = np.floor((np.asarray(lon) - self.lon1) / self.resolution).astype(int)
+        inside = (ilat >= 0) & (ilat < self.flags.shape[0]) & (ilon >= 0) & (ilon < self.flags.shape[1])
+        flags = np.where(inside, self.flags[np.where(inside, ilat, 0), np.where(inside, ilon, 0)], 0)
+        return flags.astype(np.uint8), inside
+
+    ##
+    # Returns a boolean array that marks the segments from (lat_start, lon_start) to (lat_end, lon_end) which cannot
+    # touch any constrained cell: all points of a segment are closer to the centre of the cell of its start (end) point
+    # than the length of the segment plus half a cell diagonal, and any point in a constrained cell is closer to the
+    # centre of that cell than half a cell diagonal. Segments that are not located within the raster are not marked.
+    def is_far_from_hazards(self, lat_start, lon_start, lat_end, lon_end):
+        distance_start = self.get_hazard_distance(lat_start, lon_start)
+        distance_end = self.get_hazard_distance(lat_end, lon_end)
+        length = np.hypot(np.asarray(lat_end) - lat_start, np.asarray(lon_end) - lon_start) / self.resolution
+        return np.maximum(distance_start, distance_end) > length + np.sqrt(2)
+
+    ##
+    # returns the hazard distance of the cells that contain the points (NaN for points outside of the raster)
+    def get_hazard_distance(self, lat, lon):
+        ilat = np.floor((np.asarray(lat) - self.lat1) / self.resolution).astype(int)
+        ilon = np.floor((np.asarray(lon) - self.lon1) / self.resolution).astype(int)
+        inside = (ilat >= 0) & (ilat < self.flags.shape[0]) & (ilon >= 0) & (ilon < self.flags.shape[1])
+        return np.where(inside, self.hazard_distance[np.where(inside, ilat, 0), np.where(inside, ilon, 0)], np.nan)
+
+    ##
+    # Returns the bit field of the constraints that are violated in any cell touched by the straight lines (in
+    # latitude and longitude) from (lat_start, lon_start) to (lat_end, lon_end) and a boolean array which marks the
+    # segments that are located within the raster. The bit field of segments outside of the raster is 0.
+    #
+    # The cells are found by supercover traversal: every segment is split at the points at which it crosses the grid
+    # lines and the cells on both sides of every crossing are checked (all four cells if the segment passes through a
+    # grid corner). The number of checked cells scales with the length of the segment in units of the cell size.
+    def crossing_flags(self, lat_start, lon_start, lat_end, lon_end):
+        u0 = (np.asarray(lat_start, dtype=float) - self.lat1) / self.resolution
+        v0 = (np.asarray(lon_start, dtype=float) - self.lon1) / self.resolution
+        u1 = (np.asarray(lat_end, dtype=float) - self.lat1) / self.resolution
+        v1 = (np.asarray(lon_end, dtype=float) - self.lon1) / self.resolution
+        nlats, nlons = self.flags.shape
+        inside = ((u0 >= 0) & (u0 < nlats) & (v0 >= 0) & (v0 < nlons) & (u1 >= 0) & (u1 < nlats) & (v1 >= 0) &
+                  (v1 < nlons))
+
+        u_lines, t_u = get_grid_crossings(u0, u1)
+        v_lines, t_v = get_grid_crossings(v0, v1)
+        start = np.zeros((u0.shape[0], 1))
+        end = np.ones((u0.shape[0], 1))
+        t = np.concatenate([start, end, t_u, t_v], axis=1)
+        u = u0[:, np.newaxis] + t * (u1 - u0)[:, np.newaxis]
+        v = v0[:, np.newaxis] + t * (v1 - v0)[:, np.newaxis]
+
+        # use the exact coordinates of the grid lines at the crossings
+        u[:, 2:2 + u_lines.shape[1]] = u_lines
+        v[:, 2 + u_lines.shape[1]:] = v_lines
+
+        flags = np.zeros(u0.shape[0], dtype=np.uint8)
+        for du in (-GRID_LINE_OFFSET, GRID_LINE_OFFSET):
+            ilat = np.clip(np.floor(u + du).astype(int), 0, nlats - 1)
+            for dv in (-GRID_LINE_OFFSET, GRID_LINE_OFFSET):
+                ilon = np.clip(np.floor(v + dv).astype(int), 0, nlons - 1)
+                flags |= np.bitwise_or.reduce(self.flags[ilat, ilon], axis=1)
+        flags[~inside] = 0
+        return flags, inside
+
+
+##
+# Returns the Euclidean distance (in units of the cell size) between the centre of every cell and the centre of the
+# nearest cell with non-zero 'flags' (infinite if there is no such cell)
+def get_hazard_distance(flags):
+    if not np.any(flags):
+        return np.full(flags.shape, np.inf, dtype=np.float32)
+    return distance_transform_edt(flags == 0).astype(np.float32)
+
+
+##
+# Returns the grid lines (integers) that are crossed by the segments from x0 to x1 (grid units) and the fractions of
+# the segments at which they are crossed, both as arrays of shape (segments, maximum number of crossings). Entries
+# that exceed the number of crossings of a segment are set to its start point.
+def get_grid_crossings(x0, x1):
+    first = np.ceil(np.minimum(x0, x1))
+    ncrossings = (np.floor(np.maximum(x0, x1)) - first + 1).astype(int)
+    ncrossings = np.where(x0 == x1, 0, np.maximum(ncrossings, 0))
+    max_crossings = int(ncrossings.max()) if ncrossings.size > 0 else 0
+
+    lines = first[:, np.newaxis] + np.arange(max_crossings)
+    valid = np.arange(max_crossings) < ncrossings[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (lines - x0[:, np.newaxis]) / (x1 - x0)[:, np.newaxis]
+    t = np.where(valid, t, 0.)
+    lines = np.where(valid, lines, x0[:, np.newaxis])
+    return lines, t
+
+
+##
+# returns the path of the file in 'directory' that stores the raster of 'constraints' for the bounding box 'map_size'
+def get_constraint_raster_path(directory, constraints, map_size, resolution):
+    sha = hashlib.sha256()
+    sha.update(repr((map_size.lat1, map_size.lon1, map_size.lat2, map_size.lon2, resolution)).encode())
+    for constr in constraints:
+        sha.update(repr(sorted(constr.get_raster_settings().items())).encode())
+    return os.path.join(directory, 'constraint_raster_' + sha.hexdigest()[:16] + '.npz')
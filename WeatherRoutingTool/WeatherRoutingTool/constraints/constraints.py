@@ -8,19 +8,25 @@ import numpy as np
 import xarray as xr
 from global_land_mask import globe
 import ast
+from importlib.metadata import version
 
 from maridatadownloader import DownloaderFactory
 import WeatherRoutingTool.utils.graphics as graphics
 import WeatherRoutingTool.utils.formatting as form
+from WeatherRoutingTool.constraints.constraint_raster import ConstraintRaster, get_constraint_raster_path
+from WeatherRoutingTool.constraints.depth_pyramid import DepthPyramid, DEPTH_PYRAMID_PLOT_LEVEL
 from WeatherRoutingTool.routeparams import RouteParams
 from WeatherRoutingTool.utils.maps import Map
 from WeatherRoutingTool.weather import WeatherCond
 
 # used as a part of the continuouscheck class ##
 import os
+import re
+from time import perf_counter
 import sqlalchemy as db
 import pandas as pd
 import geopandas as gpd
+import shapely
 from shapely.geometry import Point, LineString, box
 from shapely.strtree import STRtree
 
@@ -29,6 +35,15 @@ parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 logger = logging.getLogger("WRT.Constraints")
 
+# key-value pair of the hstore format, e.g. '"seamark:type"=>"separation_zone"' (values can be NULL)
+HSTORE_PAIR = re.compile(r'"((?:[^"\\]|\\.)*)"\s*=>\s*(NULL|"(?:[^"\\]|\\.)*")')
+
+# number of rows that are fetched per batch from the PostGIS database
+POSTGIS_BATCH_SIZE = 10000
+
+# pooled database engines per process and database URL (see ContinuousCheck.connect_database)
+database_engines = {}
+
 
 #
 # Constraint: Main class for handling of constraints
@@ -117,9 +132,28 @@ class PositiveConstraintPoint(PositiveConstraint):
 
 
 class NegativeContraint(Constraint):
+    is_static: bool  # True if the constraint does not change during the voyage and can be rasterised
+    is_pointwise: bool  # True if the result for a point (segment) only depends on this point (segment)
+
     def __init__(self, name):
         Constraint.__init__(self, name)
         self.message = "At least one point discarded as "
+        self.is_static = False
+        self.is_pointwise = False
+
+    ##
+    # Returns the boolean array of shape (len(lats), len(lons)) that marks the grid points on which the constraint
+    # is violated. Only used for static constraints (see ConstraintsList.compile).
+    def rasterise(self, lats, lons):
+        lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+        is_constrained = self.constraint_on_point(lat_grid.ravel(), lon_grid.ravel(), None)
+        return np.asarray(is_constrained, dtype=bool).reshape(lat_grid.shape)
+
+    ##
+    # Returns the settings and data versions that determine the result of rasterise(); used to identify rasters that
+    # have been written to disk
+    def get_raster_settings(self):
+        return {'name': self.name}
 
 
 class NegativeConstraintFromWeather(NegativeContraint):
@@ -164,11 +198,11 @@ class ConstraintsListFactory:
 
         if 'land_crossing_polygons' in constraints_string_list:
             map_size = kwargs.get('map_size')
-            land_crossing_polygons = LandPolygonsCrossing(map_size)
-            constraints_list.add_neg_constraint(land_crossing_polygons)
+            land_crossing_polygons = LandPolygonsCrossing(map_size, kwargs.get('constraint_data_file'))
+            constraints_list.add_neg_constraint(land_crossing_polygons, 'continuous')
 
         if 'seamarks' in constraints_string_list:
-            seamarks = SeamarkCrossing()
+            seamarks = SeamarkCrossing(kwargs.get('map_size'), kwargs.get('constraint_data_file'))
             constraints_list.add_neg_constraint(seamarks, 'continuous')
 
         if 'water_depth' in constraints_string_list:
@@ -219,6 +253,15 @@ class ConstraintsList:
     constraints_crossed: list
     weather: WeatherCond
 
+    raster: ConstraintRaster  # raster of the static negative constraints (None if not compiled)
+    raster_constraints: list  # constraints that are evaluated via the raster in the order of its bits
+    raster_settings: dict  # arguments of the last call of compile()
+    rasters: dict  # draught -> compiled raster for the settings of the last call of compile() (see set_draught)
+
+    # per negative constraint: evaluation time (s), number of evaluated points (segments) and number of constrained
+    # points (segments), collected at runtime to order the constraints (see get_constraint_rank)
+    constraint_stats: dict
+
     def __init__(self, pars):
         self.pars = pars
         self.positive_constraints = []
@@ -228,6 +271,11 @@ class ConstraintsList:
         self.neg_dis_size = 0
         self.neg_cont_size = 0
         self.pos_size = 0
+        self.raster = None
+        self.raster_constraints = []
+        self.raster_settings = {}
+        self.rasters = {}
+        self.constraint_stats = {}
 
     def print_constraints_crossed(self):
         print("Discarding point as:")
@@ -248,6 +296,78 @@ class ConstraintsList:
         for Const in self.positive_constraints:
             Const.print_info()
 
+    ##
+    # update the minimum water depth of all constraints that depend on the draught of the boat; a compiled raster is
+    # compiled again for a new draught and is reused if the draught has been compiled before
+    def set_draught(self, draught):
+        for constr in self.negative_constraints_discrete + self.negative_constraints_continuous:
+            if isinstance(constr, WaterDepth):
+                constr.set_draught(draught)
+        if self.raster is not None:
+            raster = self.rasters.get(self.get_draught())
+            if raster is None:
+                self.compile(**self.raster_settings)
+            else:
+                self.raster = raster
+
+    ##
+    # draught for which the water depth is checked (None if there is no WaterDepth constraint)
+    def get_draught(self):
+        for constr in self.negative_constraints_discrete + self.negative_constraints_continuous:
+            if isinstance(constr, WaterDepth):
+                return constr.min_depth
+        return None
+
+    ##
+    # compiles the raster for every draught in 'draughts' (if the ConstraintsList is compiled) such that later calls
+    # of set_draught() for these draughts, e.g. in worker processes of the RoutingPool, only select the raster
+    def compile_draughts(self, draughts):
+        if self.raster is None:
+            return
+        draught = self.get_draught()
+        for other_draught in draughts:
+            self.set_draught(other_draught)
+        self.set_draught(draught)
+
+    ##
+    # Rasterises all static discrete negative constraints (land, water depth, map boundaries) on a grid over
+    # 'map_size' with cells of size 'resolution' (degrees). Afterwards, safe_endpoint() and safe_crossing_discrete()
+    # check these constraints by looking up the cells that contain the points instead of evaluating the constraints.
+    # Every point is assigned the result at the centre of its cell.
+    #
+    # If 'cache_dir' is provided, the raster is read from this directory if it has been compiled before for the same
+    # map, resolution, draught and data, and it is written to the directory otherwise.
+    def compile(self, map_size, draught=None, resolution=1. / 120, cache_dir=None):
+        raster_settings = {'map_size': map_size, 'resolution': resolution, 'cache_dir': cache_dir}
+        if raster_settings != self.raster_settings:
+            self.rasters = {}
+        self.raster = None
+        if draught is not None:
+            self.set_draught(draught)
+
+        constraints = [constr for constr in self.negative_constraints_discrete if constr.is_static]
+        if not constraints:
+            logger.info(form.get_log_step('No static constraints to be rasterised', 0))
+            return
+
+        path = None
+        raster = None
+        if cache_dir is not None:
+            path = get_constraint_raster_path(cache_dir, constraints, map_size, resolution)
+            if os.path.exists(path):
+                logger.info(form.get_log_step('Reading constraint raster from ' + path, 0))
+                raster = ConstraintRaster.from_file(path)
+        if raster is None:
+            raster = ConstraintRaster.build(constraints, map_size, resolution)
+            if path is not None:
+                logger.info(form.get_log_step('Writing constraint raster to ' + path, 0))
+                raster.write(path)
+
+        self.raster = raster
+        self.raster_constraints = constraints
+        self.raster_settings = raster_settings
+        self.rasters[self.get_draught()] = raster
+
     def have_positive(self):
         if self.pos_size > 0:
             return True
@@ -307,50 +427,154 @@ class ConstraintsList:
 
     ##
     # Check whether there is a constraint on the space-time point defined by lat, lon, time. To do so, the code loops
-    # over all Constraints added to the ConstraintList
+    # over all Constraints added to the ConstraintList (see check_constraints)
     def safe_endpoint(self, lat, lon, current_time, is_constrained):
         debug = False
 
-        for iConst in range(0, self.neg_dis_size):
-            is_constrained_temp = self.negative_constraints_discrete[iConst].constraint_on_point(lat, lon, current_time)
+        if self.raster is not None:
+            return self.safe_endpoint_raster(lat, lon, current_time, is_constrained)
+
+        is_constrained = self.check_endpoints(self.negative_constraints_discrete, lat, lon, current_time,
+                                              is_constrained)
+        if debug:
+            print("is_constrained: ", is_constrained)
+        # if (is_constrained.any()) & (debug): self.print_constraints_crossed()
+        return is_constrained
+
+    ##
+    # Evaluates the negative 'constraints' in the order of get_constraint_rank(). Pointwise constraints are evaluated
+    # only for the points (segments) that are not constrained yet, all other constraints for all points. The
+    # evaluation stops as soon as all points are constrained. The result is the same as if all constraints were
+    # evaluated for all points.
+    #
+    # 'evaluate(constr, mask)' returns the results of 'constr' for the points selected by the boolean array 'mask'
+    # (of the shape of 'is_constrained').
+    def check_constraints(self, constraints, is_constrained, evaluate):
+        is_constrained = np.array(is_constrained, dtype=bool)
+        for constr in sorted(constraints, key=self.get_constraint_rank):
+            unconstrained = ~is_constrained
+            if not unconstrained.any():
+                break
+            mask = unconstrained if constr.is_pointwise else np.full(is_constrained.shape, True)
+
+            start_time = perf_counter()
+            is_constrained_temp = np.asarray(evaluate(constr, mask), dtype=bool)
+            self.update_constraint_stats(constr, perf_counter() - start_time, np.count_nonzero(mask),
+                                         np.count_nonzero(is_constrained_temp))
+
             if is_constrained_temp.any():
-                self.constraints_crossed.append(self.negative_constraints_discrete[iConst].message)
-            if debug:
-                print("is_constrained_temp: ", is_constrained_temp)
-                print("is_constrained: ", is_constrained)  # form.print_current_time('constraint execution', start_time)
+                self.constraints_crossed.append(constr.message)
+            is_constrained[mask] |= is_constrained_temp
+        return is_constrained
+
+    ##
+    # Returns the measured evaluation time of 'constr' per constrained point, i.e. the time per point divided by the
+    # fraction of points that it constrains. Constraints with a low rank (cheap and selective) are evaluated first.
+    # Constraints without statistics are evaluated before all others (in the order in which they have been added)
+    # and constraints that have not constrained any point yet after all others.
+    def get_constraint_rank(self, constr):
+        if constr not in self.constraint_stats:
+            return 0.
+        duration, npoints, nconstrained = self.constraint_stats[constr]
+        if nconstrained == 0:
+            return np.inf
+        return duration / nconstrained
+
+    def update_constraint_stats(self, constr, duration, npoints, nconstrained):
+        stats = self.constraint_stats.get(constr, (0., 0, 0))
+        self.constraint_stats[constr] = (stats[0] + duration, stats[1] + npoints, stats[2] + nconstrained)
+
+    ##
+    # checks the discrete 'constraints' for the points 'lat', 'lon' (see check_constraints)
+    def check_endpoints(self, constraints, lat, lon, current_time, is_constrained):
+        lat = np.asarray(lat)
+        lon = np.asarray(lon)
+        is_constrained = np.broadcast_to(np.asarray(is_constrained, dtype=bool), lat.shape)
+
+        def evaluate(constr, mask):
+            if mask.all():
+                is_constrained_temp = constr.constraint_on_point(lat, lon, current_time)
+                return np.broadcast_to(is_constrained_temp, lat.shape)[mask]
+            return constr.constraint_on_point(lat[mask], lon[mask], select_points(current_time, mask))
+
+        return self.check_constraints(constraints, is_constrained, evaluate)
+
+    ##
+    # Checks the discrete 'constraints' for routing segments at the steps 'lat_steps', 'lon_steps' (shape (steps,
+    # segments)). A routing segment is constrained if any of its steps is constrained; the steps of constrained
+    # segments are not checked by the remaining pointwise constraints (see check_constraints).
+    def check_segment_steps(self, constraints, lat_steps, lon_steps, current_time, is_constrained):
+        is_constrained = np.broadcast_to(np.asarray(is_constrained, dtype=bool), lat_steps.shape[1:])
+
+        def evaluate(constr, mask):
+            if mask.all():
+                is_constrained_temp = constr.constraint_on_point(lat_steps, lon_steps, current_time)
+            else:
+                is_constrained_temp = constr.constraint_on_point(lat_steps[:, mask], lon_steps[:, mask],
+                                                                 select_points(current_time, mask))
+            return np.any(np.broadcast_to(is_constrained_temp, lat_steps[:, mask].shape), axis=0)
+
+        return self.check_constraints(constraints, is_constrained, evaluate)
+
+    ##
+    # Same as safe_endpoint() for a compiled ConstraintsList: the static constraints are looked up in the raster,
+    # only points outside of the raster and constraints that have not been compiled are evaluated directly
+    def safe_endpoint_raster(self, lat, lon, current_time, is_constrained):
+        lat = np.asarray(lat)
+        lon = np.asarray(lon)
+        is_constrained += self.safe_endpoint_compiled(lat, lon, current_time)
+        return self.check_endpoints(self.get_uncompiled_constraints(), lat, lon, current_time, is_constrained)
 
+    ##
+    # checks the compiled constraints for the points 'lat', 'lon': points within the raster are looked up, points
+    # outside of the raster are evaluated directly
+    def safe_endpoint_compiled(self, lat, lon, current_time):
+        flags, inside = self.raster.lookup(lat, lon)
+        outside = ~inside
+
+        is_constrained = np.full(lat.shape, False)
+        for ibit, constr in enumerate(self.raster_constraints):
+            is_constrained_temp = (flags & (1 << ibit)) > 0
+            if outside.any():
+                is_constrained_temp[outside] = constr.constraint_on_point(lat[outside], lon[outside], current_time)
+            if is_constrained_temp.any():
+                self.constraints_crossed.append(constr.message)
             is_constrained += is_constrained_temp
-        # if (is_constrained.any()) & (debug): self.print_constraints_crossed()
         return is_constrained
 
+    def get_uncompiled_constraints(self):
+        return [constr for constr in self.negative_constraints_discrete if constr not in self.raster_constraints]
+
+    ##
+    # Check whether there is a constraint on the way from (lat_start, lon_start) to (lat_end, lon_end). The continuous
+    # constraints are only checked for the routing segments that do not violate any discrete constraint.
     def safe_crossing(self, lat_start, lon_start, lat_end, lon_end, current_time, is_constrained):
-        is_constrained_discrete = is_constrained
-        is_constrained_continuous = is_constrained
-        is_constrained_discrete = self.safe_crossing_discrete(lat_start, lon_start, lat_end, lon_end, current_time,
-                                                              is_constrained)
-        is_constrained_continuous = self.safe_crossing_continuous(lat_start, lon_start, lat_end, lon_end, current_time)
-
-        # TO NBE UPDATED
-        is_constrained = is_constrained + is_constrained_discrete + is_constrained_continuous
-        # is_constrained.append(is_constrained_discrete)
-        # is_constrained.append(is_constrained_continuous)
+        is_constrained = self.safe_crossing_discrete(lat_start, lon_start, lat_end, lon_end, current_time,
+                                                     is_constrained)
+        is_constrained = self.safe_crossing_continuous(lat_start, lon_start, lat_end, lon_end, current_time,
+                                                       is_constrained)
         return is_constrained
 
-    def safe_crossing_continuous(self, lat_start, lon_start, lat_end, lon_end, current_time):
+    def safe_crossing_continuous(self, lat_start, lon_start, lat_end, lon_end, current_time, is_constrained=None):
         debug = False
-        is_constrained = [False for i in range(0, len(lat_start))]
-        is_constrained = np.array(is_constrained)
+        lat_start = np.asarray(lat_start)
+        lon_start = np.asarray(lon_start)
+        lat_end = np.asarray(lat_end)
+        lon_end = np.asarray(lon_end)
+        if is_constrained is None:
+            is_constrained = np.full(lat_start.shape, False)
 
         if debug:
             print('Entering continuous checks')
             print('Length of latitudes: ' + str(len(lat_start)))
 
-        for constr in self.negative_constraints_continuous:
-            is_constrained_temp = constr.check_crossing(lat_start, lon_start, lat_end, lon_end, current_time)
-            print('is_constrained_temp: ', is_constrained_temp)
-            print('is_constrained: ', is_constrained)
-            is_constrained += is_constrained_temp
-            print('is_constrained end of loop: ', is_constrained)
+        def evaluate(constr, mask):
+            if mask.all():
+                return constr.check_crossing(lat_start, lon_start, lat_end, lon_end, time=current_time)
+            return constr.check_crossing(lat_start[mask], lon_start[mask], lat_end[mask], lon_end[mask],
+                                         time=select_points(current_time, mask))
+
+        is_constrained = self.check_constraints(self.negative_constraints_continuous, is_constrained, evaluate)
         if debug:
             print('is_constrained_final: ', is_constrained)
         return is_constrained
@@ -358,29 +582,37 @@ class ConstraintsList:
     ##
     # Check whether there is a constraint on the way from a starting point (lat_start, lon_start) to the destination
     # (lat_end, lon_end).
-    # To do so, the code segments the travel distance into steps (step length given by ConstraintPars.resolution) and
-    # loops through all these steps
-    # calling ConstraintList.safe_endpoint()
+    # To do so, the code segments the travel distance into steps (step length given by ConstraintPars.resolution).
+    # The points of all steps of all routing segments are passed to ConstraintList.safe_endpoint() in one array of
+    # shape (steps, segments) s.t. every constraint is evaluated only once. A routing segment is constrained if any of
+    # its steps is constrained.
     def safe_crossing_discrete(self, lat_start, lon_start, lat_end, lon_end, current_time, is_constrained):
         debug = False
 
+        lat_start = np.asarray(lat_start)
+        lon_start = np.asarray(lon_start)
         delta_lats = (lat_end - lat_start) * self.pars.resolution
         delta_lons = (lon_end - lon_start) * self.pars.resolution
-        x0 = lat_start
-        y0 = lon_start
 
         # if (debug):
         # form.print_step('Constraints: Moving from (' + str(lat_start) + ',' + str(lon_start) + ') to (' + str(
         #        lat_end) + ',' + str(lon_end), 0)
 
+        # the steps are accumulated like lat_start + delta_lats + delta_lats + ... to obtain exactly the same points
+        # as with successive steps
         nSteps = int(1.0 / self.pars.resolution)
-        for iStep in range(0, nSteps):
-            x = x0 + delta_lats
-            y = y0 + delta_lons
-
-            is_constrained = self.safe_endpoint(x, y, current_time, is_constrained)
-            x0 = x
-            y0 = y
+        x = np.cumsum(np.concatenate([lat_start[np.newaxis], np.broadcast_to(delta_lats, (nSteps,) + lat_start.shape)]),
+                      axis=0)[1:]
+        y = np.cumsum(np.concatenate([lon_start[np.newaxis], np.broadcast_to(delta_lons, (nSteps,) + lon_start.shape)]),
+                      axis=0)[1:]
+
+        if self.raster is None:
+            is_constrained = self.check_segment_steps(self.negative_constraints_discrete, x, y, current_time,
+                                                      is_constrained)
+        else:
+            is_constrained += self.safe_crossing_raster(lat_start, lon_start, lat_end, lon_end, x, y, current_time)
+        x = x[-1]
+        y = y[-1]
 
         if debug:
             lat_start_constrained = lat_start[is_constrained == 1]
@@ -406,6 +638,40 @@ class ConstraintsList:
 
         return is_constrained
 
+    ##
+    # Same as safe_crossing_discrete() for a compiled ConstraintsList: routing segments that are far away from any
+    # constrained cell (ConstraintRaster.is_far_from_hazards()) are accepted immediately. For all other routing
+    # segments within the raster, the compiled constraints are checked for every cell that is touched by the segment
+    # (ConstraintRaster.crossing_flags()). Segments that leave the raster and constraints that have not been compiled
+    # are checked at the steps 'lat_steps', 'lon_steps' (shape (steps, segments)).
+    def safe_crossing_raster(self, lat_start, lon_start, lat_end, lon_end, lat_steps, lon_steps, current_time):
+        lat_end = np.asarray(lat_end)
+        lon_end = np.asarray(lon_end)
+        is_safe = self.raster.is_far_from_hazards(lat_start, lon_start, lat_end, lon_end)
+        check = ~is_safe
+
+        flags = np.zeros(lat_start.shape, dtype=np.uint8)
+        inside = np.full(lat_start.shape, True)
+        flags[check], inside[check] = self.raster.crossing_flags(lat_start[check], lon_start[check], lat_end[check],
+                                                                 lon_end[check])
+
+        is_constrained = np.full(inside.shape, False)
+        for ibit, constr in enumerate(self.raster_constraints):
+            is_constrained_temp = (flags & (1 << ibit)) > 0
+            if is_constrained_temp.any():
+                self.constraints_crossed.append(constr.message)
+            is_constrained += is_constrained_temp
+
+        outside = ~inside
+        if outside.any():
+            time_outside = np.asarray(current_time)[outside] if np.ndim(current_time) > 0 else current_time
+            is_constrained_steps = self.safe_endpoint_compiled(lat_steps[:, outside], lon_steps[:, outside],
+                                                               time_outside)
+            is_constrained[outside] = np.any(is_constrained_steps, axis=0)
+
+        return self.check_segment_steps(self.get_uncompiled_constraints(), lat_steps, lon_steps, current_time,
+                                        is_constrained)
+
     def add_pos_constraint(self, constraint):
         self.positive_constraints.append(constraint)
         self.pos_size += 1
@@ -433,6 +699,8 @@ class LandCrossing(NegativeContraint):
     def __init__(self):
         NegativeContraint.__init__(self, "LandCrossing")
         self.message += "crossing land!"  # self.resource_type = 0
+        self.is_static = True
+        self.is_pointwise = True
 
     def constraint_on_point(self, lat, lon, time):
         # self.print_debug('checking point: ' + str(lat) + ',' + str(lon))
@@ -441,6 +709,9 @@ class LandCrossing(NegativeContraint):
     def print_info(self):
         logger.info(form.get_log_step("no land crossing", 1))
 
+    def get_raster_settings(self):
+        return {'name': self.name, 'global_land_mask': version('global-land-mask')}
+
 
 class WaveHeight(NegativeConstraintFromWeather):
     current_wave_height: np.ndarray
@@ -466,15 +737,25 @@ class WaveHeight(NegativeConstraintFromWeather):
 class WaterDepth(NegativeContraint):
     map_size: Map
     depth_data: xr  # the xarray.Dataset is expected to have a variable called "depth"
+    depth_path: str
+    depth_grid: np.ndarray  # depth within the map (float32), shape (latitude, longitude)
+    depth_lats: np.ndarray  # latitudes of depth_grid (ascending)
+    depth_lons: np.ndarray  # longitudes of depth_grid (ascending)
+    depth_lat_step: float  # spacing of depth_lats (None if irregular)
+    depth_lon_step: float  # spacing of depth_lons (None if irregular)
+    depth_pyramid: DepthPyramid  # coarse levels of depth_grid for the constraint checks and plotting
     current_depth: np.ndarray
     min_depth: float
 
     def __init__(self, data_mode, draught, map_size, depth_path=''):
         NegativeContraint.__init__(self, 'WaterDepth')
         self.message += 'water not deep enough!'
+        self.is_static = True
+        self.is_pointwise = True
         self.current_depth = np.array([-99])
         self.min_depth = draught
         self.map_size = map_size
+        self.depth_path = depth_path
 
         self.depth_data = None
 
@@ -487,6 +768,8 @@ class WaterDepth(NegativeContraint):
         else:
             raise ValueError('Option "' + data_mode + '" not implemented for download of depth data!')
 
+        self.load_depth_grid()
+
     def load_data_ODC(self, depth_path, product_name, measurements=None):
         logger.info(form.get_log_step('Obtaining depth data from ODC', 0))
 
@@ -533,29 +816,96 @@ class WaterDepth(NegativeContraint):
         return depth_data_chunked
 
     def load_data_from_file(self, depth_path):
-        # FIXME: if this loads the whole file into memory, apply subsetting already here
         logger.info(form.get_log_step('Downloading data from file: ' + depth_path, 0))
-        ds_depth = xr.open_dataset(depth_path, chunks={"time": "500MB"}, decode_times=False)
+        ds_depth = xr.open_dataset(depth_path, decode_times=False)
         return ds_depth
 
+    ##
+    # Reads the depth data within the map (plus a margin of one grid cell) into a contiguous float32 array that is
+    # sampled by get_depth_bilinear()
+    def load_depth_grid(self):
+        depth = self.depth_data["depth"]
+        lats = depth["latitude"].to_numpy().astype(float)
+        lons = depth["longitude"].to_numpy().astype(float)
+        lat_margin = np.max(np.abs(np.diff(lats))) if lats.size > 1 else 0
+        lon_margin = np.max(np.abs(np.diff(lons))) if lons.size > 1 else 0
+        ilats = np.flatnonzero((lats >= self.map_size.lat1 - lat_margin) & (lats <= self.map_size.lat2 + lat_margin))
+        ilons = np.flatnonzero((lons >= self.map_size.lon1 - lon_margin) & (lons <= self.map_size.lon2 + lon_margin))
+        if ilats.size < 2 or ilons.size < 2:
+            raise ValueError('The depth data does not cover the map ' + str((self.map_size.lat1, self.map_size.lon1,
+                                                                             self.map_size.lat2, self.map_size.lon2)))
+
+        grid = depth.isel(latitude=ilats, longitude=ilons).transpose("latitude", "longitude").to_numpy()
+        lats = lats[ilats]
+        lons = lons[ilons]
+        if lats[0] > lats[-1]:
+            lats = lats[::-1]
+            grid = grid[::-1, :]
+        if lons[0] > lons[-1]:
+            lons = lons[::-1]
+            grid = grid[:, ::-1]
+
+        self.depth_grid = np.ascontiguousarray(grid, dtype=np.float32)
+        self.depth_lats = lats
+        self.depth_lons = lons
+        self.depth_lat_step = get_regular_step(lats)
+        self.depth_lon_step = get_regular_step(lons)
+        self.depth_pyramid = DepthPyramid(self.depth_grid, lats, lons)
+
+    ##
+    # Returns the depth at the points 'lat', 'lon' (arrays of any shape) by bilinear interpolation of depth_grid. As
+    # for xarray.DataArray.interp, points outside of the grid are assigned NaN.
+    def get_depth_bilinear(self, lat, lon):
+        ilat, wlat, inside_lat = get_grid_weights(self.depth_lats, self.depth_lat_step, lat)
+        ilon, wlon, inside_lon = get_grid_weights(self.depth_lons, self.depth_lon_step, lon)
+        grid = self.depth_grid
+        depth = ((1 - wlat) * ((1 - wlon) * grid[ilat, ilon] + wlon * grid[ilat, ilon + 1]) +
+                 wlat * ((1 - wlon) * grid[ilat + 1, ilon] + wlon * grid[ilat + 1, ilon + 1]))
+        return np.where(inside_lat & inside_lon, depth, np.nan)
+
     def set_draught(self, depth):
         self.min_depth = depth
 
     def constraint_on_point(self, lat, lon, time):
-        self.check_depth(lat, lon, time)
-        returnvalue = self.current_depth > -self.min_depth
-        # form.print_step('current_depth:' + str(self.current_depth), 1)
-        return returnvalue
+        return self.is_too_shallow(lat, lon)
+
+    ##
+    # Returns a boolean array that marks the points at which the water is not deep enough. Points in regions that are
+    # clearly deeper or shallower than the minimum depth are classified with the coarse levels of the depth pyramid,
+    # the depth is interpolated only for the remaining points.
+    def is_too_shallow(self, lat, lon):
+        ilat, wlat, inside_lat = get_grid_weights(self.depth_lats, self.depth_lat_step, lat)
+        ilon, wlon, inside_lon = get_grid_weights(self.depth_lons, self.depth_lon_step, lon)
+        inside = inside_lat & inside_lon
+
+        classes = self.depth_pyramid.classify(ilat, ilon, -self.min_depth)
+        is_too_shallow = (classes == 1) & inside
+        undecided = (classes == 0) & inside
+        if undecided.any():
+            is_too_shallow[undecided] = self.get_depth_bilinear(np.asarray(lat)[undecided],
+                                                                np.asarray(lon)[undecided]) > -self.min_depth
+        return is_too_shallow
 
     def check_depth(self, lat, lon, time):
-        lat_da = xr.DataArray(lat, dims="dummy")
-        lon_da = xr.DataArray(lon, dims="dummy")
-        rounded_ds = self.depth_data["depth"].interp(latitude=lat_da, longitude=lon_da, method="linear")
-        self.current_depth = rounded_ds.to_numpy()
+        self.current_depth = self.get_depth_bilinear(lat, lon)
 
     def print_info(self):
         logger.info(form.get_log_step("minimum water depth=" + str(self.min_depth) + "m", 1))
 
+    ##
+    # interpolates the depth data on the grid spanned by 'lats' and 'lons' in one request
+    def rasterise(self, lats, lons):
+        lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+        return self.is_too_shallow(lat_grid, lon_grid)
+
+    def get_raster_settings(self):
+        settings = {'name': self.name, 'min_depth': self.min_depth, 'depth_path': self.depth_path}
+        if self.depth_path and os.path.exists(self.depth_path):
+            stat = os.stat(self.depth_path)
+            settings['depth_size'] = stat.st_size
+            settings['depth_mtime'] = stat.st_mtime_ns
+        return settings
+
     def get_current_depth(self, lat, lon):
         self.check_depth(lat, lon, None)
         return self.current_depth
@@ -592,17 +942,11 @@ class WaterDepth(NegativeContraint):
         ax.axis("off")
         ax.xaxis.set_tick_params(labelsize="large")
 
-        ds_depth = self.depth_data.coarsen(latitude=10, longitude=10, boundary="exact").mean()
-        ds_depth_coarsened = ds_depth.compute()
-
-        self.depth_data = ds_depth_coarsened.where(
-            (ds_depth_coarsened.latitude > self.map_size.lat1) & (ds_depth_coarsened.latitude < self.map_size.lat2) &
-            (ds_depth_coarsened.longitude > self.map_size.lon1) & (ds_depth_coarsened.longitude < self.map_size.lon2) &
-            (ds_depth_coarsened.depth < 0), drop=True, )
+        ds_depth = self.get_plot_depth(self.map_size)
 
         ax = fig.add_subplot(111, projection=ccrs.PlateCarree())
-        cp = self.depth_data["depth"].plot.contourf(ax=ax, levels=np.arange(-100, 0, level_diff),
-                                                    transform=ccrs.PlateCarree())
+        cp = ds_depth["depth"].plot.contourf(ax=ax, levels=np.arange(-100, 0, level_diff),
+                                             transform=ccrs.PlateCarree())
         fig.colorbar(cp, ax=ax, shrink=0.7, label="Wassertiefe (m)", pad=0.1)
 
         fig.subplots_adjust(left=0.1, right=1.2, bottom=0, top=1, wspace=0, hspace=0)
@@ -613,6 +957,15 @@ class WaterDepth(NegativeContraint):
 
         return fig, ax
 
+    ##
+    # returns the depth data at reduced resolution (depth pyramid) within 'map_size' restricted to water for plotting
+    def get_plot_depth(self, map_size):
+        ds_depth = self.depth_pyramid.get_dataset(DEPTH_PYRAMID_PLOT_LEVEL)
+        return ds_depth.where(
+            (ds_depth.latitude > map_size.lat1) & (ds_depth.latitude < map_size.lat2) &
+            (ds_depth.longitude > map_size.lon1) & (ds_depth.longitude < map_size.lon2) &
+            (ds_depth.depth < 0), drop=True, )
+
     def _has_scaling(self, dataset):
         """Check if any of the included data variables has a scale_factor or add_offset"""
         for var in dataset.data_vars:
@@ -636,6 +989,30 @@ class WaterDepth(NegativeContraint):
         dataset.to_netcdf(file_out)
 
 
+##
+# returns the spacing of the ascending coordinates 'coords' or None if they are not evenly spaced
+def get_regular_step(coords):
+    step = (coords[-1] - coords[0]) / (coords.size - 1)
+    if np.allclose(np.diff(coords), step, rtol=1e-6, atol=0):
+        return step
+    return None
+
+
+##
+# Returns the indices of the lower grid points, the interpolation weights of the upper grid points and a boolean
+# array that marks the values within the range of the ascending coordinates 'coords'. For evenly spaced coordinates
+# ('step' is not None), the indices are computed directly, otherwise they are searched.
+def get_grid_weights(coords, step, values):
+    values = np.asarray(values, dtype=float)
+    if step is not None:
+        idxs = np.clip(np.floor((values - coords[0]) / step).astype(int), 0, coords.size - 2)
+    else:
+        idxs = np.clip(np.searchsorted(coords, values, side='right') - 1, 0, coords.size - 2)
+    weights = (values - coords[idxs]) / (coords[idxs + 1] - coords[idxs])
+    inside = (values >= coords[0]) & (values <= coords[-1])
+    return idxs, weights, inside
+
+
 class StayOnMap(NegativeContraint):
     lat1: float
     lon1: float
@@ -645,6 +1022,8 @@ class StayOnMap(NegativeContraint):
     def __init__(self):
         NegativeContraint.__init__(self, "StayOnMap")
         self.message += "leaving wheather map!"  # self.resource_type = 0
+        self.is_static = True
+        self.is_pointwise = True
 
     def constraint_on_point(self, lat, lon, time):
         # self.print_debug('checking point: ' + str(lat) + ',' + str(lon))
@@ -654,6 +1033,9 @@ class StayOnMap(NegativeContraint):
     def print_info(self):
         logger.info(form.get_log_step("stay on wheather map", 1))
 
+    def get_raster_settings(self):
+        return {'name': self.name, 'map': (self.lat1, self.lon1, self.lat2, self.lon2)}
+
     def set_map(self, lat1, lon1, lat2, lon2):
         self.lat1 = lat1
         self.lon1 = lon1
@@ -682,10 +1064,16 @@ class ContinuousCheck(NegativeContraint):
 
     tags : list
         Values of the seamark tags that need to be considered
+
+    data_file : str
+        GeoPackage from which the seamark objects and land polygons are read instead of the database (optional, see
+        export_constraint_data)
     """
 
-    def __init__(self):
+    def __init__(self, data_file=None):
         NegativeContraint.__init__(self, "ContinuousChecks")
+        self.is_pointwise = True
+        self.data_file = data_file
         self.host = os.getenv("WRT_DB_HOST")
         self.database = os.getenv("WRT_DB_DATABASE")
         self.user = os.getenv("WRT_DB_USERNAME")
@@ -712,13 +1100,70 @@ class ContinuousCheck(NegativeContraint):
 
         Returns
         ----------
-        Engine of PostgreSQL
+        Engine of PostgreSQL. The engine is created only once per process and database URL and its connection pool
+        is shared by all queries.
         """
         # Connect to the PostgreSQL database using SQLAlchemy
-        engine = db.create_engine(
-            "postgresql://{user}:{pwd}@{host}:{port}/{db}".format(user=self.user, pwd=self.password, host=self.host,
-                                                                  db=self.database, port=self.port))
-        return engine
+        url = "postgresql://{user}:{pwd}@{host}:{port}/{db}".format(user=self.user, pwd=self.password,
+                                                                    host=self.host, db=self.database, port=self.port)
+        # engines must not be shared with forked processes
+        key = (os.getpid(), url)
+        if key not in database_engines:
+            database_engines[key] = db.create_engine(url, pool_pre_ping=True)
+        return database_engines[key]
+
+    def read_postgis_batches(self, sql, params=None, engine=None):
+        """
+        Read the result of a SQL query from the PostGIS database in batches of POSTGIS_BATCH_SIZE rows
+
+        Parameters
+        ----------
+        sql : str
+            sql query with named parameters (:name)
+
+        params : dict
+            values of the parameters of the sql query
+
+        engine : sqlalchemy engine
+            engine object (optional, the pooled engine of connect_database is used by default)
+
+        Returns
+        ----------
+        gdf : GeoDataFrame
+            gdf including all the rows returned by the query
+        """
+        if engine is None:
+            engine = self.connect_database()
+        batches = list(gpd.read_postgis(sql=db.text(sql), con=engine, geom_col="geom", crs="epsg:4326",
+                                        params=params, chunksize=POSTGIS_BATCH_SIZE))
+        if len(batches) == 0:
+            return gpd.GeoDataFrame(columns=["tags", "geom"], geometry="geom", crs="epsg:4326")
+        return pd.concat(batches, ignore_index=True)
+
+    def read_layer_from_file(self, layer, map_size=None):
+        """
+        Read a layer of the GeoPackage data_file. If map_size is provided, only the features that intersect the bbox
+        are read using the spatial index of the GeoPackage.
+
+        Parameters
+        ----------
+        layer : str
+            name of the layer ('seamarks' or 'land_polygons')
+
+        map_size : Map
+            bbox of the routing (optional)
+
+        Returns
+        ----------
+        gdf : GeoDataFrame
+            gdf including the features of the layer with the geometry column 'geom'
+        """
+        bbox = None
+        if map_size is not None:
+            bbox = (map_size.lon1, map_size.lat1, map_size.lon2, map_size.lat2)
+        logger.info(form.get_log_step('Reading layer ' + layer + ' from file: ' + self.data_file, 1))
+        gdf = gpd.read_file(self.data_file, layer=layer, bbox=bbox)
+        return gdf.rename_geometry("geom")
 
 
 class RunTestContinuousChecks(ContinuousCheck):
@@ -763,11 +1208,58 @@ class SeamarkCrossing(ContinuousCheck):
 
     tags : list
         Values of the seamark tags that need to be considered
+
+    map_size : Map
+        bbox of the routing; only seamark objects within the bbox are indexed (optional)
+
+    data_file : str
+        GeoPackage with the layer 'seamarks' from which the seamark objects are read instead of the database (optional)
+
+    seamark_trees : dict
+        STRtree of the seamark objects per combination of engine, query, seamark_list and seamark_object
     """
 
-    def __init__(self):  # query,predicates,tags):
-        super().__init__()  # self.engine = ContinuousCheck.connect_database()  # self.query=ContinuousCheck().query
+    def __init__(self, map_size=None, data_file=None):  # query,predicates,tags):
+        super().__init__(data_file)  # self.engine = ContinuousCheck.connect_database()
+        # self.query=ContinuousCheck().query
         # self.predicates=ContinuousCheck().predicates
+        self.map_size = map_size
+        self.seamark_trees = {}
+
+    def get_seamark_query(self, query, geom_column, seamark_list):
+        """
+        Restrict a query of the seamark objects to the objects whose tag 'seamark:type' is one of seamark_list and,
+        if map_size is set, to the objects that intersect the bbox of the routing s.t. the filtering is done by the
+        database (using its spatial index) instead of transferring and filtering whole tables
+
+        Parameters
+        ----------
+        query : str
+            sql query for table nodes or ways without WHERE clause
+
+        geom_column : str
+            name of the geometry column of the table
+
+        seamark_list : list
+            list of all the tags that must be considered for filtering specific seamark objects
+
+        Returns
+        ----------
+        sql : str
+            sql query with named parameters
+
+        params : dict
+            values of the parameters of the sql query
+        """
+        # tags are stored in the hstore format (see parse_tags)
+        conditions = ["tags -> 'seamark:type' = ANY(:seamark_types)"]
+        params = {"seamark_types": list(seamark_list)}
+        if self.map_size is not None:
+            bbox_condition, bbox_params = get_bbox_condition(geom_column, self.map_size)
+            conditions.append(bbox_condition)
+            params.update(bbox_params)
+        sql = query + " WHERE " + " AND ".join(conditions)
+        return sql, params
 
     def query_nodes(self, engine=None, query=None):
         """
@@ -789,7 +1281,8 @@ class SeamarkCrossing(ContinuousCheck):
         # Define SQL query to retrieve list of tables
         # sql_query = "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"
         if (engine is None) and (query is None):
-            gdf = gpd.read_postgis(con=self.connect_database(), sql=self.query[0], geom_col="geom", crs="epsg:4326")
+            sql, params = self.get_seamark_query(self.query[0], "geom", self.tags)
+            gdf = self.read_postgis_batches(sql, params)
             gdf = gdf[gdf["geom"] != None]
         # elif (engine is not None) and (query is not None):
         #     gdf = gpd.read_postgis(con=engine, sql=query, geom_col="geom")
@@ -836,7 +1329,8 @@ class SeamarkCrossing(ContinuousCheck):
         # gdf = gpd.read_postgis(con=engine, sql=query, geom_col="geom")
 
         if (engine is None) and (query is None):
-            gdf = gpd.read_postgis(con=self.connect_database(), sql=self.query[1], geom_col="geom", crs="epsg:4326")
+            sql, params = self.get_seamark_query(self.query[1], "linestring", self.tags)
+            gdf = self.read_postgis_batches(sql, params)
             gdf = gdf[gdf["geom"] != None]
         else:
             gdf = gpd.read_postgis(con=engine, sql=query, geom_col="geom", crs="epsg:4326")
@@ -848,6 +1342,30 @@ class SeamarkCrossing(ContinuousCheck):
 
         return gdf
 
+    def filter_seamark_tags(self, gdf, seamark_list):
+        """
+        Select the seamark objects whose tag 'seamark:type' is one of the specified tags. The tags of all rows are
+        parsed only once (see parse_tags) and their 'seamark:type' is stored in the categorical column 'seamark_type'
+        which is filtered with a single isin, so every seamark object is returned at most once and other tags (e.g.
+        'name') with the same value do not select it.
+
+        Parameters
+        ----------
+        gdf : GeoDataFrame
+            seamark objects with the column 'tags' (dicts or their string representation)
+
+        seamark_list : list
+            list of all the tags that must be considered for filtering specific seamark objects
+
+        Returns
+        ----------
+        gdf_filtered : GeoDataFrame
+            seamark objects with any of the specified tags, the tags parsed into dicts and the column 'seamark_type'
+        """
+        gdf = gdf.assign(tags=[parse_tags(tags) for tags in gdf["tags"]])
+        gdf = gdf.assign(seamark_type=get_seamark_types(gdf["tags"]))
+        return gdf[gdf["seamark_type"].isin(seamark_list)]
+
     def gdf_seamark_combined_nodes(self, engine=None, query=None, seamark_list=None, seamark_object=None):
         """
         Create new GeoDataFrame with specified seamark tags
@@ -886,16 +1404,7 @@ class SeamarkCrossing(ContinuousCheck):
             else:
                 gdf = self.query_nodes(engine=engine, query=query)
 
-            gdf_list = []
-            for i in range(0, len(seamark_list)):
-                if isinstance(gdf["tags"][i], str):
-                    gdf["tags"] = gdf["tags"].apply(ast.literal_eval)
-                    gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                    gdf_list.append(gdf1)
-                else:
-                    gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                    gdf_list.append(gdf1)
-            gdf_concat = pd.concat(gdf_list)
+            gdf_concat = self.filter_seamark_tags(gdf, seamark_list)
 
         return gdf_concat
 
@@ -936,16 +1445,7 @@ class SeamarkCrossing(ContinuousCheck):
             else:
                 gdf = self.query_ways(query=query, engine=engine)
 
-            gdf_list = []
-            for i in range(0, len(seamark_list)):
-                if isinstance(gdf["tags"][i], str):
-                    gdf["tags"] = gdf["tags"].apply(ast.literal_eval)
-                    gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                    gdf_list.append(gdf1)
-                else:
-                    gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                    gdf_list.append(gdf1)
-            gdf_concat = pd.concat(gdf_list)
+            gdf_concat = self.filter_seamark_tags(gdf, seamark_list)
 
         return gdf_concat
 
@@ -1026,18 +1526,7 @@ class SeamarkCrossing(ContinuousCheck):
 
             if ("nodes" in seamark_object) and ("ways" in seamark_object):
                 gdf = self.concat_nodes_ways(query=query, engine=engine)
-                gdf_list = []
-                for i in range(0, len(seamark_list)):
-                    if isinstance(gdf["tags"].iloc[i], str):
-                        gdf["tags"] = gdf["tags"].apply(ast.literal_eval)
-                        gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                        gdf_list.append(gdf1)
-
-                    else:
-                        gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                        gdf_list.append(gdf1)
-
-                gdf_concat = pd.concat(gdf_list)
+                gdf_concat = self.filter_seamark_tags(gdf, seamark_list)
                 print(f'concat geodataframe is {gdf_concat}')
 
                 return gdf_concat
@@ -1049,22 +1538,60 @@ class SeamarkCrossing(ContinuousCheck):
             if ("nodes" in seamark_object) and ("ways" in seamark_object):
                 gdf = self.concat_nodes_ways()
                 print(f"concat gdf {gdf}")
-                gdf_list = []
-                for i in range(0, len(seamark_list)):
-                    if isinstance(gdf["tags"].iloc[i], str):
-                        gdf["tags"] = gdf["tags"].apply(ast.literal_eval)
-                        gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                        gdf_list.append(gdf1)
-                    else:
-                        gdf1 = gdf[gdf["tags"].apply(lambda x: seamark_list[i] in x.values())]
-                        gdf_list.append(gdf1)
-
-                gdf_concat = pd.concat(gdf_list)
+                gdf_concat = self.filter_seamark_tags(gdf, seamark_list)
                 print(f'concat geodataframe is {gdf_concat}')
 
                 return gdf_concat
             print("error in engine and query initialisation")
 
+    def get_seamark_tree(self, engine=None, query=None, seamark_list=None, seamark_object=None):
+        """
+         Return the STRtree of the seamark objects with the specified tags. The seamark objects are queried from the
+         database (or read from data_file if neither engine nor query are provided) and indexed only once per
+         combination of arguments; if map_size is set, only seamark objects that intersect the bbox of the routing are
+         indexed.
+
+         Parameters
+         ----------
+         engine : sqlalchemy engine
+             engine object
+
+         query : list
+             list of str for the sql query for table nodes and ways
+
+         seamark_object : list
+            value nodes, ways (which table to be considered)
+
+         seamark_list : list
+             list of all the tags that must be considered for filtering specific seamark objects
+
+         Returns
+         ----------
+         tree : shapely.STRtree
+             spatial index of the geometries of the seamark objects
+         """
+        if (engine is None) and (query is None):
+            key = None
+        else:
+            key = (engine, tuple(query), tuple(seamark_list), tuple(seamark_object))
+
+        if key not in self.seamark_trees:
+            if key is None and self.data_file is not None:
+                concat_gdf = self.read_layer_from_file("seamarks", self.map_size)
+            elif key is None:
+                concat_gdf = self.gdf_seamark_combined_nodes_ways()
+            else:
+                concat_gdf = self.gdf_seamark_combined_nodes_ways(engine=engine, query=query,
+                                                                  seamark_list=seamark_list,
+                                                                  seamark_object=seamark_object)
+            geoms = np.asarray(concat_gdf["geom"].values)
+            if self.map_size is not None:
+                bbox = box(self.map_size.lon1, self.map_size.lat1, self.map_size.lon2, self.map_size.lat2)
+                geoms = geoms[shapely.intersects(geoms, bbox)]
+            logger.info(form.get_log_step('Indexing ' + str(len(geoms)) + ' seamark objects', 1))
+            self.seamark_trees[key] = STRtree(geoms)
+        return self.seamark_trees[key]
+
     def check_crossing(self, lat_start, lon_start, lat_end, lon_end, engine=None, query=None, seamark_list=None,
                        seamark_object=None, time=None):  # best way to go (keep just these arguments)
         """
@@ -1075,7 +1602,6 @@ class SeamarkCrossing(ContinuousCheck):
          lat_start : np.array
             array of all origin latitudes of routing segments
 
-        lon_start : np.array
         lon_start : np.array
             array of all origin longitudes of routing segments
 
@@ -1093,81 +1619,76 @@ class SeamarkCrossing(ContinuousCheck):
              bool of spatial relation result (True or False)
          """
 
-        query_tree = []
-        if engine is None and query is None:
-            concat_gdf = self.gdf_seamark_combined_nodes_ways()
-
-            for i in range(len(lat_start)):
-                start_point = Point(lon_start[i], lat_start[i])
-                end_point = Point(lon_end[i], lat_end[i])
-                line = LineString([start_point, end_point])
-
-                # creating geospatial dataframe objects from linestring geometries
-                route_df = gpd.GeoDataFrame(geometry=[line])
-
-                # checking the spatial relations using shapely.STRTree spatial indexing method
-                # for predicate in self.predicates:
-                concat_df = concat_gdf
-                # concat_df = ways_gdf  # with all the ways from the seamarks data
-                print(f'PRINT CONCAT DF {concat_df}')
-                tree = STRtree(concat_df["geom"])
-                geom_object = tree.query(route_df["geom"], predicate='intersects').tolist()
-
-                # checks if there is spatial relation between routes and seamarks objects
-                if geom_object == [[], []] or geom_object == []:
-                    # if route is not constrained
-                    query_tree.append(False)
-                    print(f'NO CROSSING for  {line} in the query tree: {query_tree} ')
-                else:
-                    # if route is constrained
-                    query_tree.append(True)
-                    print(f'CROSSING for  {line} in the query tree: {query_tree} ')
+        tree = self.get_seamark_tree(engine=engine, query=query, seamark_list=seamark_list,
+                                     seamark_object=seamark_object)
+
+        # generating the LineString geometries from start and end points
+        lines = np.array([LineString([Point(lon_start[i], lat_start[i]), Point(lon_end[i], lat_end[i])])
+                          for i in range(len(lat_start))], dtype=object)
+
+        # checking the spatial relations of all routing segments with a single query of the spatial index; the query
+        # returns the indices of the routing segments and of the seamark objects that intersect
+        idxs_segments, idxs_seamarks = tree.query(lines, predicate='intersects')
+        query_tree = np.full(len(lines), False)
+        query_tree[idxs_segments] = True
 
-            # returns a list bools (spatial relation)
-            return query_tree
+        # returns a list bools (spatial relation)
+        return query_tree.tolist()
+
+    def export_seamarks(self, path, engine=None, query=None, seamark_list=None, seamark_object=None):
+        """
+        Write the seamark objects with the specified tags to the layer 'seamarks' of the GeoPackage path
+
+        Parameters
+        ----------
+        path : str
+            path of the GeoPackage
+
+        engine, query, seamark_list, seamark_object :
+            see gdf_seamark_combined_nodes_ways
+        """
+        if (engine is None) and (query is None):
+            gdf = self.gdf_seamark_combined_nodes_ways()
         else:
-            concat_gdf = self.gdf_seamark_combined_nodes_ways(engine=engine, query=query, seamark_list=seamark_list,
-                                                              seamark_object=seamark_object)
-
-            # generating the LineString geometry from start and end point
-            print(type(lat_start))
-            for i in range(len(lat_start)):
-                start_point = Point(lon_start[i], lat_start[i])
-                end_point = Point(lon_end[i], lat_end[i])
-                line = LineString([start_point, end_point])
-
-                # creating geospatial dataframe objects from linestring geometries
-                route_df = gpd.GeoDataFrame(geometry=[line])
-
-                # checking the spatial relations using shapely.STRTree spatial indexing method
-                # for predicate in self.predicates:
-                concat_df = concat_gdf
-                print(f'PRINT CONCAT DF {concat_df}')
-                tree = STRtree(concat_df["geom"])
-                geom_object = tree.query(route_df["geometry"], predicate='intersects').tolist()
-
-                # checks if there is spatial relation between routes and seamarks objects
-                if geom_object == [[], []] or geom_object == []:
-                    # if route is not constrained
-                    query_tree.append(False)
-                    print(f'NO CROSSING for  {line} in the query tree: {query_tree} ')
-                else:
-                    # if route is constrained
-                    query_tree.append(True)
-                    print(f'CROSSING for  {line} in the query tree: {query_tree} ')
+            gdf = self.gdf_seamark_combined_nodes_ways(engine=engine, query=query, seamark_list=seamark_list,
+                                                       seamark_object=seamark_object)
+        gdf = gpd.GeoDataFrame({"tags": gdf["tags"].astype(str).values}, geometry=gdf["geom"].values, crs="epsg:4326")
+        logger.info(form.get_log_step('Writing ' + str(len(gdf)) + ' seamark objects to ' + path, 0))
+        gdf.to_file(path, layer="seamarks", driver="GPKG")
+
 
-            # returns a list bools (spatial relation)
-            return query_tree
+# maximum number of vertices of the land polygons in the spatial index of LandPolygonsCrossing; larger polygons are
+# subdivided to keep the intersection tests cheap
+LAND_POLYGON_MAX_VERTICES = 256
 
 
 class LandPolygonsCrossing(ContinuousCheck):
-    def __init__(self, map_size):
-        super().__init__()
+    """
+    Checks whether routing segments cross land polygons
+
+    Attributes
+    ----------
+
+    map_size : Map
+        bbox of the routing; the land polygons are clipped to the bbox
+
+    data_file : str
+        GeoPackage with the layer 'land_polygons' from which the land polygons are read instead of the database
+        (optional)
+
+    land_polygon_trees : dict
+        STRtree of the clipped and subdivided land polygons per combination of engine and query
+    """
+
+    def __init__(self, map_size, data_file=None):
+        super().__init__(data_file)
         self.map_size = map_size
+        self.land_polygon_trees = {}
 
     def query_land_polygons(self, engine=None, query=None):
         """
-        Create new GeoDataFrame using public.ways table in the query
+        Create new GeoDataFrame using the land_polygons table in the query. If neither engine nor query are provided
+        and map_size is set, only the land polygons that intersect the bbox of the routing are read from the database.
 
         Parameters
         ----------
@@ -1175,19 +1696,21 @@ class LandPolygonsCrossing(ContinuousCheck):
             engine object
 
         query : str
-            sql query for table ways
+            sql query for table land_polygons
 
         Returns
         ----------
         gdf : GeoDataFrame
-            gdf including all the features from public.ways table
+            gdf including the features from the land_polygons table
         """
 
         # Use geopandas to read the SQL query into a dataframe from postgis
         if query is None and engine is None:
-            query = self.query[2]
-            engine = self.connect_database()
-            gdf = gpd.read_postgis(sql=query, con=engine, geom_col="geom")
+            sql, params = self.query[2], {}
+            if self.map_size is not None:
+                bbox_condition, params = get_bbox_condition("geometry", self.map_size)
+                sql = sql + " WHERE " + bbox_condition
+            gdf = self.read_postgis_batches(sql, params)
             # Eliminate none values
             gdf = gdf[gdf["geom"] != None]
 
@@ -1200,10 +1723,47 @@ class LandPolygonsCrossing(ContinuousCheck):
 
     def get_land_polygons(self):
 
-        if not self.land_polygon_gdf:
-            self.land_polygon_gdf = self.query_land_polygons()
+        if self.land_polygon_gdf is None:
+            if self.data_file is not None:
+                self.land_polygon_gdf = self.read_layer_from_file("land_polygons", self.map_size)
+            else:
+                self.land_polygon_gdf = self.query_land_polygons()
         return self.land_polygon_gdf
 
+    def get_land_polygon_tree(self, engine=None, query=None):
+        """
+        Return the STRtree of the land polygons. The land polygons are queried, clipped to the bbox of the routing,
+        subdivided into parts with at most LAND_POLYGON_MAX_VERTICES vertices and prepared only once per combination
+        of arguments.
+
+        Parameters
+        ----------
+        engine : sqlalchemy engine
+            engine object
+
+        query : str
+            sql query for table land_polygons
+
+        Returns
+        ----------
+        tree : shapely.STRtree
+            spatial index of the land polygons
+        """
+        key = None if (query is None and engine is None) else (engine, query)
+        if key not in self.land_polygon_trees:
+            if key is None:
+                gdf = self.get_land_polygons()
+            else:
+                gdf = self.query_land_polygons(engine=engine, query=query)
+
+            bbox = box(self.map_size.lon1, self.map_size.lat1, self.map_size.lon2, self.map_size.lat2)
+            geoms = shapely.intersection(np.asarray(gdf["geom"].values), bbox)
+            geoms = subdivide_polygons(geoms[~shapely.is_empty(geoms)], LAND_POLYGON_MAX_VERTICES)
+            shapely.prepare(geoms)
+            logger.info(form.get_log_step('Indexing ' + str(len(geoms)) + ' land polygons', 1))
+            self.land_polygon_trees[key] = STRtree(geoms)
+        return self.land_polygon_trees[key]
+
     def check_crossing(self, lat_start, lon_start, lat_end, lon_end, query=None, engine=None,
                        time=None):  # best way to go (keep just these arguments)
         """
@@ -1231,39 +1791,128 @@ class LandPolygonsCrossing(ContinuousCheck):
             bool of spatial relation result (True or False)
         """
 
-        query_tree = []
-        if query is not None and engine is not None:
-            concat_gdf = self.query_land_polygons(engine=engine, query=query)
-        else:
-            concat_gdf = self.get_land_polygons()
-            concat_gdf.clip(box(self.map_size[1], self.map_size[0], self.map_size[3], self.map_size[2]))
+        tree = self.get_land_polygon_tree(engine=engine, query=query)
 
-        # generating the LineString geometry from start and end point
-        for i in range(len(lat_start)):
-            start_point = Point(lon_start[i], lat_start[i])
-            end_point = Point(lon_end[i], lat_end[i])
-            line = LineString([start_point, end_point])
+        # generating the LineString geometries from start and end points
+        lines = np.array([LineString([Point(lon_start[i], lat_start[i]), Point(lon_end[i], lat_end[i])])
+                          for i in range(len(lat_start))], dtype=object)
 
-            # creating geospatial dataframe objects from linestring geometries
-            route_df = gpd.GeoDataFrame(geometry=[line])
+        # checking the spatial relations of all routing segments with a single query of the spatial index
+        idxs_segments, idxs_polygons = tree.query(lines, predicate="intersects")
+        query_tree = np.full(len(lines), False)
+        query_tree[idxs_segments] = True
 
-            # checking the spatial relations using shapely.STRTree spatial indexing method
+        # returns a list bools (spatial relation)
+        return query_tree.tolist()
 
-            concat_df = concat_gdf
-            if query is not None and engine is not None:
-                tree = STRtree(concat_df["geom"])
-            else:
-                tree = STRtree(concat_df["geom"])
+    def export_land_polygons(self, path, engine=None, query=None):
+        """
+        Write the land polygons to the layer 'land_polygons' of the GeoPackage path. The land polygons are subdivided
+        into parts with at most LAND_POLYGON_MAX_VERTICES vertices s.t. reading the features within a bbox via the
+        spatial index of the GeoPackage does not return whole continents.
 
-            geom_object = tree.query(route_df["geometry"], predicate="intersects").tolist()
+        Parameters
+        ----------
+        path : str
+            path of the GeoPackage
 
-            # checks if there is spatial relation between routes and seamarks objects
-            if geom_object == [[], []] or geom_object == []:
-                # if route is not constrained
-                query_tree.append(False)
-            else:
-                # if route is constrained
-                query_tree.append(True)
+        engine : sqlalchemy engine
+            engine object
 
-        # returns a list bools (spatial relation)
-        return query_tree
+        query : str
+            sql query for table land_polygons
+        """
+        if (engine is None) and (query is None):
+            gdf = self.query_land_polygons()
+        else:
+            gdf = self.query_land_polygons(engine=engine, query=query)
+        geoms = subdivide_polygons(np.asarray(gdf["geom"].values), LAND_POLYGON_MAX_VERTICES)
+        gdf = gpd.GeoDataFrame(geometry=geoms, crs="epsg:4326")
+        logger.info(form.get_log_step('Writing ' + str(len(gdf)) + ' land polygons to ' + path, 0))
+        gdf.to_file(path, layer="land_polygons", driver="GPKG")
+
+
+##
+# Returns the elements of 'values' that are selected by the boolean array 'mask'. 'values' can be a scalar (returned
+# as is) or an array that can be broadcast to the shape of 'mask', e.g. the departure times of the routing segments.
+# Arrays of any other shape are returned as is.
+def select_points(values, mask):
+    if values is None or np.ndim(values) == 0:
+        return values
+    try:
+        return np.broadcast_to(np.asarray(values), mask.shape)[mask]
+    except ValueError:
+        return values
+
+
+##
+# Returns the condition of a SQL query that restricts the geometries of 'geom_column' to those that intersect the bbox
+# 'map_size' (using the spatial index of the database) and the values of its parameters
+def get_bbox_condition(geom_column, map_size):
+    condition = "ST_Intersects(" + geom_column + ", ST_MakeEnvelope(:lon1, :lat1, :lon2, :lat2, 4326))"
+    params = {"lat1": map_size.lat1, "lon1": map_size.lon1, "lat2": map_size.lat2, "lon2": map_size.lon2}
+    return condition, params
+
+
+##
+# Returns the tags of a seamark object as dict. The tags can be provided as dict, as string representation of a dict
+# or in the hstore format of PostgreSQL ('"key"=>"value", ...'). Missing tags result in an empty dict.
+def parse_tags(tags):
+    if isinstance(tags, dict):
+        return tags
+    if not isinstance(tags, str) or tags.strip() == "":
+        return {}
+    if tags.lstrip().startswith("{"):
+        return ast.literal_eval(tags)
+    return {unescape_hstore(key): None if value == "NULL" else unescape_hstore(value[1:-1])
+            for key, value in HSTORE_PAIR.findall(tags)}
+
+
+##
+# removes the backslashes that escape quotes and backslashes in keys and values of the hstore format
+def unescape_hstore(text):
+    return re.sub(r'\\(.)', r'\1', text)
+
+
+##
+# Returns the values of the tag 'seamark:type' of the rows of 'tags' (Series of dicts) as categorical Series (NaN for
+# rows without this tag)
+def get_seamark_types(tags):
+    return tags.str.get("seamark:type").astype("category")
+
+
+##
+# Exports the seamark objects and the land polygons from the database (WRT_DB_* environment variables) to the
+# GeoPackage 'path' which can be used as CONSTRAINT_DATA_FILE on machines without access to the database
+def export_constraint_data(path):
+    SeamarkCrossing().export_seamarks(path)
+    LandPolygonsCrossing(None).export_land_polygons(path)
+
+
+##
+# Splits the geometries 'geoms' (array) into parts with at most 'max_vertices' vertices. Geometries with more vertices
+# are intersected with both halves of their bounding box (split along the longer side) until all parts are small
+# enough.
+def subdivide_polygons(geoms, max_vertices):
+    parts = []
+    while geoms.size > 0:
+        bounds = shapely.bounds(geoms)
+        width = bounds[:, 2] - bounds[:, 0]
+        height = bounds[:, 3] - bounds[:, 1]
+        is_small = (shapely.get_num_coordinates(geoms) <= max_vertices) | (np.maximum(width, height) < 1e-9)
+        parts.append(geoms[is_small])
+
+        geoms = geoms[~is_small]
+        bounds = bounds[~is_small]
+        split_lon = width[~is_small] >= height[~is_small]
+        lon_mid = (bounds[:, 0] + bounds[:, 2]) / 2
+        lat_mid = (bounds[:, 1] + bounds[:, 3]) / 2
+        first = shapely.intersection(geoms, shapely.box(bounds[:, 0], bounds[:, 1],
+                                                        np.where(split_lon, lon_mid, bounds[:, 2]),
+                                                        np.where(split_lon, bounds[:, 3], lat_mid)))
+        second = shapely.intersection(geoms, shapely.box(np.where(split_lon, lon_mid, bounds[:, 0]),
+                                                         np.where(split_lon, bounds[:, 1], lat_mid),
+                                                         bounds[:, 2], bounds[:, 3]))
+        geoms = np.concatenate([first, second])
+        geoms = geoms[~shapely.is_empty(geoms)]
+    return np.concatenate(parts) if parts else np.array([], dtype=object)
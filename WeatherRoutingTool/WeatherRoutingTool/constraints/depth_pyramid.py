@@ -0,0 +1,88 @@
+import warnings
+
+import numpy as np
+import xarray as xr
+
+# level from which the classification of points as deep or shallow starts
+DEPTH_PYRAMID_START_LEVEL = 4
+
+# level that is used for plotting, i.e. the depth is averaged over blocks of 2^3 x 2^3 grid points
+DEPTH_PYRAMID_PLOT_LEVEL = 3
+
+
+##
+# Multi-resolution pyramid of a depth grid.
+#
+# Level k of the pyramid divides the grid into blocks of 2^k x 2^k grid cells. For every block, it stores the minimum
+# (lower) and maximum (upper) of the depth at the corners of its cells. Since the bilinear interpolation within a cell
+# lies between the minimum and the maximum of its corners, all points within a block are deeper than a threshold if
+# 'upper' is, and all points are shallower if 'lower' is. 'lower' is NaN if any corner is NaN s.t. blocks with missing
+# data are never classified as shallow.
+#
+# For plotting, every level also provides the mean depth over blocks of 2^k x 2^k grid points.
+
+class DepthPyramid:
+    lats: np.ndarray  # latitudes of the grid (ascending)
+    lons: np.ndarray  # longitudes of the grid (ascending)
+    lower: list  # per level: minimum depth of the blocks of cells, NaN if any corner is NaN
+    upper: list  # per level: maximum depth of the blocks of cells, ignoring NaN
+    mean: list  # per level: mean depth over blocks of grid points, ignoring NaN
+
+    def __init__(self, grid, lats, lons):
+        self.lats = lats
+        self.lons = lons
+
+        corners = np.stack([grid[:-1, :-1], grid[:-1, 1:], grid[1:, :-1], grid[1:, 1:]])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            self.lower = [np.min(corners, axis=0)]
+            self.upper = [np.nanmax(corners, axis=0)]
+            self.mean = [grid]
+            while max(self.lower[-1].shape) > 1:
+                self.lower.append(reduce_blocks(self.lower[-1], np.min))
+                self.upper.append(reduce_blocks(self.upper[-1], np.nanmax))
+            while min(self.mean[-1].shape) > 1:
+                self.mean.append(reduce_blocks(self.mean[-1], np.nanmean, pad=False))
+
+    ##
+    # Classifies the points within the cells (ilat, ilon) of the grid as deeper than 'threshold' (-1), shallower
+    # than 'threshold' (1) or undecided (0). The classification starts at a coarse level and proceeds to finer levels
+    # for the points that are still undecided.
+    def classify(self, ilat, ilon, threshold):
+        classes = np.zeros(np.shape(ilat), dtype=np.int8)
+        undecided = np.full(np.shape(ilat), True)
+        for level in range(min(DEPTH_PYRAMID_START_LEVEL, len(self.lower) - 1), -1, -1):
+            ilat_level = ilat[undecided] >> level
+            ilon_level = ilon[undecided] >> level
+            is_deep = self.upper[level][ilat_level, ilon_level] <= threshold
+            is_shallow = self.lower[level][ilat_level, ilon_level] > threshold
+            classes[undecided] = np.where(is_deep, -1, np.where(is_shallow, 1, 0))
+            undecided = classes == 0
+            if not undecided.any():
+                break
+        return classes
+
+    ##
+    # returns the mean depth of 'level' as xarray.Dataset with the variable 'depth'
+    def get_dataset(self, level):
+        level = min(level, len(self.mean) - 1)
+        depth = self.mean[level]
+        lats = reduce_blocks(self.lats[:, np.newaxis], np.mean, pad=False, levels=level)[:, 0]
+        lons = reduce_blocks(self.lons[np.newaxis, :], np.mean, pad=False, levels=level)[0, :]
+        return xr.Dataset({'depth': (('latitude', 'longitude'), depth)}, coords={'latitude': lats, 'longitude': lons})
+
+
+##
+# Reduces blocks of 2 x 2 elements of 'data' with 'func' ('levels' times). If 'pad' is True, the last row and column
+# are duplicated for odd shapes, otherwise they are dropped.
+def reduce_blocks(data, func, pad=True, levels=1):
+    for _ in range(levels):
+        nrows = 1 if data.shape[0] == 1 else 2
+        ncols = 1 if data.shape[1] == 1 else 2
+        if pad:
+            data = np.pad(data, ((0, data.shape[0] % nrows), (0, data.shape[1] % ncols)), mode='edge')
+        else:
+            data = data[:data.shape[0] - data.shape[0] % nrows, :data.shape[1] - data.shape[1] % ncols]
+        blocks = data.reshape(data.shape[0] // nrows, nrows, data.shape[1] // ncols, ncols)
+        data = func(blocks, axis=(1, 3))
+    return data
@@ -1,4 +1,3 @@
-import datetime
 import datetime as dt
 import json
 
@@ -10,6 +9,7 @@ from matplotlib import gridspec
 
 import WeatherRoutingTool.utils.graphics as graphics
 import WeatherRoutingTool.utils.formatting as form
+import WeatherRoutingTool.utils.unit_conversion as units
 from WeatherRoutingTool.utils.formatting import NumpyArrayEncoder
 from WeatherRoutingTool.ship.shipparams import ShipParams
 
@@ -32,7 +32,8 @@ class RouteParams():
     lons_per_step: tuple  # longitude at beginning of each step + longitude destination (0-360°)
     azimuths_per_step: tuple  # azimuth per step (0-360°)
     dists_per_step: tuple  # distance traveled on great circle for every step (m)
-    starttime_per_step: tuple  # start time at beginning of each step + time when destination is reached (h)
+    starttime_per_step: np.ndarray  # start time at beginning of each step + time when destination is reached
+    # (datetime64[s])
 
     def __init__(self, count, start, finish, gcr, route_type, time, lats_per_step, lons_per_step, azimuths_per_step,
                  dists_per_step, starttime_per_step, ship_params_per_step):
@@ -46,7 +47,7 @@ class RouteParams():
         self.lons_per_step = lons_per_step
         self.azimuths_per_step = azimuths_per_step
         self.dists_per_step = dists_per_step
-        self.starttime_per_step = starttime_per_step
+        self.starttime_per_step = np.asarray(starttime_per_step, dtype='datetime64[s]')
         self.ship_params_per_step = ship_params_per_step
 
     def print_route(self):
@@ -113,6 +114,9 @@ class RouteParams():
 
         logger.info('Write route parameters to ' + filename)
 
+        # travel time per routing step (h)
+        time_passed = units.convert_nptd64_to_s(np.diff(self.starttime_per_step)) / 3600
+
         for i in range(0, self.count + 1):
             feature = {}
             geometry = {}
@@ -135,10 +139,9 @@ class RouteParams():
                 properties['shallow_water_resistance'] = {'value': -99, 'unit': 'N'}
                 properties['hull_roughness_resistance'] = {'value': -99, 'unit': 'N'}
             else:
-                time_passed = (self.starttime_per_step[i + 1] - self.starttime_per_step[i]).seconds / 3600
                 properties['speed'] = {'value': self.ship_params_per_step.speed[i], 'unit': 'm/s'}
                 properties['engine_power'] = {'value': self.ship_params_per_step.power[i] / 1000, 'unit': 'kW'}
-                properties['fuel_consumption'] = {'value': self.ship_params_per_step.fuel[i] / (time_passed * 1000),
+                properties['fuel_consumption'] = {'value': self.ship_params_per_step.fuel[i] / (time_passed[i] * 1000),
                                                   'unit': 'mt/h'}
                 properties['fuel_type'] = self.ship_params_per_step.fuel_type
                 properties['propeller_revolution'] = {'value': self.ship_params_per_step.rpm[i], 'unit': 'Hz'}
@@ -173,7 +176,6 @@ class RouteParams():
 
         lats_per_step = np.full(count, -99.)
         lons_per_step = np.full(count, -99.)
-        start_time_per_step = np.full(count, datetime.datetime.now())
         speed = np.full(count, -99.)
         power = np.full(count, -99.)
         fuel = np.full(count, -99.)
@@ -192,7 +194,6 @@ class RouteParams():
             lons_per_step[ipoint] = coord_pair[0]
 
             property = point_list[ipoint]['properties']
-            start_time_per_step[ipoint] = dt.datetime.strptime(property['time'], '%Y-%m-%d %H:%M:%S')
             speed[ipoint] = property['speed']['value']
             power[ipoint] = property['engine_power']['value']
             fuel[ipoint] = property['fuel_consumption']['value']
@@ -205,6 +206,8 @@ class RouteParams():
             r_shallow[ipoint] = property['shallow_water_resistance']['value']
             r_roughness[ipoint] = property['hull_roughness_resistance']['value']
 
+        start_time_per_step = np.array([point['properties']['time'] for point in point_list], dtype='datetime64[s]')
+
         start = (lats_per_step[0], lons_per_step[0])
         finish = (lats_per_step[count - 1], lons_per_step[count - 1])
         gcr = -99
@@ -272,13 +275,9 @@ class RouteParams():
 
     def get_fuel_per_dist(self):
         fuel_per_hour = self.ship_params_per_step.fuel
-        delta_time = np.full(self.count - 1, datetime.timedelta(seconds=0))
+        delta_time = units.convert_nptd64_to_s(np.diff(self.starttime_per_step[:self.count])) / (60 * 60)
         fuel = np.full(self.count, -99.)
-
-        for i in range(0, self.count - 1):
-            delta_time[i] = self.starttime_per_step[i + 1] - self.starttime_per_step[i]
-            delta_time[i] = delta_time[i].total_seconds() / (60 * 60)
-            fuel[i] = fuel_per_hour[i] * delta_time[i]
+        fuel[:self.count - 1] = fuel_per_hour[:self.count - 1] * delta_time
 
         return fuel
 
@@ -350,12 +349,9 @@ class RouteParams():
         courses = move["azi1"]
         travel_times = dist / bs
 
-        start_times = np.full(npoints - 1, datetime.datetime.strptime('1970-01-01T00:00Z', '%Y-%m-%dT%H:%MZ'))
-        for ipoint in range(0, npoints - 1):
-            if ipoint == 0:
-                start_times[ipoint] = start_time
-            else:
-                start_times[ipoint] = start_times[ipoint - 1] + datetime.timedelta(seconds=travel_times[ipoint - 1])
+        # accumulate travel times in seconds before converting to datetime64 to avoid accumulating rounding errors
+        time_since_start = np.concatenate(([0.], np.cumsum(travel_times[:-1])))
+        start_times = np.datetime64(start_time, 's') + units.convert_s_to_nptd64(time_since_start)
         if debug:
             print('dists: ', dist)
             print('courses: ', courses)
@@ -378,24 +374,23 @@ class RouteParams():
         if unit == 'm':
             return dist
 
+    ##
+    # returns the travel time in 'unit' from the start time of the first step and the arrival time at the destination
     def get_full_travel_time(self, unit='h'):
+        travel_time = self.starttime_per_step[self.count] - self.starttime_per_step[0]
         if unit == 'h':
-            return self.time.total_seconds() / 3600
+            return units.convert_nptd64_to_s(travel_time) / 3600
         if unit == 'min':
-            return self.time.total_seconds() / 60
+            return units.convert_nptd64_to_s(travel_time) / 60
         if unit == 'sec':
-            return self.time.total_seconds()
+            return units.convert_nptd64_to_s(travel_time)
         if unit == 'datetime':
-            return self.time
+            return travel_time.astype(dt.timedelta)
 
     def get_full_fuel(self, unit='t'):
-        full_fuel = 0
-        for ipoint in range(0, self.count - 1):
-            time_passed = (self.starttime_per_step[ipoint + 1] - self.starttime_per_step[ipoint]).total_seconds() / 3600
-            fuel_per_step = self.ship_params_per_step.fuel[ipoint] * time_passed
-
-            if unit == 'kg':
-                fuel_per_step = fuel_per_step * 1000
-            full_fuel = full_fuel + fuel_per_step
+        time_passed = units.convert_nptd64_to_s(np.diff(self.starttime_per_step[:self.count])) / 3600
+        full_fuel = np.sum(self.ship_params_per_step.fuel[:self.count - 1] * time_passed)
 
+        if unit == 'kg':
+            full_fuel = full_fuel * 1000
         return full_fuel
@@ -0,0 +1,126 @@
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import xarray as xr
+
+import mariPower
+import WeatherRoutingTool.utils.formatting as form
+from WeatherRoutingTool.utils.processes import get_context
+from mariPower import __main__
+
+logger = logging.getLogger('WRT.ship')
+
+
+# RAM-backed file system in which the files that are exchanged with mariPower are kept for power mode 'in_memory'
+TMPFS_PATH = '/dev/shm'
+
+
+##
+# Returns a new directory in the RAM-backed file system (TMPFS_PATH) for the files that are exchanged with mariPower.
+# If no RAM-backed file system is available, the directory is created in the default directory for temporary files.
+def make_memory_dir():
+    parent = None
+    if os.path.isdir(TMPFS_PATH) and os.access(TMPFS_PATH, os.W_OK):
+        parent = TMPFS_PATH
+    else:
+        logger.warning('No RAM-backed file system found at ' + TMPFS_PATH + ', the files for mariPower are written to '
+                       + tempfile.gettempdir())
+    return tempfile.mkdtemp(prefix='wrt_maripower_', dir=parent)
+
+
+##
+# Removes 'memory_dir' if called by the process that created it ('pid'), i.e. not by forked worker processes
+def remove_memory_dir(memory_dir, pid):
+    if os.getpid() == pid:
+        shutil.rmtree(memory_dir, ignore_errors=True)
+
+
+##
+# Copies the file 'path' to 'memory_dir' and returns the path of the copy (None if 'path' is None)
+def copy_to_memory_dir(path, memory_dir):
+    if path is None:
+        return None
+    path_memory = os.path.join(memory_dir, os.path.basename(path))
+    shutil.copyfile(path, path_memory)
+    return path_memory
+
+
+##
+# Writes the courses dataset 'ds' to 'courses_path', requests the power estimation from mariPower via its file-based
+# interface and returns the courses dataset with the ship parameters read into memory
+def predict_via_file(ship, ds, courses_path, environment_path, depth_path):
+    ds.to_netcdf(courses_path)
+    mariPower.__main__.PredictPowerOrSpeedRoute(ship, courses_path, environment_path, depth_path)
+    return xr.load_dataset(courses_path)
+
+
+# State of a worker process of the MariPowerPool. It is set up once when the worker is started and is reused for all
+# requests that are processed by the worker.
+worker_data = {}
+
+
+##
+# Pool of long-lived worker processes for the power estimation with mariPower.
+#
+# The environmental and depth data are copied once to a directory in a RAM-backed file system (see make_memory_dir)
+# that is shared by all workers. Every worker process holds its own mariPower.ship.CBT object and its own courses
+# netCDF in this directory. For every request, the courses dataset (see Tanker.get_netCDF_courses) is split into one
+# shard of space points (it_pos) per worker. Every worker passes its shard to mariPower via the file-based interface
+# (predict_via_file), and the results are merged in the order of the space points.
+#
+# The pool needs to be closed by the process that created it (close()). It must not be used from processes that
+# have been forked after its creation, e.g. the workers of the RoutingPool.
+
+class MariPowerPool:
+    processes: int  # number of worker processes
+    pid: int  # id of the process that created the pool
+    memory_dir: str  # directory in a RAM-backed file system for the files that are exchanged with mariPower
+
+    def __init__(self, environment_path, depth_path=None, processes=None):
+        if processes is None:
+            processes = os.cpu_count()
+        self.processes = processes
+        self.pid = os.getpid()
+        self.memory_dir = make_memory_dir()
+
+        logger.info(form.get_log_step('Starting ' + str(processes) + ' mariPower worker processes', 0))
+        environment_memory_path = copy_to_memory_dir(environment_path, self.memory_dir)
+        depth_memory_path = copy_to_memory_dir(depth_path, self.memory_dir)
+        context = get_context()
+        self.pool = context.Pool(processes=processes, initializer=init_worker,
+                                 initargs=(self.memory_dir, environment_memory_path, depth_memory_path))
+
+    ##
+    # Returns the courses dataset 'ds' with the ship parameters added by mariPower
+    def predict(self, ds):
+        if os.getpid() != self.pid:
+            raise ValueError('MariPowerPool can only be used by the process that created it!')
+
+        n_shards = max(1, min(self.processes, ds.sizes['it_pos']))
+        shards = [ds.isel(it_pos=idxs) for idxs in np.array_split(np.arange(ds.sizes['it_pos']), n_shards)]
+        results = self.pool.map(predict_shard, shards, chunksize=1)
+        return xr.concat(results, dim='it_pos').assign_coords(it_pos=ds['it_pos'])
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        remove_memory_dir(self.memory_dir, self.pid)
+
+
+def init_worker(memory_dir, environment_path, depth_path):
+    worker_data['ship'] = mariPower.ship.CBT()
+    worker_data['courses_path'] = os.path.join(memory_dir, 'courses_' + str(os.getpid()) + '.nc')
+    worker_data['environment_path'] = environment_path
+    worker_data['depth_path'] = depth_path
+
+
+##
+# requests the power estimation for a shard of the courses dataset; the space points of the shard are numbered from 1
+# like in a complete courses netCDF
+def predict_shard(ds):
+    ds = ds.assign_coords(it_pos=np.arange(ds.sizes['it_pos']) + 1)
+    return predict_via_file(worker_data['ship'], ds, worker_data['courses_path'], worker_data['environment_path'],
+                            worker_data['depth_path'])
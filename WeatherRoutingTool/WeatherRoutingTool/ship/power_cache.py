@@ -0,0 +1,258 @@
+import hashlib
+import itertools
+import logging
+import os
+
+import numpy as np
+
+import WeatherRoutingTool.utils.formatting as form
+from WeatherRoutingTool.ship.shipparams import ShipParams, SHIPPARAMS_VARIABLES
+
+logger = logging.getLogger('WRT.ship')
+
+# elements of the cache keys; the courses are given in degrees (0 - 360°), the time in seconds since 1970-01-01 and
+# the speed in m/s
+POWER_CACHE_KEYS = ['lat', 'lon', 'time', 'course', 'speed']
+
+DEFAULT_POWER_CACHE_TOLERANCES = {'lat': 1e-5, 'lon': 1e-5, 'time': 1, 'course': 1e-3, 'speed': 1e-3}
+
+
+##
+# Cache for the ship parameters that are returned by the power estimation.
+#
+# Requests for (lat, lon, time, course, speed) that agree within the tolerances of the cache are only evaluated once:
+# every element of a request is quantised to a multiple of its tolerance and the resulting integers form the key of the
+# cache. The keys and the ship parameters are stored in numpy arrays; a dictionary maps the bytes of every key to its
+# row such that all keys of a request are looked up without a Python loop over the elements. The least recently used
+# entries are replaced if the number of entries exceeds 'max_size'.
+#
+# Optionally, the cache is read from and written to a file. The file stores a hash of the environmental data, the depth
+# data and the ship settings (get_power_cache_hash()) and is ignored if the hash does not match the current routing.
+# For parallel routing tasks (see RoutingPool), the entries that have been inserted by a task are transferred from the
+# worker process to the cache of the main process (get_update(), merge()).
+
+class PowerCache:
+    max_size: int  # maximum number of entries
+    tolerances: dict  # quantisation step per element of POWER_CACHE_KEYS
+    key_hash: str  # hash of the data and settings that the ship parameters depend on
+    index: dict  # bytes of the quantised request -> row in keys and values
+    keys: np.ndarray  # quantised requests, shape (n, len(POWER_CACHE_KEYS)); the first get_size() rows are used
+    values: np.ndarray  # ship parameters in the order of SHIPPARAMS_VARIABLES, shape (n, len(SHIPPARAMS_VARIABLES))
+    last_used: np.ndarray  # clock of the last lookup or insertion per row
+    inserted: np.ndarray  # clock of the insertion per row
+    clock: int  # counter of lookups and insertions
+    hits: int
+    misses: int
+
+    def __init__(self, max_size, key_hash='', tolerances=None):
+        if tolerances is None:
+            tolerances = {}
+        self.max_size = max_size
+        self.key_hash = key_hash
+        self.tolerances = {**DEFAULT_POWER_CACHE_TOLERANCES, **tolerances}
+        self.index = {}
+        self.keys = np.zeros((0, len(POWER_CACHE_KEYS)), dtype=np.int64)
+        self.values = np.zeros((0, len(SHIPPARAMS_VARIABLES)))
+        self.last_used = np.zeros(0, dtype=np.int64)
+        self.inserted = np.zeros(0, dtype=np.int64)
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_size(self):
+        return len(self.index)
+
+    ##
+    # Returns the quantised keys (array of shape (n, len(POWER_CACHE_KEYS))) for the courses (degrees), positions,
+    # times and the speed (m/s)
+    def get_keys(self, courses, lats, lons, time, speed):
+        time = np.asarray(time, dtype='datetime64[s]').astype(np.int64)
+        speed = np.broadcast_to(speed, np.shape(courses))
+        values = {'lat': lats, 'lon': lons, 'time': time, 'course': np.mod(courses, 360), 'speed': speed}
+        keys = [np.round(np.asarray(values[key], dtype=float) / self.tolerances[key]) for key in POWER_CACHE_KEYS]
+        return np.stack(keys, axis=-1).astype(np.int64)
+
+    ##
+    # Returns the rows of 'keys' in the cache (-1 for keys that are not cached)
+    def find(self, keys):
+        return np.fromiter(map(self.index.get, get_key_bytes(keys), itertools.repeat(-1)), dtype=np.int64,
+                           count=keys.shape[0])
+
+    ##
+    # Returns the cached ship parameters for 'keys' (array of shape (n, len(SHIPPARAMS_VARIABLES)), NaN for keys that
+    # are not cached) and a boolean array that marks the keys that are not cached.
+    def lookup(self, keys):
+        rows = self.find(keys)
+        missing = rows < 0
+        values = np.full((keys.shape[0], len(SHIPPARAMS_VARIABLES)), np.nan)
+        values[~missing] = self.values[rows[~missing]]
+
+        self.clock += 1
+        self.last_used[rows[~missing]] = self.clock
+        nmissing = int(np.count_nonzero(missing))
+        self.misses += nmissing
+        self.hits += keys.shape[0] - nmissing
+        return values, missing
+
+    ##
+    # Inserts the ship parameters 'values' for 'keys'. Entries of keys that are already cached are updated; new keys
+    # replace the least recently used entries if the cache is full.
+    def insert(self, keys, values):
+        keys = np.asarray(keys, dtype=np.int64).reshape(-1, len(POWER_CACHE_KEYS))
+        values = np.asarray(values, dtype=float).reshape(-1, len(SHIPPARAMS_VARIABLES))
+        self.clock += 1
+
+        rows = self.find(keys)
+        existing = rows >= 0
+        self.values[rows[existing]] = values[existing]
+        self.last_used[rows[existing]] = self.clock
+        self.inserted[rows[existing]] = self.clock
+
+        # duplicate new keys are inserted once (last occurrence)
+        keys, values = keys[~existing], values[~existing]
+        ilast = dict(zip(get_key_bytes(keys), range(keys.shape[0])))
+        ilast = np.sort(np.fromiter(ilast.values(), dtype=np.int64, count=len(ilast)))
+        ilast = ilast[-self.max_size:] if self.max_size > 0 else ilast[:0]
+        keys, values = keys[ilast], values[ilast]
+
+        size = self.get_size()
+        nappend = min(keys.shape[0], self.max_size - size)
+        nreplace = keys.shape[0] - nappend
+        rows_replace = np.zeros(0, dtype=np.int64)
+        if nreplace > 0:
+            rows_replace = np.argpartition(self.last_used[:size], nreplace - 1)[:nreplace]
+            for key in get_key_bytes(self.keys[rows_replace]):
+                del self.index[key]
+
+        if size + nappend > self.keys.shape[0]:
+            self.resize(min(self.max_size, max(2 * self.keys.shape[0], size + nappend)))
+
+        rows = np.concatenate([rows_replace, np.arange(size, size + nappend)])
+        self.keys[rows] = keys
+        self.values[rows] = values
+        self.last_used[rows] = self.clock
+        self.inserted[rows] = self.clock
+        self.index.update(zip(get_key_bytes(keys), rows.tolist()))
+
+    ##
+    # Enlarges the arrays of the cache to 'nrows' rows; rows that exceed the size of the cache are unused
+    def resize(self, nrows):
+        nnew = nrows - self.keys.shape[0]
+        self.keys = np.concatenate([self.keys, np.zeros((nnew, len(POWER_CACHE_KEYS)), dtype=np.int64)])
+        self.values = np.concatenate([self.values, np.zeros((nnew, len(SHIPPARAMS_VARIABLES)))])
+        self.last_used = np.concatenate([self.last_used, np.zeros(nnew, dtype=np.int64)])
+        self.inserted = np.concatenate([self.inserted, np.zeros(nnew, dtype=np.int64)])
+
+    ##
+    # Returns the ship parameters for the courses (degrees), positions, times and the speed. Only requests that are not
+    # cached are passed to 'evaluate' which is called like Tanker.get_fuel_per_time_uncached and returns ShipParams.
+    # Requests that are identical after quantisation are evaluated only once.
+    #
+    # If 'n_coords' is given, the courses of 'n_coords' positions are stored consecutively and the same number of
+    # courses is requested for every position (see Tanker.get_netCDF_courses). In this case, all courses of a position
+    # are evaluated together if any of them is not cached such that 'evaluate' receives requests of the same layout.
+    def get_ship_params(self, evaluate, courses, lats, lons, time, speed, n_coords=None):
+        keys = self.get_keys(courses, lats, lons, time, speed)
+        values, missing = self.lookup(keys)
+
+        if np.any(missing):
+            n_coords_missing = None
+            if n_coords is not None:
+                missing_coords = missing.reshape(n_coords, -1).any(axis=1)
+                n_coords_missing = int(np.count_nonzero(missing_coords))
+                missing = np.repeat(missing_coords, courses.shape[0] // n_coords)
+                keys_missing = keys[missing]
+                idxs_missing = np.flatnonzero(missing)
+                inverse = np.arange(idxs_missing.shape[0])
+            else:
+                keys_missing, idxs, inverse = np.unique(keys[missing], axis=0, return_index=True,
+                                                        return_inverse=True)
+                idxs_missing = np.flatnonzero(missing)[idxs]
+            ship_params = evaluate(courses[idxs_missing], lats[idxs_missing], lons[idxs_missing],
+                                   np.asarray(time)[idxs_missing], unique_coords=n_coords is not None,
+                                   n_coords=n_coords_missing)
+            values_missing = ship_params.data.reshape(len(SHIPPARAMS_VARIABLES), -1).T.astype(float)
+            self.insert(keys_missing, values_missing)
+            values[missing] = values_missing[inverse.reshape(-1)]
+
+        return ShipParams.from_array(np.ascontiguousarray(values.T))
+
+    ##
+    # Returns the clock and the statistics of the cache as starting point for get_update()
+    def get_state(self):
+        return self.clock, self.hits, self.misses
+
+    ##
+    # Returns the entries that have been inserted and the numbers of hits and misses since 'state' (see get_state())
+    def get_update(self, state):
+        clock, hits, misses = state
+        rows = np.flatnonzero(self.inserted[:self.get_size()] > clock)
+        return {'keys': self.keys[rows], 'values': self.values[rows], 'hits': self.hits - hits,
+                'misses': self.misses - misses}
+
+    ##
+    # Inserts the entries of 'update' (see get_update()), e.g. from a worker process, and adds its statistics
+    def merge(self, update):
+        self.insert(update['keys'], update['values'])
+        self.hits += update['hits']
+        self.misses += update['misses']
+
+    ##
+    # Reads the entries of the cache from 'path'. The file is ignored if it does not exist or if it has been written for
+    # different environmental data, depth data or ship settings.
+    def read(self, path):
+        if not os.path.exists(path):
+            logger.info(form.get_log_step('Power cache file ' + path + ' not found, starting with empty cache', 1))
+            return
+        with np.load(path) as data:
+            if str(data['key_hash']) != self.key_hash:
+                logger.info(form.get_log_step('Power cache file ' + path + ' has been written for different input '
+                                              'data, starting with empty cache', 1))
+                return
+            if any(float(data['tolerance_' + key]) != self.tolerances[key] for key in POWER_CACHE_KEYS):
+                logger.info(form.get_log_step('Power cache file ' + path + ' has been written for different '
+                                              'tolerances, starting with empty cache', 1))
+                return
+            self.insert(data['keys'], data['values'])
+        logger.info(form.get_log_step('Read ' + str(self.get_size()) + ' entries from power cache file ' + path, 1))
+
+    def write(self, path):
+        logger.info(form.get_log_step('Writing ' + str(self.get_size()) + ' entries to power cache file ' + path, 0))
+        # least recently used entries first
+        rows = np.argsort(self.last_used[:self.get_size()], kind='stable')
+        keys = self.keys[rows]
+        values = self.values[rows]
+        tolerances = {'tolerance_' + key: self.tolerances[key] for key in POWER_CACHE_KEYS}
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, keys=keys, values=values, key_hash=self.key_hash, **tolerances)
+
+    ##
+    # logs the hit/miss statistics; they are written to the performance log (level WARNING)
+    def print_info(self):
+        nrequests = self.hits + self.misses
+        hit_rate = round(100 * self.hits / nrequests, 1) if nrequests > 0 else 0.
+        logger.warning('Power cache: ' + str(nrequests) + ' requests, ' + str(self.hits) + ' hits, ' +
+                       str(self.misses) + ' misses (hit rate ' + str(hit_rate) + '%), ' + str(self.get_size()) +
+                       ' entries')
+
+
+##
+# Returns the keys (array of shape (n, len(POWER_CACHE_KEYS))) as list of bytes for the index of the cache
+def get_key_bytes(keys):
+    keys = np.ascontiguousarray(keys, dtype=np.int64)
+    return keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel().tolist()
+
+
+##
+# Returns a hash of the files (e.g. environmental and depth data) and the settings (e.g. of the ship) that determine
+# the result of the power estimation
+def get_power_cache_hash(paths, settings):
+    sha = hashlib.sha256()
+    for path in paths:
+        if path is None:
+            continue
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(2 ** 20), b''):
+                sha.update(chunk)
+    sha.update(repr(sorted(settings.items())).encode())
+    return sha.hexdigest()
@@ -0,0 +1,261 @@
+import logging
+
+import numpy as np
+import xarray as xr
+from scipy.interpolate import RegularGridInterpolator
+
+import WeatherRoutingTool.utils.formatting as form
+from WeatherRoutingTool.utils.processes import get_context
+
+logger = logging.getLogger('WRT.ship')
+
+# dimensions of the power table in the order of the conditions passed to the evaluation functions:
+# - wind_angle, wave_angle: direction from which wind/waves are coming relative to the course of the ship (0° = head
+#   wind/waves, 180° = following wind/waves; 0 - 180°)
+# - wind_speed (m/s), wave_height: significant wave height (m), wave_period: peak period (s)
+# - current_speed: component of the current along the course of the ship (m/s, > 0 for following current)
+# - speed: ship speed (m/s)
+POWER_TABLE_AXES = ['wind_angle', 'wind_speed', 'wave_angle', 'wave_height', 'wave_period', 'current_speed', 'speed']
+
+# ship parameters stored in the power table: brake power (W) and propeller revolutions (Hz)
+POWER_TABLE_VARIABLES = ['power', 'rpm']
+
+# spacing (degrees) of the synthetic grid points of the environmental data of the power table (one per condition)
+POWER_TABLE_GRID_STEP = 0.01
+
+# water depth (m) of the synthetic depth data of the power table: deep water s.t. shallow water effects are excluded
+POWER_TABLE_DEPTH = 5000
+
+DEFAULT_POWER_TABLE_AXES = {
+    'wind_angle': np.linspace(0, 180, 7),
+    'wind_speed': np.linspace(0, 25, 6),
+    'wave_angle': np.linspace(0, 180, 5),
+    'wave_height': np.array([0, 1, 2, 4, 6]),
+    'wave_period': np.array([4, 7, 10, 14]),
+    'current_speed': np.array([-1, 0, 1]),
+    'speed': np.array([4, 6, 8])
+}
+
+
+class PowerTable:
+    '''
+        Surrogate model for the power estimation of mariPower.
+
+        The ship parameters are tabulated on a regular grid of the environmental conditions and the ship speed (see
+        POWER_TABLE_AXES). The table is generated once by evaluating mariPower in parallel processes (generate()),
+        written to a compressed netCDF file (write()) and read for the routing (from_file()). During the routing, the
+        ship parameters of all route variants are obtained by a single call of a multi-linear RegularGridInterpolator.
+        Conditions outside of the table are clipped to its boundaries.
+
+        The interpolation error is estimated from randomly sampled conditions between the grid points (validate()).
+        It is stored in the attributes of the table and reported whenever a table is loaded.
+    '''
+
+    table: xr.Dataset  # ship parameters on the grid of POWER_TABLE_AXES
+    interpolator: RegularGridInterpolator  # interpolates all POWER_TABLE_VARIABLES in one call
+
+    def __init__(self, table):
+        self.table = table.transpose(*POWER_TABLE_AXES)
+        grid = tuple(self.table[axis].to_numpy().astype(float) for axis in POWER_TABLE_AXES)
+        values = np.stack([self.table[var].to_numpy() for var in POWER_TABLE_VARIABLES], axis=-1)
+        self.interpolator = RegularGridInterpolator(grid, values, method='linear')
+
+    @classmethod
+    def from_file(cls, path):
+        logger.info(form.get_log_step('Reading power table from file: ' + path, 0))
+        power_table = cls(xr.load_dataset(path))
+        power_table.print_info()
+        return power_table
+
+    ##
+    # Generates the power table for the grid 'axes' (dict with one array per element of POWER_TABLE_AXES).
+    # 'evaluate' is called with an array of shape (n, len(POWER_TABLE_AXES)) of conditions and needs to return an
+    # array of shape (n, len(POWER_TABLE_VARIABLES)). The conditions are split into chunks that are evaluated in
+    # 'processes' parallel processes.
+    @classmethod
+    def generate(cls, evaluate, axes=None, processes=None, chunk_size=500, n_validation=200, attrs=None):
+        if axes is None:
+            axes = DEFAULT_POWER_TABLE_AXES
+        grid = [np.asarray(axes[axis], dtype=float) for axis in POWER_TABLE_AXES]
+        shape = tuple(axis.shape[0] for axis in grid)
+
+        conditions = np.stack([mesh.ravel() for mesh in np.meshgrid(*grid, indexing='ij')], axis=-1)
+        logger.info(form.get_log_step('Generating power table for ' + str(conditions.shape[0]) + ' conditions', 0))
+        values = evaluate_parallel(evaluate, conditions, processes, chunk_size)
+
+        data_vars = {}
+        for ivar, var in enumerate(POWER_TABLE_VARIABLES):
+            data_vars[var] = (POWER_TABLE_AXES, values[:, ivar].reshape(shape))
+        coords = {axis: values_axis for axis, values_axis in zip(POWER_TABLE_AXES, grid)}
+        power_table = cls(xr.Dataset(data_vars, coords, attrs))
+
+        if n_validation > 0:
+            power_table.validate(evaluate, n_validation, processes, chunk_size)
+        return power_table
+
+    ##
+    # Estimates the relative interpolation error for 'n' random conditions within the table boundaries and stores
+    # the mean and the maximum error per ship parameter in the attributes of the table.
+    def validate(self, evaluate, n, processes=None, chunk_size=500, seed=0):
+        rng = np.random.default_rng(seed)
+        lower = np.array([self.table[axis].to_numpy().min() for axis in POWER_TABLE_AXES])
+        upper = np.array([self.table[axis].to_numpy().max() for axis in POWER_TABLE_AXES])
+        conditions = lower + rng.random((n, len(POWER_TABLE_AXES))) * (upper - lower)
+
+        reference = evaluate_parallel(evaluate, conditions, processes, chunk_size)
+        interpolated = self.interpolator(conditions)
+
+        for ivar, var in enumerate(POWER_TABLE_VARIABLES):
+            rel_error = np.abs(interpolated[:, ivar] - reference[:, ivar]) / np.maximum(np.abs(reference[:, ivar]),
+                                                                                        1e-6)
+            self.table.attrs[var + '_rel_error_mean'] = np.nanmean(rel_error)
+            self.table.attrs[var + '_rel_error_max'] = np.nanmax(rel_error)
+        self.table.attrs['n_validation'] = n
+        self.print_info()
+
+    def write(self, path):
+        logger.info(form.get_log_step('Writing power table to file: ' + path, 0))
+        encoding = {var: {'dtype': 'float32', 'zlib': True} for var in POWER_TABLE_VARIABLES}
+        self.table.to_netcdf(path, encoding=encoding)
+
+    ##
+    # returns the ship parameters for 'conditions' (dict with one array per element of POWER_TABLE_AXES)
+    def evaluate(self, conditions):
+        points = np.stack([np.asarray(conditions[axis], dtype=float) for axis in POWER_TABLE_AXES], axis=-1)
+        for iaxis, axis in enumerate(POWER_TABLE_AXES):
+            grid = self.interpolator.grid[iaxis]
+            points[..., iaxis] = np.clip(points[..., iaxis], grid[0], grid[-1])
+
+        values = self.interpolator(points)
+        return {var: values[..., ivar] for ivar, var in enumerate(POWER_TABLE_VARIABLES)}
+
+    def print_info(self):
+        logger.info(form.get_log_step('Power table with ' + str(dict(self.table.sizes)) + ' grid points', 1))
+        if 'n_validation' not in self.table.attrs:
+            logger.warning('Interpolation error of power table unknown!')
+            return
+        for var in POWER_TABLE_VARIABLES:
+            error_mean = round(float(self.table.attrs[var + '_rel_error_mean']), 4)
+            error_max = round(float(self.table.attrs[var + '_rel_error_max']), 4)
+            logger.info(form.get_log_step('relative interpolation error ' + var + ': mean=' + str(error_mean) +
+                                          ', max=' + str(error_max) + ' (' + str(self.table.attrs['n_validation']) +
+                                          ' samples)', 1))
+
+
+def evaluate_parallel(evaluate, conditions, processes=None, chunk_size=500):
+    chunks = np.array_split(conditions, max(1, int(np.ceil(conditions.shape[0] / chunk_size))))
+    context = get_context()
+    with context.Pool(processes=processes) as pool:
+        values = pool.map(evaluate, chunks, chunksize=1)
+    return np.concatenate(values)
+
+
+##
+# indices of the elements of the sorted (ascending or descending) array 'axis' that are closest to 'values'
+def get_nearest_index(axis, values):
+    descending = axis.shape[0] > 1 and axis[0] > axis[-1]
+    if descending:
+        axis = axis[::-1]
+
+    idxs = np.clip(np.searchsorted(axis, values), 1, max(axis.shape[0] - 1, 1))
+    lower = axis[idxs - 1]
+    upper = axis[np.minimum(idxs, axis.shape[0] - 1)]
+    idxs = np.where(np.abs(values - lower) <= np.abs(upper - values), idxs - 1, idxs)
+
+    if descending:
+        idxs = axis.shape[0] - 1 - idxs
+    return idxs
+
+
+##
+# angle between the direction 'direction' and the course (both in degrees, 0 - 360°), folded to 0 - 180°
+def get_relative_angle(direction, courses):
+    return np.abs((direction - courses + 180) % 360 - 180)
+
+
+##
+# Returns the conditions of the power table for the courses (degrees) given the environmental data at the
+# corresponding positions: wind (u10, v10), waves (VHM0, VMDR, VTPK) and currents (utotal, vtotal).
+def get_power_table_conditions(courses, speed, u10, v10, VHM0, VMDR, VTPK, utotal, vtotal):
+    # meteorological convention: direction from which the wind is coming
+    wind_dir = np.degrees(np.arctan2(-u10, -v10)) % 360
+    courses_rad = np.radians(courses)
+
+    conditions = {
+        'wind_angle': get_relative_angle(wind_dir, courses),
+        'wind_speed': np.hypot(u10, v10),
+        'wave_angle': get_relative_angle(VMDR, courses),
+        'wave_height': VHM0,
+        'wave_period': VTPK,
+        'current_speed': utotal * np.sin(courses_rad) + vtotal * np.cos(courses_rad),
+        'speed': np.broadcast_to(speed, np.shape(courses))
+    }
+    return conditions
+
+
+##
+# Returns the background of the synthetic environmental data of the power table: the first two time steps, the first
+# latitude and the first two longitudes of the environmental data 'template', filled with the mean of every variable
+# over time, latitude and longitude. Variables that are not conditions of the power table (e.g. water temperature and
+# salinity) thus take typical values of the routing area.
+def get_power_table_background(template):
+    background = template.isel(time=slice(0, 2), latitude=slice(0, 1), longitude=slice(0, 2)).load()
+    for var in background.data_vars:
+        mean = template[var].mean([dim for dim in ['time', 'latitude', 'longitude'] if dim in template[var].dims])
+        background[var] = mean.broadcast_like(background[var]).transpose(*background[var].dims)
+    return background
+
+
+##
+# Returns the synthetic environmental data for the power table conditions 'conditions' (array of shape (n, 7)). Every
+# condition is assigned to a separate latitude of the 'background' (see get_power_table_background) such that a ship
+# at this latitude with a course of 0° experiences the condition:
+# - wind and waves are coming from the relative angles, the wind profile is uniform with height
+# - the current flows northwards (southwards for negative current speed)
+def get_power_table_environment(conditions, background):
+    n_conditions = conditions.shape[0]
+    environment = background.isel(latitude=np.zeros(n_conditions, dtype=int))
+    environment = environment.assign_coords(
+        latitude=background['latitude'].to_numpy()[0] + POWER_TABLE_GRID_STEP * np.arange(n_conditions))
+
+    wind_angle, wind_speed, wave_angle, wave_height, wave_period, current_speed, speed = conditions.T
+    wind_dir = np.radians(wind_angle)
+    values = {
+        'u-component_of_wind_height_above_ground': -wind_speed * np.sin(wind_dir),
+        'v-component_of_wind_height_above_ground': -wind_speed * np.cos(wind_dir),
+        'VMDR': wave_angle,
+        'VHM0': wave_height,
+        'VTPK': wave_period,
+        'utotal': np.zeros(n_conditions),
+        'vtotal': current_speed
+    }
+    for var, values_var in values.items():
+        environment[var] = xr.DataArray(values_var, dims=['latitude']).broadcast_like(environment[var]).transpose(
+            *environment[var].dims)
+    return environment
+
+
+##
+# Returns deep-water depth data on the grid of the synthetic environmental data 'environment'.
+def get_power_table_depth(environment):
+    depth = np.full((environment['latitude'].shape[0], environment['longitude'].shape[0]), -POWER_TABLE_DEPTH,
+                    dtype='float32')
+    return xr.Dataset(data_vars=dict(depth=(['latitude', 'longitude'], depth)),
+                      coords=dict(latitude=environment['latitude'].to_numpy(),
+                                  longitude=environment['longitude'].to_numpy()))
+
+
+##
+# Returns the 'courses netCDF' (see README) for the power table conditions 'conditions': one space point per
+# condition at the corresponding latitude of the synthetic environmental data 'environment' with a single course of
+# 0° and the speed of the condition.
+def get_power_table_courses(conditions, environment):
+    n_conditions = conditions.shape[0]
+    time = np.repeat(environment['time'].to_numpy()[0], n_conditions)
+    ds = xr.Dataset(
+        data_vars=dict(courses=(['it_pos', 'it_course'], np.zeros((n_conditions, 1))),
+                       speed=(['it_pos', 'it_course'], conditions[:, [6]]),
+                       lon=(['it_pos'], np.repeat(environment['longitude'].to_numpy()[0], n_conditions)),
+                       lat=(['it_pos'], environment['latitude'].to_numpy()), time=(['it_pos'], time)),
+        coords=dict(it_pos=np.arange(n_conditions) + 1, it_course=[1]))
+    return ds
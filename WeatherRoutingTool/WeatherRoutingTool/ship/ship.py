@@ -1,6 +1,9 @@
+import functools
 import logging
 import math
+import os
 import sys
+import weakref
 
 import datetime
 import matplotlib.pyplot as plt
@@ -15,6 +18,13 @@ import WeatherRoutingTool.utils.formatting as form
 import WeatherRoutingTool.utils.unit_conversion as units
 from mariPower import __main__
 from WeatherRoutingTool.utils.unit_conversion import knots_to_mps  # Convert  knot value in meter per second
+from WeatherRoutingTool.ship.maripower_pool import (MariPowerPool, copy_to_memory_dir, make_memory_dir,
+                                                    predict_via_file, remove_memory_dir)
+from WeatherRoutingTool.ship.power_cache import PowerCache
+from WeatherRoutingTool.ship.power_table import (PowerTable, get_nearest_index, get_power_table_background,
+                                                 get_power_table_conditions, get_power_table_courses,
+                                                 get_power_table_depth, get_power_table_environment,
+                                                 get_relative_angle)
 from WeatherRoutingTool.ship.shipparams import ShipParams
 from WeatherRoutingTool.weather import WeatherCond
 
@@ -27,7 +37,6 @@ logger = logging.getLogger('WRT.ship')
 
 class Boat:
     speed: float  # boat speed in m/s
-    simple_fuel_model: xr.Dataset  # xarray dataset containing
 
     def __init__(self):
         self.speed = -99
@@ -61,10 +70,16 @@ class Boat:
 # Steps 1), 3), and 5) are combined in the function
 #       -> Tanker.get_fuel_per_time_netCDF
 #
+# Alternatively (power_mode 'in_memory'), the same file-based interface of mariPower is used, but the 'courses netCDF'
+# and copies of the environmental and depth data are kept in a RAM-backed file system (tmpfs, see make_memory_dir)
+# instead of the (possibly network-mounted) paths of the configuration. The mariPower model is created once and the
+# results are read into memory directly. If a MariPowerPool is set, the courses are split between several worker
+# processes which keep their mariPower model for the whole routing.
+#       -> Tanker.get_fuel_in_memory
 #
-# Functions that are named something like *simple_fuel* are meant to be used as placeholders for the mariPower
-# package. They should only be used for
-# testing purposes.
+# For power_mode 'surrogate', mariPower is not called during the routing. Instead, the ship parameters are
+# interpolated from a table that has been generated with mariPower beforehand (see PowerTable).
+#       -> Tanker.get_fuel_surrogate
 
 class Tanker(Boat):
     # Boat properties
@@ -76,10 +91,32 @@ class Tanker(Boat):
     # additional information
     environment_path: str  # path to netCDF for environmental data
     courses_path: str  # path to netCDF which contains the power estimation per course
+    power_mode: str  # communication with mariPower, options: 'netCDF', 'in_memory', 'surrogate'
+    environment_data: xr.Dataset  # environmental data for surrogate
+    environment_grid: dict  # environmental data for surrogate as numpy arrays (time, latitude, longitude)
+    environment_coords: list  # time, latitude and longitude of environment_grid
+    memory_dir: str  # directory in a RAM-backed file system for power_mode 'in_memory'
+    environment_memory_path: str  # copy of the environmental data in memory_dir
+    depth_memory_path: str  # copy of the depth data in memory_dir
+    power_table: PowerTable  # surrogate for mariPower
+    maripower_pool: MariPowerPool  # worker processes for in-memory communication with mariPower (optional)
+    power_cache: PowerCache  # cache for the results of the power estimation (optional)
+    sfoc: float  # specific fuel oil consumption for surrogate (g/kWh)
 
     def __init__(self, rpm):
         Boat.__init__(self)
         self.rpm = rpm
+        self.power_mode = 'netCDF'
+        self.environment_data = None
+        self.memory_dir = None
+        self.environment_memory_path = None
+        self.depth_memory_path = None
+        self.power_table = None
+        self.maripower_pool = None
+        self.power_cache = None
+        self.sfoc = 200
+        self.environment_grid = None
+        self.environment_coords = None
 
     def print_init(self):
         logger.info(form.get_log_step('Boat speed' + str(self.speed), 1))
@@ -131,35 +168,50 @@ class Tanker(Boat):
     def set_courses_path(self, path):
         self.courses_path = path
 
+    ##
+    # sets the communication with mariPower; for 'in_memory', the environmental and depth data are copied to the
+    # RAM-backed file system immediately such that they are shared with worker processes that are created afterwards
+    def set_power_mode(self, mode):
+        if mode not in ['netCDF', 'in_memory', 'surrogate']:
+            raise ValueError('Option "' + mode + '" not implemented for the communication with mariPower!')
+        self.power_mode = mode
+        if mode == 'in_memory':
+            self.init_memory_dir()
+
+    ##
+    # creates the directory in the RAM-backed file system for power_mode 'in_memory' and copies the environmental and
+    # depth data to it; the directory is removed when the Tanker is deleted
+    def init_memory_dir(self):
+        if self.memory_dir is not None:
+            return
+        self.memory_dir = make_memory_dir()
+        weakref.finalize(self, remove_memory_dir, self.memory_dir, os.getpid())
+        self.environment_memory_path = copy_to_memory_dir(self.environment_path, self.memory_dir)
+        self.depth_memory_path = copy_to_memory_dir(self.depth_path, self.memory_dir)
+
+    def set_power_table(self, power_table):
+        self.power_table = power_table
+        if 'sfoc' in power_table.table.attrs:
+            self.sfoc = power_table.table.attrs['sfoc']
+
+    def set_maripower_pool(self, maripower_pool):
+        self.maripower_pool = maripower_pool
+
+    def set_power_cache(self, power_cache):
+        self.power_cache = power_cache
+
+    ##
+    # settings of the ship that determine the result of the power estimation besides the requested courses, positions,
+    # times and speed (used to invalidate the power cache)
+    def get_power_settings(self):
+        return {'ship': type(self).__name__, 'power_mode': self.power_mode, 'rpm': self.rpm, 'sfoc': self.sfoc}
+
     def set_rpm(self, rpm):
         self.rpm = rpm
 
     def get_rpm(self):
         return self.rpm
 
-    ##
-    # function that implements a dummy model for the estimation of the fuel consumption. Only to be used for code
-    # testing, for which it minimises excecution time. Does not provide fully accurate estimations. Take care to
-    # initialise the simple model using
-    # calibrate_simple_fuel()
-    def get_fuel_per_course_simple(self, course, wind_speed, wind_dir):
-        debug = False
-        angle = np.abs(course - wind_dir)
-        if angle > 180:
-            angle = np.abs(360 - angle)
-        if debug:
-            form.print_line()
-            form.print_step('course = ' + str(course), 1)
-            form.print_step('wind_speed = ' + str(wind_speed), 1)
-            form.print_step('wind_dir = ' + str(wind_dir), 1)
-            form.print_step('delta angle = ' + str(angle), 1)
-        wind_speed = wind_speed
-        power = self.simple_fuel_model.interp(delta_angle=angle, wind_speed=wind_speed)['power'].to_numpy()
-
-        if debug:
-            form.print_step('power = ' + str(power), 1)
-        return power
-
     # def get_fuel_per_time_simple(self, delta_time):
     #    f = 0.0007 * self.rpm ** 3 + 0.0297 * self.rpm ** 2 + 2.8414 * self.rpm - 19.359  # fuel [kg/h]
     #    f *= delta_time / 3600 * 1 / 1000  # amount of fuel for this time interval
@@ -186,68 +238,18 @@ class Tanker(Boat):
         return ptemp
 
     ##
-    # initialisation of simple fuel model that is used as dummy for accurate power estimation via mariPower
-    def calibrate_simple_fuel(self):
-        self.simple_fuel_model = xr.open_dataset(
-            "/home/kdemmich/MariData/Code/MariGeoRoute/Isochrone/Data/SimpleFuelModel/simple_fuel_model.nc")
-        form.print_line()
-        print('Initialising simple fuel model')
-        print(self.simple_fuel_model)
-
-    ##
-    # function to write a simple fuel model to file which can be used as dummy for the power estimation with
-    # mariPower. The
-    # model only considers wind speed and angle as well as the boat speed. 'n_angle' times 'n_wind_speed' pairs of
-    # wind speed and wind angle
-    # are generated and send to mariPower. The calculated power consumption and wind data are written to file and can
-    # in the following be used as input for Tanker.calibrate_simple_fuel.
-    def write_simple_fuel(self):
-        n_angle = 10
-        n_wind_speed = 20
-        power = np.zeros((n_angle, n_wind_speed))
-        delta_angle = units.get_bin_centers(0, 180, n_angle)
-        wind_speed = units.get_bin_centers(0, 60, n_wind_speed)
-
-        coords = dict(delta_angle=(["delta_angle"], delta_angle), wind_speed=(["wind_speed"], wind_speed), )
-        attrs = dict(description="Necessary descriptions added here.")
-
-        for iang in range(0, n_angle):
-            for iwind_speed in range(0, n_wind_speed):
-                course = 0
-                wind_dir = 0 + delta_angle[iang]
-                power[iang, iwind_speed] = self.get_fuel_per_course(course, wind_dir, wind_speed[iwind_speed],
-                                                                    self.speed)
-
-        data_vars = dict(power=(["delta_angle", "wind_speed"], power), )
-
-        ds = xr.Dataset(data_vars, coords, attrs)
-        ds.to_netcdf('/home/kdemmich/MariData/Code/simple_fuel_model.nc')
-
-        print('Writing simple fuel model:')
-        print(ds)
-
-    ##
-    # Initialise power estimation for a tuple of courses in dependence on wind speed and direction. The information
-    # is send to mariPower per course.
+    # Returns the brake power for the courses (degrees) in dependence on wind speed and direction ('tws', 'twa') using
+    # the power table for calm sea without currents.
     def get_fuel_per_time(self, courses, wind):
-        debug = False
-
-        if (debug):
-            print('Requesting power calculation')
-            course_str = 'Courses:' + str(courses)
-            form.print_step(course_str, 1)
+        if self.power_table is None:
+            raise ValueError('No power table available for the power estimation from wind data!')
 
-        P = np.zeros(courses.shape)
-        for icours in range(0, courses.shape[0]):
-            # P[icours] = self.get_fuel_per_course(courses[icours], wind['twa'][icours], wind['tws'][icours],
-            # self.speed)
-            P[icours] = self.get_fuel_per_course_simple(courses[icours], wind['tws'][icours], wind['twa'][icours])
-            if math.isnan(P[icours]):
-                P[icours] = 1000000000000000
-
-        if (debug):
-            form.print_step('power consumption' + str(P))
-        return P
+        wind_speed = np.broadcast_to(wind['tws'], np.shape(courses))
+        zeros = np.zeros(np.shape(courses))
+        conditions = {'wind_angle': get_relative_angle(wind['twa'], courses), 'wind_speed': wind_speed,
+                      'wave_angle': zeros, 'wave_height': zeros, 'wave_period': zeros, 'current_speed': zeros,
+                      'speed': np.broadcast_to(self.speed, np.shape(courses))}
+        return self.power_table.evaluate(conditions)['power']
 
     ##
     # Writes netCDF which stores courses in dependence on latitude, longitude and time for further processing by
@@ -257,8 +259,17 @@ class Tanker(Boat):
     #   courses = {c1, c2, c3}
     #   lats = {lat1, lat1, lat1}
     #   lons = {lon1, lon1, lon1}
+    # If 'unique_coords' is True, the arrays are given per course as above and 'n_coords' is the number of coordinate
+    # pairs. If 'n_coords' is not provided, it is derived from the number of unique longitudes.
 
-    def write_netCDF_courses(self, courses, lats, lons, time, unique_coords=False):
+    def write_netCDF_courses(self, courses, lats, lons, time, unique_coords=False, n_coords=None):
+        ds = self.get_netCDF_courses(courses, lats, lons, time, unique_coords, n_coords)
+        ds.to_netcdf(self.courses_path + str())
+        ds.close()
+
+    ##
+    # Returns the xarray dataset with the structure of the 'courses netCDF' (see README) without writing it to disk.
+    def get_netCDF_courses(self, courses, lats, lons, time, unique_coords=False, n_coords=None):
         debug = False
         speed = np.repeat(self.speed, courses.shape, axis=0)
         courses = units.degree_to_pmpi(courses)
@@ -275,59 +286,34 @@ class Tanker(Boat):
             form.print_step(lons_str, 1)
             form.print_step(course_str, 1)
             form.print_step(speed_str, 1)
-        n_coords = None
         if unique_coords:
-            it = sorted(np.unique(lons, return_index=True)[1])
+            if n_coords is None:
+                n_coords = np.unique(lons).shape[0]
+            it = np.arange(n_coords) * (courses.shape[0] // n_coords)
             lons = lons[it]
             lats = lats[it]
-            n_coords = lons.shape[0]
         else:
             n_coords = lons.shape[0]
         # number or coordinate pairs
         n_courses = int(courses.shape[0] / n_coords)  # number of courses per coordinate pair
 
-        # generate iterator for courses and coordinate pairs
-        it_course = np.arange(n_courses) + 1  # get iterator with a length of the number of unique longitude values
-        it_course = np.hstack(
-            (it_course,) * n_coords)  # prepare iterator for Data Frame: repeat each element as often as
-        it_pos = np.arange(n_coords) + 1
-        it_pos = np.repeat(it_pos, n_courses)  # np.hstack((it_pos,) * n_courses)
-
-        if (debug):
-            form.print_step('it_course=' + str(it_course))
-            form.print_step('it_pos=' + str(it_pos))
-
-        assert courses.shape == it_pos.shape
-        assert courses.shape == it_course.shape
+        assert courses.shape[0] == n_coords * n_courses
         assert courses.shape == speed.shape
 
-        # generate pandas DataFrame
-        df = pd.DataFrame({'it_pos': it_pos, 'it_course': it_course, 'courses': courses, 'speed': speed, })
-
-        df = df.set_index(['it_pos', 'it_course'])
-        if (debug):
-            print('pandas DataFrame:', df)
-
-        ds = df.to_xarray()
-
-        time_reshape = time.reshape(ds['it_pos'].shape[0], ds['it_course'].shape[0])[:, 0]
+        # the courses of one coordinate pair are stored consecutively, i.e. courses[it_pos * n_courses + it_course]
+        time_reshape = time.reshape(n_coords, n_courses)[:, 0]
+        ds = xr.Dataset(
+            data_vars=dict(courses=(['it_pos', 'it_course'], courses.reshape(n_coords, n_courses)),
+                           speed=(['it_pos', 'it_course'], speed.reshape(n_coords, n_courses)),
+                           lon=(['it_pos'], lons), lat=(['it_pos'], lats), time=(['it_pos'], time_reshape)),
+            coords=dict(it_pos=np.arange(n_coords) + 1, it_course=np.arange(n_courses) + 1))
 
         print('Request power calculation for ' + str(n_courses) + ' courses and ' + str(n_coords) + ' coordinates')
 
-        ds["lon"] = (['it_pos'], lons)
-        ds["lat"] = (['it_pos'], lats)
-        ds["time"] = (['it_pos'], time_reshape)
-        assert ds['lon'].shape == ds['lat'].shape
-        assert ds['time'].shape == ds['lat'].shape
-
         if (debug):
             print('xarray DataSet', ds)
 
-        ds.to_netcdf(self.courses_path + str())
-        if (debug):
-            ds_read = xr.open_dataset(self.courses_path)
-            print('read data set', ds_read)
-        ds.close()
+        return ds
 
     ##
     # extracts power from 'courses netCDF' which has been written by mariPower and returns it as 1D array.
@@ -451,13 +437,101 @@ class Tanker(Boat):
         return ds_merged
 
     ##
-    # main function for communication with mariPower package (see documentation above)
-    def get_fuel_per_time_netCDF(self, courses, lats, lons, time, unique_coords=False):
-        self.write_netCDF_courses(courses, lats, lons, time, unique_coords)
+    # Requests the estimation of the power consumption for the courses dataset 'ds' via the file-based interface of
+    # mariPower. The 'courses netCDF' and the environmental and depth data, which are copied on the first request, are
+    # kept in a RAM-backed file system. If a MariPowerPool is set, the request is distributed to its worker processes
+    # instead. Returns the courses dataset with the ship parameters added by mariPower.
+    def get_fuel_in_memory(self, ds):
+        if self.maripower_pool is not None:
+            return self.maripower_pool.predict(ds)
+
+        self.init_memory_dir()
+
+        # the file name is taken from courses_path which is separate for every task of the RoutingPool
+        courses_path = os.path.join(self.memory_dir, os.path.basename(self.courses_path))
+        return predict_via_file(self.hydro_model, ds, courses_path, self.environment_memory_path,
+                                self.depth_memory_path)
+
+    ##
+    # Returns the environmental data that are needed for the power table at the positions (lats, lons, time) using
+    # the nearest grid points of the environmental data. The data are read into memory on the first call. Missing data
+    # (e.g. waves close to the coast) are treated as calm conditions.
+    def get_environment_per_point(self, lats, lons, time):
+        if self.environment_grid is None:
+            if self.environment_data is None:
+                self.environment_data = xr.open_dataset(self.environment_path)
+            ds = self.environment_data
+            wind = ds[['u-component_of_wind_height_above_ground', 'v-component_of_wind_height_above_ground']].sel(
+                height_above_ground2=10, method='nearest')
+            self.environment_grid = {var: np.nan_to_num(ds[var].transpose('time', 'latitude', 'longitude').to_numpy())
+                                     for var in ['VHM0', 'VMDR', 'VTPK', 'utotal', 'vtotal']}
+            self.environment_grid['u10'] = np.nan_to_num(wind['u-component_of_wind_height_above_ground'].transpose(
+                'time', 'latitude', 'longitude').to_numpy())
+            self.environment_grid['v10'] = np.nan_to_num(wind['v-component_of_wind_height_above_ground'].transpose(
+                'time', 'latitude', 'longitude').to_numpy())
+            self.environment_coords = [ds['time'].to_numpy(), ds['latitude'].to_numpy(), ds['longitude'].to_numpy()]
+
+        itime = get_nearest_index(self.environment_coords[0], np.asarray(time, dtype=self.environment_coords[0].dtype))
+        ilat = get_nearest_index(self.environment_coords[1], lats)
+        ilon = get_nearest_index(self.environment_coords[2], lons)
+        return {var: values[itime, ilat, ilon] for var, values in self.environment_grid.items()}
+
+    ##
+    # Interpolates the ship parameters for all courses from the power table. The fuel consumption is derived from the
+    # brake power via the specific fuel oil consumption. Resistances are not provided by the power table.
+    def get_fuel_surrogate(self, courses, lats, lons, time):
+        if self.power_table is None:
+            raise ValueError('No power table available for the surrogate power estimation!')
+        env = self.get_environment_per_point(lats, lons, time)
+        conditions = get_power_table_conditions(courses, self.speed, **env)
+        values = self.power_table.evaluate(conditions)
+
+        power = values['power']
+        fuel = power * self.sfoc / (3.6 * 10 ** 9)  # W * g/kWh -> kg/s
+        not_available = np.full(power.shape, -99.)
+        ship_params = ShipParams(fuel=fuel, power=power, rpm=values['rpm'],
+                                 speed=np.repeat(self.speed, power.shape, axis=0), r_wind=not_available,
+                                 r_calm=not_available, r_waves=not_available, r_shallow=not_available,
+                                 r_roughness=not_available)
+        return ship_params
+
+    ##
+    # Generates a power table by evaluating mariPower for all conditions of the grid 'axes' (see PowerTable.generate)
+    # in parallel processes. Variables of the environmental data that are not conditions of the power table take their
+    # mean values in the environmental data of the Tanker (see get_power_table_background).
+    def generate_power_table(self, axes=None, processes=None, chunk_size=500, n_validation=200):
+        with xr.open_dataset(self.environment_path) as template:
+            background = get_power_table_background(template)
+        evaluate = functools.partial(get_power_table_values, background=background)
+        power_table = PowerTable.generate(evaluate, axes=axes, processes=processes, chunk_size=chunk_size,
+                                          n_validation=n_validation, attrs={'sfoc': self.sfoc})
+        return power_table
+
+    ##
+    # main function for communication with mariPower package (see documentation above). If a power cache is set, only
+    # requests that are not cached are passed to the power estimation. For 'unique_coords' and 'n_coords' see
+    # Tanker.get_netCDF_courses.
+    def get_fuel_per_time_netCDF(self, courses, lats, lons, time, unique_coords=False, n_coords=None):
+        if self.power_cache is not None:
+            if unique_coords and n_coords is None:
+                n_coords = np.unique(lons).shape[0]
+            return self.power_cache.get_ship_params(self.get_fuel_per_time_uncached, courses, lats, lons, time,
+                                                    self.speed, n_coords if unique_coords else None)
+        return self.get_fuel_per_time_uncached(courses, lats, lons, time, unique_coords, n_coords)
+
+    def get_fuel_per_time_uncached(self, courses, lats, lons, time, unique_coords=False, n_coords=None):
+        if self.power_mode == 'surrogate':
+            return self.get_fuel_surrogate(courses, lats, lons, time)
+
+        if self.power_mode == 'in_memory':
+            ds = self.get_fuel_in_memory(self.get_netCDF_courses(courses, lats, lons, time, unique_coords, n_coords))
+        else:
+            self.write_netCDF_courses(courses, lats, lons, time, unique_coords, n_coords)
+
+            # ds = self.get_fuel_netCDF_loop()
+            # ds = self.get_fuel_netCDF_dummy(ds, courses, wind)
+            ds = self.get_fuel_netCDF()
 
-        # ds = self.get_fuel_netCDF_loop()
-        # ds = self.get_fuel_netCDF_dummy(ds, courses, wind)
-        ds = self.get_fuel_netCDF()
         ship_params = self.extract_params_from_netCDF(ds)
         ds.close()
 
@@ -529,3 +603,26 @@ class Tanker(Boat):
         plt.xlabel('speed (m/s)')
         plt.ylabel('power (W)')
         plt.show()
+
+
+##
+# Evaluates mariPower for the conditions of the power table via its file-based interface. 'conditions' is an array of
+# shape (n, 7) with columns in the order of POWER_TABLE_AXES. All conditions are passed to mariPower in one request:
+# the synthetic environmental and depth data provide one grid point per condition (see get_power_table_environment)
+# and the 'courses netCDF' one space point with a course of 0° per condition. The files are kept in a RAM-backed file
+# system and removed afterwards.
+def get_power_table_values(conditions, background):
+    memory_dir = make_memory_dir()
+    try:
+        environment = get_power_table_environment(conditions, background)
+        environment_path = os.path.join(memory_dir, 'environment.nc')
+        depth_path = os.path.join(memory_dir, 'depth.nc')
+        environment.to_netcdf(environment_path)
+        get_power_table_depth(environment).to_netcdf(depth_path)
+
+        ds = predict_via_file(mariPower.ship.CBT(), get_power_table_courses(conditions, environment),
+                              os.path.join(memory_dir, 'courses.nc'), environment_path, depth_path)
+        values = np.stack([ds['Power_brake'].to_numpy().flatten(), ds['RotationRate'].to_numpy().flatten()], axis=-1)
+    finally:
+        remove_memory_dir(memory_dir, os.getpid())
+    return values
@@ -1,31 +1,63 @@
 import numpy as np
 
+# names of the per-step ship parameters in the order of the arguments of ShipParams.__init__
+SHIPPARAMS_VARIABLES = ['fuel', 'power', 'rpm', 'speed', 'r_calm', 'r_wind', 'r_waves', 'r_shallow', 'r_roughness']
+
 
 class ShipParams():
-    fuel: np.ndarray  # (kg)
-    power: np.ndarray  # (W)
-    rpm: np.ndarray  # (Hz)
-    speed: np.ndarray  # (m/s)
-    r_calm: np.ndarray  # (N)
-    r_wind: np.ndarray  # (N)
-    r_waves: np.ndarray  # (N)
-    r_shallow: np.ndarray  # (N)
-    r_roughness: np.ndarray  # (N)
+    '''
+        Ship parameters (fuel, power, rpm, ...) of several route variants and/or routing steps.
+
+        All parameters are stored in a single array 'data' whose first axis runs over SHIPPARAMS_VARIABLES, i.e.
+        data[0] holds the fuel, data[1] the power etc. The attributes fuel, power, rpm, ... and the corresponding
+        getters return views into this array. Thus, selecting, flipping or repeating variants is a single operation on
+        'data' for all parameters. Parameters that are not available can be passed as empty arrays; they are set to
+        NaN.
+    '''
+
+    __slots__ = ('data', 'fuel_type')
+
+    data: np.ndarray  # ship parameters, shape (len(SHIPPARAMS_VARIABLES),) + shape of a single parameter
     fuel_type: str
 
-    def __init__(self, fuel, power, rpm, speed, r_calm, r_wind, r_waves, r_shallow, r_roughness):
-        self.fuel = fuel
-        self.power = power
-        self.rpm = rpm
-        self.speed = speed
-        self.r_calm = r_calm
-        self.r_wind = r_wind
-        self.r_waves = r_waves
-        self.r_shallow = r_shallow
-        self.r_roughness = r_roughness
+    # units: fuel (kg), power (W), rpm (Hz), speed (m/s), r_calm, r_wind, r_waves, r_shallow, r_roughness (N)
 
+    def __init__(self, fuel, power, rpm, speed, r_calm, r_wind, r_waves, r_shallow, r_roughness):
+        self.data = stack_variables([fuel, power, rpm, speed, r_calm, r_wind, r_waves, r_shallow, r_roughness])
         self.fuel_type = 'HFO'
 
+    ##
+    # creates ShipParams from an array with the parameters in the order of SHIPPARAMS_VARIABLES along the first axis
+    # without copying the array
+    @classmethod
+    def from_array(cls, data, fuel_type='HFO'):
+        ship_params = cls.__new__(cls)
+        ship_params.data = data
+        ship_params.fuel_type = fuel_type
+        return ship_params
+
+    def set_variable(self, var, value):
+        ivar = SHIPPARAMS_VARIABLES.index(var)
+        value = np.asarray(value)
+        if value.shape != self.data.shape[1:]:
+            fields = [self.data[i] for i in range(0, len(SHIPPARAMS_VARIABLES))]
+            fields[ivar] = value
+            self.data = stack_variables(fields)
+            return
+        if np.result_type(self.data, value) != self.data.dtype:
+            self.data = self.data.astype(np.result_type(self.data, value))
+        self.data[ivar] = value
+
+    fuel = property(lambda self: self.data[0], lambda self, value: self.set_variable('fuel', value))
+    power = property(lambda self: self.data[1], lambda self, value: self.set_variable('power', value))
+    rpm = property(lambda self: self.data[2], lambda self, value: self.set_variable('rpm', value))
+    speed = property(lambda self: self.data[3], lambda self, value: self.set_variable('speed', value))
+    r_calm = property(lambda self: self.data[4], lambda self, value: self.set_variable('r_calm', value))
+    r_wind = property(lambda self: self.data[5], lambda self, value: self.set_variable('r_wind', value))
+    r_waves = property(lambda self: self.data[6], lambda self, value: self.set_variable('r_waves', value))
+    r_shallow = property(lambda self: self.data[7], lambda self, value: self.set_variable('r_shallow', value))
+    r_roughness = property(lambda self: self.data[8], lambda self, value: self.set_variable('r_roughness', value))
+
     @classmethod
     def set_default_array(cls):
         return cls(speed=np.array([[0]]), fuel=np.array([[0]]), power=np.array([[0]]), rpm=np.array([[0]]),
@@ -68,15 +100,7 @@ class ShipParams():
         print('r_roughness: ', self.r_roughness.shape)
 
     def define_variants(self, variant_segments):
-        self.speed = np.repeat(self.speed, variant_segments + 1, axis=1)
-        self.fuel = np.repeat(self.fuel, variant_segments + 1, axis=1)
-        self.power = np.repeat(self.power, variant_segments + 1, axis=1)
-        self.rpm = np.repeat(self.rpm, variant_segments + 1, axis=1)
-        self.r_calm = np.repeat(self.r_calm, variant_segments + 1, axis=1)
-        self.r_wind = np.repeat(self.r_wind, variant_segments + 1, axis=1)
-        self.r_waves = np.repeat(self.r_waves, variant_segments + 1, axis=1)
-        self.r_shallow = np.repeat(self.r_shallow, variant_segments + 1, axis=1)
-        self.r_roughness = np.repeat(self.r_roughness, variant_segments + 1, axis=1)
+        self.data = np.repeat(self.data, variant_segments + 1, axis=2)
 
     def get_power(self):
         return self.power
@@ -136,70 +160,20 @@ class ShipParams():
         self.r_roughness = new_rroughnes
 
     def select(self, idxs):
-        self.speed = self.speed[:, idxs]
-        self.fuel = self.fuel[:, idxs]
-        self.power = self.power[:, idxs]
-        self.rpm = self.rpm[:, idxs]
-        self.r_wind = self.r_wind[:, idxs]
-        self.r_calm = self.r_calm[:, idxs]
-        self.r_waves = self.r_waves[:, idxs]
-        self.r_shallow = self.r_shallow[:, idxs]
-        self.r_roughness = self.r_roughness[:, idxs]
+        self.data = self.data[:, :, idxs]
 
     def flip(self):
         # should be replaced by more careful implementation
-        self.speed = self.speed[:-1]
-        self.fuel = self.fuel[:-1]
-        self.power = self.power[:-1]
-        self.rpm = self.rpm[:-1]
-        self.r_wind = self.r_wind[:-1]
-        self.r_calm = self.r_calm[:-1]
-        self.r_waves = self.r_waves[:-1]
-        self.r_shallow = self.r_shallow[:-1]
-        self.r_roughness = self.r_roughness[:-1]
-
-        self.speed = np.flip(self.speed, 0)
-        self.fuel = np.flip(self.fuel, 0)
-        self.power = np.flip(self.power, 0)
-        self.rpm = np.flip(self.rpm, 0)
-        self.r_wind = np.flip(self.r_wind, 0)
-        self.r_calm = np.flip(self.r_calm, 0)
-        self.r_waves = np.flip(self.r_waves, 0)
-        self.r_shallow = np.flip(self.r_shallow, 0)
-        self.r_roughness = np.flip(self.r_roughness, 0)
-
-        self.speed = np.append(self.speed, -99)
-        self.fuel = np.append(self.fuel, -99)
-        self.power = np.append(self.power, -99)
-        self.rpm = np.append(self.rpm, -99)
-        self.r_wind = np.append(self.r_wind, -99)
-        self.r_calm = np.append(self.r_calm, -99)
-        self.r_waves = np.append(self.r_waves, -99)
-        self.r_shallow = np.append(self.r_shallow, -99)
-        self.r_roughness = np.append(self.r_roughness, -99)
+        nvars = self.data.shape[0]
+        flipped = np.flip(self.data[:, :-1], 1).reshape(nvars, -1)
+        self.data = np.concatenate([flipped, np.full((nvars, 1), -99, dtype=flipped.dtype)], axis=1)
 
     def expand_axis_for_intermediate(self):
-        self.speed = np.expand_dims(self.speed, axis=1)
-        self.fuel = np.expand_dims(self.fuel, axis=1)
-        self.power = np.expand_dims(self.power, axis=1)
-        self.rpm = np.expand_dims(self.rpm, axis=1)
-        self.r_wind = np.expand_dims(self.r_wind, axis=1)
-        self.r_calm = np.expand_dims(self.r_calm, axis=1)
-        self.r_waves = np.expand_dims(self.r_waves, axis=1)
-        self.r_shallow = np.expand_dims(self.r_shallow, axis=1)
-        self.r_roughness = np.expand_dims(self.r_roughness, axis=1)
+        self.data = np.expand_dims(self.data, axis=2)
 
     def get_element(self, idx):
         try:
-            speed = self.speed[idx]
-            fuel = self.fuel[idx]
-            power = self.power[idx]
-            rpm = self.rpm[idx]
-            r_wind = self.r_wind[idx]
-            r_calm = self.r_calm[idx]
-            r_waves = self.r_waves[idx]
-            r_shallow = self.r_shallow[idx]
-            r_roughness = self.r_roughness[idx]
+            fuel, power, rpm, speed, r_calm, r_wind, r_waves, r_shallow, r_roughness = self.data[:, idx]
         except ValueError:
             raise ValueError(
                 'Index ' + str(idx) + ' is not available for array with length ' + str(self.speed.shape[0]))
@@ -207,19 +181,20 @@ class ShipParams():
 
     def get_single_object(self, idx):
         try:
-            speed = self.speed[idx]
-            fuel = self.fuel[idx]
-            power = self.power[idx]
-            rpm = self.rpm[idx]
-            r_wind = self.r_wind[idx]
-            r_calm = self.r_calm[idx]
-            r_waves = self.r_waves[idx]
-            r_shallow = self.r_shallow[idx]
-            r_roughness = self.r_roughness[idx]
+            data = self.data[:, idx]
         except ValueError:
             raise ValueError(
                 'Index ' + str(idx) + ' is not available for array with length ' + str(self.speed.shape[0]))
-
-        sp = ShipParams(fuel=fuel, power=power, rpm=rpm, speed=speed, r_wind=r_wind, r_calm=r_calm, r_waves=r_waves,
-                        r_shallow=r_shallow, r_roughness=r_roughness)
-        return sp
+        return ShipParams.from_array(data, self.fuel_type)
+
+
+##
+# stacks the ship parameters along a new first axis; empty arrays are replaced by NaN in the shape of the others
+def stack_variables(fields):
+    fields = [np.asarray(field) for field in fields]
+    available = [field for field in fields if field.size > 0]
+    if len(available) == 0:
+        return np.stack(fields)
+    shape = np.broadcast_shapes(*[field.shape for field in available])
+    fields = [np.broadcast_to(field, shape) if field.size > 0 else np.full(shape, np.nan) for field in fields]
+    return np.stack(fields)
@@ -48,6 +48,8 @@ class NumpyArrayEncoder(JSONEncoder):
         if isinstance(obj, (datetime.date, datetime.datetime)):
             obj_str = obj.strftime("%Y-%m-%d %H:%M:%S")
             return obj_str
+        if isinstance(obj, numpy.datetime64):
+            return self.default(obj.astype('datetime64[s]').astype(datetime.datetime))
         if isinstance(obj, numpy.int64):
             return str(obj)
         if isinstance(obj, numpy.int32):
@@ -0,0 +1,36 @@
+import logging
+import multiprocessing
+import threading
+
+logger = logging.getLogger('WRT.processes')
+
+START_METHODS = ['fork', 'forkserver', 'spawn']
+
+# start method of the worker processes of the WRT (RoutingPool, MariPowerPool, PowerTable.generate); None: automatic
+start_method = None
+
+
+##
+# Sets the start method of the worker processes (options: 'fork', 'forkserver', 'spawn', None). With None, 'fork' is
+# used where it is available and safe, i.e. if the current process runs no other threads, and 'spawn' otherwise.
+def set_start_method(method):
+    global start_method
+    if method is not None and method not in START_METHODS:
+        raise ValueError('Start method "' + str(method) + '" not implemented for the worker processes!')
+    start_method = method
+
+
+##
+# Returns the multiprocessing context for worker processes. If the configured start method is not available on the
+# current platform (e.g. 'fork' on Windows), the automatic choice is used instead.
+def get_context():
+    available = multiprocessing.get_all_start_methods()
+    if start_method is not None:
+        if start_method in available:
+            return multiprocessing.get_context(start_method)
+        logger.warning('Start method "' + start_method + '" not available on this platform, using automatic choice')
+
+    # forking a process that runs several threads may deadlock the child process (deprecated since Python 3.12)
+    if 'fork' in available and threading.active_count() == 1:
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
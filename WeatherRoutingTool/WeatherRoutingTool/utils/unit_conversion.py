@@ -59,6 +59,14 @@ def convert_nptd64_to_h(time):
     return time
 
 
+def convert_nptd64_to_s(time):
+    return time / np.timedelta64(1, 's')
+
+
+def convert_s_to_nptd64(seconds):
+    return np.round(seconds).astype('timedelta64[s]')
+
+
 def convert_nptd64_to_ints(time):
     dt64 = np.datetime64(time)
     ts = (dt64 - np.datetime64('1970-01-01T00:00:00Z')) / np.timedelta64(1, 's')
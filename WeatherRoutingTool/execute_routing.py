@@ -6,11 +6,16 @@ import logging.handlers
 
 import WeatherRoutingTool.utils.graphics as graphics
 from WeatherRoutingTool.config import Config
+from WeatherRoutingTool.ship.maripower_pool import MariPowerPool
+from WeatherRoutingTool.ship.power_cache import PowerCache, get_power_cache_hash
 from WeatherRoutingTool.ship.ship import Tanker
+from WeatherRoutingTool.ship.power_table import PowerTable
 from WeatherRoutingTool.weather_factory import WeatherFactory
 from WeatherRoutingTool.constraints.constraints import *
 from WeatherRoutingTool.algorithms.routingalg_factory import *
+from WeatherRoutingTool.algorithms.routing_pool import RoutingPool, get_route_ranking, write_routes
 from WeatherRoutingTool.utils.maps import Map
+from WeatherRoutingTool.utils.processes import set_start_method
 
 
 def merge_figures_to_gif(path, nof_figures):
@@ -65,6 +70,26 @@ if __name__ == "__main__":
     departure_time = dt.datetime.strptime(config.DEPARTURE_TIME, '%Y-%m-%dT%H:%MZ')
     default_map = Map(lat1, lon1, lat2, lon2)
 
+    # *******************************************
+    # routing tasks that are executed in parallel (routing jobs or departure-time sweep)
+    routing_algs = []
+    jobs = None
+    if config.ROUTING_JOBS:
+        routing_algs = RoutingAlgFactory.get_routing_jobs(config)
+        jobs = config.ROUTING_JOBS
+        labels = [job.get('NAME', 'job' + str(ijob)) for ijob, job in enumerate(jobs)]
+        label_name = 'name'
+    elif config.DEPARTURE_TIME_SWEEP:
+        routing_algs = RoutingAlgFactory.get_departure_sweep(config)
+        labels = [ra.departure_time.strftime('%Y%m%dT%H%M') for ra in routing_algs]
+        label_name = 'departure_time'
+
+    # the weather data needs to cover all departure times
+    if routing_algs:
+        departure_times = [ra.departure_time for ra in routing_algs]
+        departure_time = min(departure_times)
+        time_forecast = time_forecast + (max(departure_times) - departure_time).total_seconds() / 3600
+
     # *******************************************
     # initialise weather
     #
@@ -81,9 +106,21 @@ if __name__ == "__main__":
 
     # *******************************************
     # initialise boat
+    set_start_method(config.PROCESS_START_METHOD)
     boat = Tanker(-99)
     boat.init_hydro_model_Route(windfile, coursesfile, depthfile)
     boat.set_boat_speed(config.BOAT_SPEED)
+    boat.set_power_mode(config.MARIPOWER_MODE)
+    if config.MARIPOWER_MODE == 'surrogate' or config.MULTI_FIDELITY_DEPTH > 0:
+        boat.set_power_table(PowerTable.from_file(config.POWER_TABLE_FILE))
+    power_cache = None
+    if config.POWER_CACHE_SIZE > 0:
+        power_cache = PowerCache(config.POWER_CACHE_SIZE, get_power_cache_hash([windfile, depthfile],
+                                                                               boat.get_power_settings()),
+                                 config.POWER_CACHE_TOLERANCES)
+        if config.POWER_CACHE_FILE is not None:
+            power_cache.read(config.POWER_CACHE_FILE)
+        boat.set_power_cache(power_cache)
 
     # *******************************************
     # initialise constraints
@@ -108,17 +145,46 @@ if __name__ == "__main__":
     water_depth = WaterDepth(config.DATA_MODE, config.BOAT_DRAUGHT, default_map, depthfile)
     constraint_list = ConstraintsListFactory.get_constraints_list(
         constraints_string_list=config.CONSTRAINTS_LIST, data_mode=config.DATA_MODE, boat_draught=config.BOAT_DRAUGHT,
-        map_size=default_map, depthfile=depthfile, waypoints=config.INTERMEDIATE_WAYPOINTS)
-
-    # *******************************************
-    # initialise route
-    min_fuel_route = RoutingAlgFactory.get_routing_alg(config)
-    min_fuel_route.init_fig(water_depth, default_map)
-
-    # *******************************************
-    # routing
-    min_fuel_route = min_fuel_route.execute_routing(boat, wt, constraint_list)
-    # min_fuel_route.print_route()
-    # min_fuel_route.write_to_file(str(min_fuel_route.route_type) +
-    # "route.json")
-    min_fuel_route.return_route_to_API(routepath + '/' + str(min_fuel_route.route_type) + ".json")
+        map_size=default_map, depthfile=depthfile, waypoints=config.INTERMEDIATE_WAYPOINTS,
+        constraint_data_file=config.CONSTRAINT_DATA_FILE)
+    if config.CONSTRAINT_RASTER_RESOLUTION is not None:
+        constraint_list.compile(default_map, config.BOAT_DRAUGHT, config.CONSTRAINT_RASTER_RESOLUTION,
+                                config.CONSTRAINT_RASTER_DIR)
+
+    if routing_algs:
+        # *******************************************
+        # parallel routing sharing weather, boat and constraints
+        routing_pool = RoutingPool(boat, wt, constraint_list, config.NUMBER_OF_PROCESSES)
+        routes = routing_pool.execute_routing(routing_algs, jobs)
+
+        ranking = get_route_ranking(routes, labels, label_name)
+        logger.info('Ranking of routes:\n' + ranking.drop(columns='route').to_string())
+        ranking.drop(columns='route').to_csv(routepath + '/route_ranking.csv')
+        write_routes(routes, labels, routepath)
+    else:
+        # *******************************************
+        # initialise route
+        min_fuel_route = RoutingAlgFactory.get_routing_alg(config)
+        min_fuel_route.init_fig(water_depth, default_map)
+
+        # *******************************************
+        # routing
+        maripower_pool = None
+        if config.MARIPOWER_MODE == 'in_memory' and config.MARIPOWER_PROCESSES > 1:
+            maripower_pool = MariPowerPool(windfile, depthfile, config.MARIPOWER_PROCESSES)
+            boat.set_maripower_pool(maripower_pool)
+        try:
+            min_fuel_route = min_fuel_route.execute_routing(boat, wt, constraint_list)
+        finally:
+            if maripower_pool is not None:
+                maripower_pool.close()
+        # min_fuel_route.print_route()
+        # min_fuel_route.write_to_file(str(min_fuel_route.route_type) +
+        # "route.json")
+        min_fuel_route.return_route_to_API(routepath + '/' + str(min_fuel_route.route_type) + ".json")
+
+    # for parallel routing, the entries of all routing tasks have been merged into the power cache (see RoutingPool)
+    if power_cache is not None:
+        power_cache.print_info()
+        if config.POWER_CACHE_FILE is not None:
+            power_cache.write(config.POWER_CACHE_FILE)
@@ -6,6 +6,7 @@ import xarray
 import pytest
 
 import tests.basic_test_func as basic_test_func
+from WeatherRoutingTool.constraints.constraint_raster import ConstraintRaster
 from WeatherRoutingTool.constraints.constraints import *
 from WeatherRoutingTool.utils.maps import Map
 from WeatherRoutingTool.weather import *
@@ -212,3 +213,333 @@ def test_safe_crossing_continuous():
                                                               dummy_lats)
 
     assert np.array_equal(is_constrained_test, is_constrained)
+
+
+'''
+    test whether a compiled ConstraintsList returns the same results as the constraints for points at the centres of
+    the raster cells and outside of the raster, and whether the raster is read from the cache directory and compiled
+    again if the draught changes
+'''
+
+
+def test_compile_constraints(tmp_path):
+    dirname = os.path.dirname(__file__)
+    depthfile = os.path.join(dirname, 'data/reduced_testdata_depth.nc')
+    map_size = Map(51.2, 2.2, 51.8, 3.4)
+    resolution = 1. / 20
+    time = 0
+
+    constraint_list = generate_dummy_constraint_list()
+    constraint_list.add_neg_constraint(LandCrossing())
+    constraint_list.add_neg_constraint(WaterDepth("from_file", 20, map_size, depthfile))
+
+    lats = map_size.lat1 + (np.arange(12) + 0.5) * resolution
+    lons = map_size.lon1 + (np.arange(24) + 0.5) * resolution
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+    lat = np.append(lat_grid.ravel(), [52.5, 51.0])
+    lon = np.append(lon_grid.ravel(), [2.5, 2.5])
+
+    is_constrained_direct = constraint_list.safe_endpoint(lat, lon, time, np.full(lat.shape, False))
+    constraint_list.compile(map_size, 20, resolution, str(tmp_path))
+    is_constrained_raster = constraint_list.safe_endpoint(lat, lon, time, np.full(lat.shape, False))
+
+    assert constraint_list.raster.flags.shape == (12, 24)
+    assert is_constrained_direct.any()
+    assert not is_constrained_direct.all()
+    assert np.array_equal(is_constrained_direct, is_constrained_raster)
+    assert len(os.listdir(tmp_path)) == 1
+
+    constraint_list.raster.flags[:] = 0
+    constraint_list.compile(map_size, 20, resolution, str(tmp_path))
+    assert np.array_equal(is_constrained_raster,
+                          constraint_list.safe_endpoint(lat, lon, time, np.full(lat.shape, False)))
+
+    constraint_list.set_draught(5)
+    is_constrained_shallow = constraint_list.safe_endpoint(lat, lon, time, np.full(lat.shape, False))
+    assert len(os.listdir(tmp_path)) == 2
+    assert np.count_nonzero(is_constrained_shallow) < np.count_nonzero(is_constrained_raster)
+
+
+'''
+    test whether the rasters of several draughts are compiled once by compile_draughts() and are reused by
+    set_draught() instead of being compiled again
+'''
+
+
+def test_compile_draughts(monkeypatch):
+    dirname = os.path.dirname(__file__)
+    depthfile = os.path.join(dirname, 'data/reduced_testdata_depth.nc')
+    map_size = Map(51.2, 2.2, 51.8, 3.4)
+    resolution = 1. / 20
+    lat = 51.2 + np.random.default_rng(0).uniform(0, 0.6, 200)
+    lon = 2.2 + np.random.default_rng(1).uniform(0, 1.2, 200)
+
+    constraint_list = generate_dummy_constraint_list()
+    constraint_list.add_neg_constraint(WaterDepth("from_file", 20, map_size, depthfile))
+    constraint_list.compile(map_size, 20, resolution)
+
+    builds = []
+    build = ConstraintRaster.build
+
+    def build_counting(raster_constraints, map_size, resolution):
+        builds.append(raster_constraints[0].min_depth)
+        return build(raster_constraints, map_size, resolution)
+
+    monkeypatch.setattr(ConstraintRaster, 'build', build_counting)
+    constraint_list.compile_draughts([5, 10, 20])
+    assert builds == [5, 10]
+    assert constraint_list.get_draught() == 20
+
+    constraint_list.set_draught(5)
+    raster_shallow = constraint_list.raster
+    is_constrained_shallow = constraint_list.safe_endpoint(lat, lon, 0, np.full(lat.shape, False))
+    constraint_list.set_draught(20)
+    constraint_list.set_draught(5)
+    assert builds == [5, 10]
+    assert constraint_list.raster is raster_shallow
+
+    constraint_list.compile(map_size, 5, resolution)
+    assert np.array_equal(is_constrained_shallow,
+                          constraint_list.safe_endpoint(lat, lon, 0, np.full(lat.shape, False)))
+
+
+class CountingLandCrossing(LandCrossing):
+    def __init__(self):
+        super().__init__()
+        self.ncalls = 0
+        self.npoints = []
+
+    def constraint_on_point(self, lat, lon, time):
+        self.ncalls += 1
+        self.npoints.append(np.size(lat))
+        return super().constraint_on_point(lat, lon, time)
+
+
+'''
+    test whether safe_crossing_discrete() evaluates every constraint once for all steps of all routing segments and
+    returns the same result as checking the steps one after another
+'''
+
+
+def test_safe_crossing_discrete_single_call():
+    lat_start = np.array([52.76, 53.45, 52.5])
+    lon_start = np.array([5.40, 3.72, 4.0])
+    lat_end = np.array([52.70, 53.55, 52.5])
+    lon_end = np.array([4.04, 5.45, 6.0])
+    time = 0
+
+    land_crossing = CountingLandCrossing()
+    constraint_list = generate_dummy_constraint_list()
+    constraint_list.add_neg_constraint(land_crossing)
+    is_constrained = constraint_list.safe_crossing_discrete(lat_start, lon_start, lat_end, lon_end, time,
+                                                            [False, False, False])
+
+    is_constrained_steps = np.full(3, False)
+    for istep in range(1, 11):
+        is_constrained_steps += globe.is_land(lat_start + (lat_end - lat_start) * istep / 10,
+                                              lon_start + (lon_end - lon_start) * istep / 10)
+
+    assert land_crossing.ncalls == 1
+    assert list(is_constrained) == list(is_constrained_steps)
+    assert list(is_constrained) == [True, False, True]
+
+
+'''
+    test whether safe_endpoint() passes only the points that are not constrained yet to the remaining constraints,
+    returns the same result as evaluating all constraints for all points and orders the constraints by the measured
+    time per constrained point
+'''
+
+
+def test_safe_endpoint_short_circuit():
+    lat = np.array([52.7, 53.04, 60.0])
+    lon = np.array([4.04, 5.66, 4.0])
+    time = 0
+
+    on_map = StayOnMap()
+    on_map.set_map(50, 0, 55, 10)
+    land_crossing = CountingLandCrossing()
+    constraint_list = generate_dummy_constraint_list()
+    constraint_list.add_neg_constraint(on_map)
+    constraint_list.add_neg_constraint(land_crossing)
+
+    is_constrained = constraint_list.safe_endpoint(lat, lon, time, [False, False, False])
+    is_constrained_all = on_map.constraint_on_point(lat, lon, time) + globe.is_land(lat, lon)
+
+    assert list(is_constrained) == list(is_constrained_all)
+    assert list(is_constrained) == [False, True, True]
+    assert land_crossing.npoints == [2]
+    assert constraint_list.constraint_stats[on_map][1:] == (3, 1)
+    assert constraint_list.constraint_stats[land_crossing][1:] == (2, 1)
+
+    constraint_list.constraint_stats[land_crossing] = (1., 10, 10)
+    constraint_list.constraint_stats[on_map] = (1., 10, 1)
+    is_constrained = constraint_list.safe_endpoint(lat, lon, time, [False, False, False])
+
+    assert list(is_constrained) == [False, True, True]
+    assert land_crossing.npoints == [2, 3]
+    assert constraint_list.constraint_stats[on_map][1:] == (12, 2)
+
+
+class CountingContinuousCheck(RunTestContinuousChecks):
+    def __init__(self):
+        super().__init__([])
+        self.is_pointwise = True
+        self.nsegments = []
+
+    def check_crossing(self, lat_start, lon_start, lat_end, lon_end, time=None):
+        self.nsegments.append(len(lat_start))
+        return [False] * len(lat_start)
+
+
+'''
+    test whether safe_crossing() checks the continuous constraints only for the routing segments that do not violate
+    any discrete constraint
+'''
+
+
+def test_safe_crossing_skips_constrained_segments():
+    lat_start = np.array([52.76, 53.45, 52.5])
+    lon_start = np.array([5.40, 3.72, 4.0])
+    lat_end = np.array([52.70, 53.55, 52.5])
+    lon_end = np.array([4.04, 5.45, 6.0])
+    time = 0
+
+    continuous_check = CountingContinuousCheck()
+    constraint_list = generate_dummy_constraint_list()
+    constraint_list.add_neg_constraint(LandCrossing())
+    constraint_list.add_neg_constraint(continuous_check, 'continuous')
+    is_constrained = constraint_list.safe_crossing(lat_start, lon_start, lat_end, lon_end, time, [False, False, False])
+
+    assert list(is_constrained) == [True, False, True]
+    assert continuous_check.nsegments == [1]
+
+
+'''
+    test whether ConstraintRaster.crossing_flags() finds exactly the cells that are touched by a segment, including
+    segments through grid corners and along grid lines, and whether segments that leave the raster are marked
+'''
+
+
+def test_constraint_raster_crossing_flags():
+    flags = np.zeros((4, 4), dtype=np.uint8)
+    flags[1, 2] = 1
+    flags[3, 0] = 2
+    raster = ConstraintRaster(50., 0., 1., flags, ['first', 'second'])
+
+    lat_start = np.array([50.5, 50.5, 50.5, 50.5, 51.0, 50.5])
+    lon_start = np.array([0.5, 0.5, 0.5, 0.5, 0.5, 0.5])
+    lat_end = np.array([51.5, 50.5, 52.5, 53.5, 51.0, 55.0])
+    lon_end = np.array([3.5, 3.5, 2.5, 0.5, 1.9, 0.5])
+    crossing_flags, inside = raster.crossing_flags(lat_start, lon_start, lat_end, lon_end)
+
+    # 1: through cell (1, 2), 2: stays in row 0, 3: through the corner between rows 1/2 and columns 1/2,
+    # 4: along column 0, 5: along the grid line between rows 0 and 1, 6: leaves the raster
+    assert list(crossing_flags) == [1, 0, 1, 2, 0, 0]
+    assert list(inside) == [True, True, True, True, True, False]
+
+
+'''
+    test whether the crossing check of a compiled ConstraintsList detects a narrow land crossing that is missed by the
+    fixed number of steps
+'''
+
+
+def test_safe_crossing_raster():
+    map_size = Map(50., 0., 52., 2.)
+    constraint_list = generate_dummy_constraint_list()
+    constraint_list.add_neg_constraint(StayOnMap())
+    constraint_list.negative_constraints_discrete[0].set_map(50., 0., 52., 2.)
+    constraint_list.compile(map_size, resolution=0.01)
+    flags = constraint_list.raster.flags.copy()
+    flags[100, 150] = 1
+    constraint_list.raster = ConstraintRaster(50., 0., 0.01, flags, constraint_list.raster.names)
+
+    lat_start = np.array([51.005, 51.005, 50.5])
+    lon_start = np.array([1.0, 1.0, 1.0])
+    lat_end = np.array([51.005, 51.005, 50.5])
+    lon_end = np.array([1.9, 1.4, 2.5])
+    is_constrained = constraint_list.safe_crossing_discrete(lat_start, lon_start, lat_end, lon_end, 0,
+                                                            [False, False, False])
+
+    assert list(is_constrained) == [True, False, True]
+
+
+'''
+    test whether segments that are accepted via the hazard distance do not touch any constrained cell and whether
+    segments close to constrained cells or outside of the raster are not accepted
+'''
+
+
+def test_constraint_raster_far_from_hazards():
+    flags = np.zeros((40, 40), dtype=np.uint8)
+    flags[10:14, 25:30] = 1
+    raster = ConstraintRaster(50., 0., 0.1, flags, ['first'])
+
+    rng = np.random.default_rng(1)
+    lat_start = rng.uniform(50., 54., 1000)
+    lon_start = rng.uniform(0., 4., 1000)
+    lat_end = np.clip(lat_start + rng.uniform(-0.5, 0.5, 1000), 50., 53.99)
+    lon_end = np.clip(lon_start + rng.uniform(-0.5, 0.5, 1000), 0., 3.99)
+
+    is_safe = raster.is_far_from_hazards(lat_start, lon_start, lat_end, lon_end)
+    crossing_flags, inside = raster.crossing_flags(lat_start, lon_start, lat_end, lon_end)
+
+    assert is_safe.any()
+    assert not np.any(crossing_flags[is_safe])
+    assert not raster.is_far_from_hazards(np.array([51.05]), np.array([2.0]), np.array([51.05]), np.array([2.4]))[0]
+    assert not raster.is_far_from_hazards(np.array([53.5]), np.array([0.5]), np.array([54.5]), np.array([0.5]))[0]
+
+
+'''
+    test whether the bilinear depth sampler of WaterDepth returns the same depths as xarray's linear interpolation,
+    including NaN for points outside of the depth data
+'''
+
+
+def test_waterdepth_bilinear():
+    dirname = os.path.dirname(__file__)
+    depthfile = os.path.join(dirname, 'data/reduced_testdata_depth.nc')
+    waterdepth = WaterDepth("from_file", 20, Map(50, 0, 55, 5), depthfile)
+
+    rng = np.random.default_rng(2)
+    lat = np.append(rng.uniform(51., 53., 500), [50.5, 52.])
+    lon = np.append(rng.uniform(2., 3., 500), [2.5, 3.5])
+    lat_da = xarray.DataArray(lat, dims="points")
+    lon_da = xarray.DataArray(lon, dims="points")
+    depth_xarray = waterdepth.depth_data["depth"].interp(latitude=lat_da, longitude=lon_da, method="linear").to_numpy()
+    depth = waterdepth.get_current_depth(lat.reshape(2, -1), lon.reshape(2, -1))
+
+    assert waterdepth.depth_grid.dtype == np.float32
+    assert depth.shape == (2, 251)
+    assert np.allclose(depth.ravel(), depth_xarray, atol=1e-3, equal_nan=True)
+    assert np.isnan(depth.ravel()[-2:]).all()
+
+
+'''
+    test whether the classification with the depth pyramid returns the same result as the interpolated depth for
+    several draughts and whether the depth data for plotting is reduced without modifying the depth data of the
+    constraint
+'''
+
+
+def test_waterdepth_pyramid():
+    dirname = os.path.dirname(__file__)
+    depthfile = os.path.join(dirname, 'data/reduced_testdata_depth.nc')
+    map_size = Map(50, 0, 55, 5)
+    waterdepth = WaterDepth("from_file", 20, map_size, depthfile)
+    depth_data = waterdepth.depth_data
+
+    rng = np.random.default_rng(3)
+    lat = rng.uniform(50.9, 53.1, 5000)
+    lon = rng.uniform(1.9, 3.1, 5000)
+    for draught in [5, 20, 50]:
+        waterdepth.set_draught(draught)
+        assert np.array_equal(waterdepth.constraint_on_point(lat, lon, 0),
+                              waterdepth.get_depth_bilinear(lat, lon) > -draught)
+
+    ds_depth = waterdepth.get_plot_depth(map_size)
+
+    assert waterdepth.depth_data is depth_data
+    assert ds_depth.depth.shape[0] <= depth_data.depth.shape[0] // 8
+    assert np.nanmax(ds_depth.depth) < 0
@@ -1,3 +1,5 @@
+import os
+
 import numpy
 import sqlalchemy as db
 import pandas as pd
@@ -279,6 +281,34 @@ class TestContinuousCheck:
         for geom in lines_concat["geom"]:
             assert isinstance(geom, LineString), "Linestring Instantiation Error"
 
+    def test_filter_seamark_tags(self):
+        """
+        Test whether tags given as dicts, strings or in hstore format are parsed, whether seamark objects with
+        several of the specified tags are selected only once and whether only the tag 'seamark:type' is considered
+        """
+        gdf = gpd.GeoDataFrame(
+            columns=["tags", "geom"],
+            data=[
+                [{"seamark:type": "separation_zone", "seamark:name": "separation_line"}, Point(1, 2)],
+                ["{'seamark:type': 'separation_line'}", Point(2, 3)],
+                ['"seamark:type"=>"restricted_area", "name"=>NULL', Point(3, 4)],
+                [None, Point(4, 5)],
+                [{"seamark:type": "harbour", "name": "restricted_area"}, Point(5, 6)],
+            ],
+            geometry="geom",
+        )
+
+        filtered = SeamarkCrossing().filter_seamark_tags(gdf, ["separation_zone", "separation_line",
+                                                               "restricted_area"])
+
+        assert len(filtered) == 3
+        assert list(filtered["geom"]) == [Point(1, 2), Point(2, 3), Point(3, 4)]
+        assert filtered["tags"].iloc[1] == {"seamark:type": "separation_line"}
+        assert filtered["tags"].iloc[2] == {"seamark:type": "restricted_area", "name": None}
+        assert list(filtered["seamark_type"]) == ["separation_zone", "separation_line", "restricted_area"]
+        assert list(SeamarkCrossing().filter_seamark_tags(gdf, ["harbour"])["geom"]) == [Point(5, 6)]
+        assert len(SeamarkCrossing().filter_seamark_tags(gdf, ["anchorage"])) == 0
+
     def test_concat_nodes_ways(self):
         """
         Test for checking if table with  ways and nodes includes geometries (Point, LineString)
@@ -414,6 +444,81 @@ class TestContinuousCheck:
         for i in range(len(check_list)):
             assert isinstance(check_list[i], bool)
 
+    def test_check_crossing_tree_built_once(self, monkeypatch):
+        """
+        Test whether the seamark objects are queried and indexed only once, whether all routing segments are checked
+        in one query and whether only seamark objects within the map are considered
+        """
+        query = ["SELECT * , geometry as geom FROM nodes", "SELECT *, geometry AS geom FROM ways"]
+        kwargs = {"lat_start": numpy.array([48.92595, 50.0]), "lon_start": numpy.array([12.0, 0.0]),
+                  "lat_end": numpy.array([48.92595, 50.1]), "lon_end": numpy.array([12.1, 0.0]), "engine": engine,
+                  "query": query, "seamark_object": ["nodes", "ways"],
+                  "seamark_list": ["separation_zone", "separation_line"]}
+
+        check = SeamarkCrossing()
+        check_list = check.check_crossing(**kwargs)
+        monkeypatch.setattr(check, "gdf_seamark_combined_nodes_ways",
+                            lambda **args: pytest.fail("seamark objects queried twice"))
+        check_list_second = check.check_crossing(**kwargs)
+        check_list_outside = SeamarkCrossing(Map(50, 0, 55, 5)).check_crossing(**kwargs)
+
+        assert check_list == [True, False]
+        assert check_list_second == check_list
+        assert check_list_outside == [False, False]
+
+    def test_get_seamark_query(self):
+        """
+        Test whether the tags and, if a map is provided, the bbox are passed to the database as filters
+        """
+        query = "SELECT * FROM openseamap.nodes"
+        sql, params = SeamarkCrossing().get_seamark_query(query, "geom", ["separation_zone"])
+        check_map = SeamarkCrossing(Map(48, 11, 50, 13))
+        sql_map, params_map = check_map.get_seamark_query(query, "geom", ["separation_zone"])
+
+        assert sql == query + " WHERE tags -> 'seamark:type' = ANY(:seamark_types)"
+        assert params == {"seamark_types": ["separation_zone"]}
+        assert sql_map == sql + " AND ST_Intersects(geom, ST_MakeEnvelope(:lon1, :lat1, :lon2, :lat2, 4326))"
+        assert params_map == {"seamark_types": ["separation_zone"], "lat1": 48, "lon1": 11, "lat2": 50, "lon2": 13}
+
+    def test_query_land_polygons_bbox(self, monkeypatch):
+        """
+        Test whether only the land polygons within the map are requested from the database
+        """
+        requests = []
+
+        def read_postgis_record(sql, params=None, engine=None):
+            requests.append((sql, params))
+            return gpd.GeoDataFrame({"geom": [box(11, 48, 12, 49), None]}, geometry="geom", crs="epsg:4326")
+
+        check = LandPolygonsCrossing(Map(48, 11, 50, 13))
+        monkeypatch.setattr(check, "read_postgis_batches", read_postgis_record)
+        gdf = check.query_land_polygons()
+
+        assert requests == [("SELECT *,geometry as geom FROM openseamap.land_polygons WHERE ST_Intersects(geometry, "
+                             "ST_MakeEnvelope(:lon1, :lat1, :lon2, :lat2, 4326))",
+                             {"lat1": 48, "lon1": 11, "lat2": 50, "lon2": 13})]
+        assert len(gdf) == 1
+
+    def test_connect_database_pooled(self, monkeypatch):
+        """
+        Test whether the engine of the database connection is created only once per process
+        """
+        for name, value in {"WRT_DB_HOST": "localhost", "WRT_DB_PORT": "5432", "WRT_DB_DATABASE": "seamap",
+                            "WRT_DB_USERNAME": "user", "WRT_DB_PASSWORD": "password"}.items():
+            monkeypatch.setenv(name, value)
+
+        assert SeamarkCrossing().connect_database() is LandPolygonsCrossing(None).connect_database()
+
+    @pytest.mark.skipif(os.getenv("WRT_DB_HOST") is None, reason="requires a PostGIS database with OpenSeaMap data")
+    def test_query_nodes_postgis(self):
+        """
+        Test whether only seamark objects with the requested tags within the map are read from the database
+        """
+        gdf = SeamarkCrossing(Map(48, 11, 50, 13)).query_nodes()
+
+        assert isinstance(gdf, gpd.GeoDataFrame)
+        assert gdf["geom"].intersects(box(11, 48, 13, 50)).all()
+
     def test_query_land_polygons(self):
         gdf = LandPolygonsCrossing(Map(0, 0, 0, 0)).query_land_polygons(
             engine=engine, query="SELECT *,geometry as geom from land_polygons")
@@ -440,6 +545,50 @@ class TestContinuousCheck:
         for i in range(len(check_list)):
             assert isinstance(check_list[i], bool)
 
+    def test_check_land_crossing_tree_built_once(self, monkeypatch):
+        """
+        Test whether the land polygons are queried, clipped and indexed only once and whether all routing segments
+        are checked in one query
+        """
+        kwargs = {"lat_start": numpy.array([50.0, 50.0, 48.5]), "lon_start": numpy.array([3.0, 3.0, 3.0]),
+                  "lat_end": numpy.array([50.0, 50.0, 48.5]), "lon_end": numpy.array([5.0, 4.0, 9.0]),
+                  "engine": engine, "query": "SELECT *,geometry as geom from land_polygons"}
+
+        check = LandPolygonsCrossing(Map(48, 3, 52, 10))
+        check_list = check.check_crossing(**kwargs)
+        monkeypatch.setattr(check, "query_land_polygons", lambda **args: pytest.fail("land polygons queried twice"))
+        check_list_second = check.check_crossing(**kwargs)
+
+        assert check_list == [True, False, False]
+        assert check_list_second == check_list
+
+    def test_constraint_data_file(self, tmp_path):
+        """
+        Test whether seamark objects and land polygons are exported to a GeoPackage and whether the crossing checks
+        read only the features within the map from the GeoPackage
+        """
+        path = str(tmp_path / "constraint_data.gpkg")
+        SeamarkCrossing().export_seamarks(path, engine=engine,
+                                          query=["SELECT * , geometry as geom FROM nodes",
+                                                 "SELECT *, geometry AS geom FROM ways"],
+                                          seamark_object=["nodes", "ways"],
+                                          seamark_list=["separation_zone", "separation_line"])
+        LandPolygonsCrossing(None).export_land_polygons(path, engine=engine,
+                                                        query="SELECT *,geometry as geom from land_polygons")
+
+        seamarks = SeamarkCrossing(Map(48, 11, 50, 13), data_file=path)
+        seamarks_crossed = seamarks.check_crossing(numpy.array([48.92595, 50.0]), numpy.array([12.0, 0.0]),
+                                                   numpy.array([48.92595, 50.1]), numpy.array([12.1, 0.0]))
+        land_polygons = LandPolygonsCrossing(Map(48, 3, 52, 10), data_file=path)
+        land_crossed = land_polygons.check_crossing(numpy.array([50.0, 50.0]), numpy.array([3.0, 3.0]),
+                                                    numpy.array([50.0, 50.0]), numpy.array([5.0, 4.0]))
+
+        assert seamarks_crossed == [True, False]
+        assert len(seamarks.read_layer_from_file("seamarks", Map(48, 11, 50, 13))) > 0
+        assert len(seamarks.read_layer_from_file("seamarks", Map(0, 0, 1, 1))) == 0
+        assert land_crossed == [True, False]
+        assert len(land_polygons.read_layer_from_file("land_polygons", Map(0, 0, 1, 1))) == 0
+
 
 # Closing engine
 engine.dispose()
@@ -7,7 +7,11 @@ import xarray as xr
 from geovectorslib import geod
 
 import tests.basic_test_func as basic_test_func
+from WeatherRoutingTool.algorithms.isobased import IsoBased
+from WeatherRoutingTool.algorithms.isofuel import IsoFuel
+from WeatherRoutingTool.algorithms.stephistory import StepHistory
 from WeatherRoutingTool.constraints.constraints import *
+from WeatherRoutingTool.ship.power_table import PowerTable
 from WeatherRoutingTool.ship.ship import Tanker
 from WeatherRoutingTool.ship.shipparams import ShipParams
 
@@ -312,7 +316,7 @@ def test_pruning_select_correct_idxs():
     speed_ps_test = np.array([speed_per_step[0, 1], speed_per_step[0, 2], speed_per_step[0, 5], speed_per_step[0, 6]])
     lat_test = np.array([[30, 30, 30, 30]])
     lon_test = np.array([[45, 45, 45, 45]])
-    time_test = np.array([datetime.date.today(), datetime.date.today(), datetime.date.today(), datetime.date.today()])
+    time_test = np.full(4, np.datetime64(datetime.date.today(), 's'))
 
     ra.print_current_status()
     form.print_line()
@@ -335,6 +339,65 @@ def test_pruning_select_correct_idxs():
     # form.print_line()  # ra.print_ra()
 
 
+'''
+    test whether the pruning kernel selects the maximum of every bin if values of different bins are equal and whether
+    NaN values and constrained variants are discarded
+'''
+
+
+def test_pruning_indices_ties_nan_constrained():
+    bins = np.array([10, 20, 40, 60, 80])
+    courses = np.array([15, 16, 22, 23, 44, 45, 71, 72, 80, 95])
+    dist = np.array([5, 3, 5, 1, np.nan, 2, 0, 0, 0, 9])
+    is_constrained = dist == 0
+
+    idxs = IsoBased.get_pruning_indices(courses, dist, bins, True, is_constrained)
+    assert np.array_equal(idxs, np.array([0, 2, 5]))
+
+    idxs = IsoBased.get_pruning_indices(courses, dist, bins, False, is_constrained)
+    assert np.array_equal(idxs, np.array([0, 2, 5, 6, 7, 8]))
+
+
+'''
+    test whether StepHistory matches the (M,N) arrays obtained from np.vstack and np.repeat and whether only the
+    surviving variants are kept after pruning
+'''
+
+
+def test_step_history_matches_vstack():
+    hist = StepHistory([1.])
+    hist.reserve(7)
+
+    per_step_test = np.array([[1.]])
+    hist.repeat(3)
+    per_step_test = np.repeat(per_step_test, 3, axis=1)
+
+    new_row = np.array([2., 3., 4.])
+    hist.append(new_row)
+    per_step_test = np.vstack((new_row, per_step_test))
+
+    idxs = [0, 2]
+    hist.select(idxs)
+    per_step_test = per_step_test[:, idxs]
+    assert np.array_equal(hist.get_per_step(), per_step_test)
+
+    hist.repeat(2)
+    per_step_test = np.repeat(per_step_test, 2, axis=1)
+    new_row = np.array([5., 6., 7., 8.])
+    hist.append(new_row)
+    per_step_test = np.vstack((new_row, per_step_test))
+
+    assert hist.values.shape[0] == 7
+    assert hist.nnodes == 7
+    assert np.array_equal(hist.get_per_step(), per_step_test)
+    assert np.array_equal(hist.get_route(), np.flip(per_step_test, 0))
+    assert np.array_equal(hist.get_current(), per_step_test[0])
+    assert np.array_equal(hist.get_row(1), per_step_test[1])
+
+    hist.select(3)
+    assert np.array_equal(hist.get_per_step(), per_step_test[:, 3])
+
+
 '''
     test shape and content of 'move' for known distance, start and end points
 '''
@@ -365,3 +428,124 @@ def test_check_bearing():
     # print('lons_test[0]', lons_test[0])
     assert np.allclose(lats_test[0], move['lat2'], 0.01)
     assert np.allclose(lons_test[0], move['lon2'], 0.01)
+
+
+def evaluate_power_wind_waves(conditions):
+    power = 10 ** 6 * (1 + 0.1 * np.cos(np.radians(conditions[:, 0])) * conditions[:, 1] / 10 + 0.2 * conditions[:, 3])
+    return np.stack([power, np.ones(conditions.shape[0])], axis=-1)
+
+
+##
+# cheap power model for the multi-fidelity tests: evaluate_power_wind_waves perturbed by up to 2% depending on the
+# wind angle such that the pruning based on the cheap model differs from the one based on the full model
+def evaluate_power_wind_waves_perturbed(conditions):
+    power_fuel = evaluate_power_wind_waves(conditions)
+    power_fuel[:, 0] *= 1 + 0.02 * np.sin(np.radians(3 * conditions[:, 0]))
+    return power_fuel
+
+
+##
+# Tanker that evaluates the full power model (get_fuel_per_time_netCDF) with a power table that differs from the
+# cheap power table used by get_fuel_surrogate
+class TankerTwoTables(Tanker):
+    def __init__(self, init_mode, full_power_table):
+        super().__init__(init_mode)
+        self.full_power_table = full_power_table
+
+    def get_fuel_per_time_netCDF(self, courses, lats, lons, time, unique_coords=False, n_coords=None):
+        cheap_power_table = self.power_table
+        self.power_table = self.full_power_table
+        try:
+            return self.get_fuel_surrogate(courses, lats, lons, time)
+        finally:
+            self.power_table = cheap_power_table
+
+
+##
+# IsoFuel that records the positions of the variants that survive the pruning of every routing step
+class IsoFuelRecordSurvivors(IsoFuel):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.survivors_per_step = []
+
+    def pruning_per_step(self, trim=True, select=True):
+        idxs = super().pruning_per_step(trim, select)
+        if select:
+            self.survivors_per_step.append(
+                sorted(zip(self.get_current_lats().tolist(), self.get_current_lons().tolist())))
+        return idxs
+
+
+def run_isofuel_surrogate(multi_fidelity_depth, evaluate_power_cheap=None):
+    dirname = os.path.dirname(__file__)
+    full_power_table = PowerTable.generate(evaluate_power_wind_waves, processes=1, n_validation=0)
+    if evaluate_power_cheap is None:
+        boat = Tanker(-99)
+        cheap_power_table = full_power_table
+    else:
+        boat = TankerTwoTables(-99, full_power_table)
+        cheap_power_table = PowerTable.generate(evaluate_power_cheap, processes=1, n_validation=0)
+    boat.init_hydro_model_Route(os.path.join(dirname, 'data/reduced_testdata_weather.nc'),
+                                os.path.join(dirname, 'data/CoursesRoute.nc'),
+                                os.path.join(dirname, 'data/reduced_testdata_depth.nc'))
+    boat.set_boat_speed(6)
+    boat.set_power_mode('surrogate')
+    boat.set_power_table(cheap_power_table)
+
+    ra = IsoFuelRecordSurvivors((54.6, 13.9), (54.8, 15.6), datetime.datetime(2023, 7, 20, 10, 0), 200, None)
+    ra.set_steps(30)
+    ra.set_pruning_settings(40, 10)
+    ra.set_variant_segments(20, 2)
+    ra.set_multi_fidelity_depth(multi_fidelity_depth)
+
+    pars = ConstraintPars()
+    constraint_list = ConstraintsList(pars)
+    constraint_list.add_neg_constraint(LandCrossing())
+
+    route = ra.execute_routing(boat, None, constraint_list)
+    return route, ra
+
+
+'''
+    test whether the multi-fidelity power estimation reduces the number of evaluations of the full power model while
+    the variants preselected with a cheap power model that differs from the full power model still contain all
+    variants that survive the pruning of the single-fidelity routing based on the full power model
+'''
+
+
+def test_multi_fidelity_preselection():
+    route_single, ra_single = run_isofuel_surrogate(0, evaluate_power_wind_waves_perturbed)
+    route_multi, ra_multi = run_isofuel_surrogate(5, evaluate_power_wind_waves_perturbed)
+
+    stats_single = ra_single.multi_fidelity_stats
+    assert stats_single['evaluations_full'] == 0
+    assert stats_single['evaluations_without_preselection'] == 0
+
+    stats = ra_multi.multi_fidelity_stats
+    assert stats['evaluations_full'] < stats['evaluations_without_preselection'] / 3
+    assert stats['survivors'] > 0
+    # the pruning based on the cheap model alone selects different variants than the one based on the full model
+    assert stats['survivors_agreed'] < stats['survivors']
+
+    # the full-model survivors of every step are among the preselected variants
+    assert ra_single.survivors_per_step == ra_multi.survivors_per_step
+    assert np.array_equal(route_single.lats_per_step, route_multi.lats_per_step)
+    assert np.array_equal(route_single.lons_per_step, route_multi.lons_per_step)
+    assert np.array_equal(route_single.starttime_per_step, route_multi.starttime_per_step)
+    assert np.allclose(route_single.ship_params_per_step.get_fuel(), route_multi.ship_params_per_step.get_fuel())
+
+
+'''
+    test whether RouteParams.get_full_travel_time() of a route returned by IsoBased.execute_routing() agrees with the
+    start times per step and with the travel time in hours (RouteParams.time, rounded to two decimals)
+'''
+
+
+def test_get_full_travel_time():
+    route, ra = run_isofuel_surrogate(0)
+    time_steps = (route.starttime_per_step[route.count] - route.starttime_per_step[0]) / np.timedelta64(1, 's')
+
+    assert route.get_full_travel_time('sec') == time_steps
+    assert route.get_full_travel_time('min') == pytest.approx(time_steps / 60)
+    assert route.get_full_travel_time('h') == pytest.approx(route.time, abs=0.005)
+    assert route.get_full_travel_time('datetime') == datetime.timedelta(seconds=time_steps)
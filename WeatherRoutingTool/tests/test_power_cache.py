@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+
+from WeatherRoutingTool.ship.power_cache import PowerCache, get_power_cache_hash
+from WeatherRoutingTool.ship.shipparams import ShipParams
+
+
+class DummyPowerModel:
+    def __init__(self):
+        self.requests = []
+        self.n_coords = []
+
+    # power depends on the course and the latitude; all other ship parameters are set to the speed
+    def evaluate(self, courses, lats, lons, time, unique_coords=False, n_coords=None):
+        self.requests.append(courses.shape[0])
+        self.n_coords.append(n_coords)
+        power = courses * 1000 + lats
+        speed = np.full(courses.shape, 6.)
+        return ShipParams(fuel=power / 100, power=power, rpm=speed, speed=speed, r_calm=speed, r_wind=speed,
+                          r_waves=speed, r_shallow=speed, r_roughness=speed)
+
+
+'''
+    test whether only requests that are not cached are evaluated, requests that agree within the tolerances are
+    evaluated once and the ship parameters are returned in the order of the requests
+'''
+
+
+def test_power_cache_get_ship_params():
+    model = DummyPowerModel()
+    power_cache = PowerCache(100, tolerances={'lat': 0.01})
+    time = np.full(3, np.datetime64('2023-07-20T12:00', 's'))
+
+    courses = np.array([10., 20., 10.])
+    lats = np.array([54., 54., 54.001])
+    ship_params = power_cache.get_ship_params(model.evaluate, courses, lats, np.full(3, 13.), time, 6)
+
+    assert model.requests == [2]
+    assert np.allclose(ship_params.get_power(), [10054., 20054., 10054.])
+
+    courses = np.array([20., 30., 370.])
+    lats = np.array([54., 54., 54.])
+    ship_params = power_cache.get_ship_params(model.evaluate, courses, lats, np.full(3, 13.), time, 6)
+
+    assert model.requests == [2, 1]
+    assert np.allclose(ship_params.get_power(), [20054., 30054., 10054.])
+    assert np.allclose(ship_params.get_rpm(), 6.)
+    assert power_cache.hits == 2
+    assert power_cache.misses == 4
+
+
+'''
+    test whether the least recently used entries are discarded if the cache is full
+'''
+
+
+def test_power_cache_lru():
+    power_cache = PowerCache(2)
+    keys = np.array([[1, 0, 0, 0, 0], [2, 0, 0, 0, 0], [3, 0, 0, 0, 0]])
+    values = np.ones((3, 9))
+
+    power_cache.insert(keys[:2], values[:2])
+    power_cache.lookup(keys[:1])
+    power_cache.insert(keys[2:], values[2:])
+    values_cached, missing = power_cache.lookup(keys)
+
+    assert list(missing) == [False, True, False]
+    assert np.all(np.isnan(values_cached[1]))
+
+
+'''
+    test whether all courses of a position are evaluated if any of them is not cached and whether the number of
+    positions is passed on explicitly, also for positions that share a longitude
+'''
+
+
+def test_power_cache_n_coords():
+    model = DummyPowerModel()
+    power_cache = PowerCache(100)
+    time = np.full(6, np.datetime64('2023-07-20T12:00', 's'))
+    lats = np.repeat([54., 55.], 3)
+    lons = np.full(6, 13.)
+
+    power_cache.get_ship_params(model.evaluate, np.tile([10., 20., 30.], 2), lats, lons, time, 6, n_coords=2)
+    ship_params = power_cache.get_ship_params(model.evaluate, np.array([10., 20., 30., 10., 20., 40.]), lats, lons,
+                                              time, 6, n_coords=2)
+
+    assert model.requests == [6, 3]
+    assert model.n_coords == [2, 1]
+    assert np.allclose(ship_params.get_power(), [10054., 20054., 30054., 10055., 20055., 40055.])
+
+
+'''
+    test whether the entries inserted after get_state() are transferred to another cache together with the hits and
+    misses
+'''
+
+
+def test_power_cache_update_merge():
+    keys = np.array([[1, 0, 0, 0, 0], [2, 0, 0, 0, 0], [3, 0, 0, 0, 0]])
+    values = np.arange(27.).reshape(3, 9)
+    power_cache_main = PowerCache(100)
+    power_cache_main.insert(keys[:1], values[:1])
+
+    power_cache_task = PowerCache(100)
+    power_cache_task.insert(keys[:1], values[:1])
+    state = power_cache_task.get_state()
+    power_cache_task.lookup(keys)
+    power_cache_task.insert(keys[1:], values[1:])
+    update = power_cache_task.get_update(state)
+
+    power_cache_main.merge(update)
+    values_cached, missing = power_cache_main.lookup(keys)
+
+    assert update['keys'].shape == (2, 5)
+    assert (update['hits'], update['misses']) == (1, 2)
+    assert not np.any(missing)
+    assert np.allclose(values_cached, values)
+    assert (power_cache_main.hits, power_cache_main.misses) == (4, 2)
+
+
+'''
+    test whether the cache is written to and read from file and whether the file is ignored if it has been written for
+    different input data
+'''
+
+
+def test_power_cache_write_read(tmp_path):
+    model = DummyPowerModel()
+    path = os.path.join(tmp_path, 'power_cache.npz')
+    time = np.full(2, np.datetime64('2023-07-20T12:00', 's'))
+
+    power_cache = PowerCache(100, 'hash1')
+    power_cache.get_ship_params(model.evaluate, np.array([10., 20.]), np.array([54., 55.]), np.array([13., 13.]),
+                                time, 6)
+    power_cache.write(path)
+
+    power_cache_read = PowerCache(100, 'hash1')
+    power_cache_read.read(path)
+    ship_params = power_cache_read.get_ship_params(model.evaluate, np.array([20.]), np.array([55.]),
+                                                   np.array([13.]), time[:1], 6)
+
+    power_cache_other = PowerCache(100, 'hash2')
+    power_cache_other.read(path)
+
+    assert model.requests == [2]
+    assert np.allclose(ship_params.get_power(), [20055.])
+    assert power_cache_other.get_size() == 0
+    assert get_power_cache_hash([path], {'speed': 6}) != get_power_cache_hash([path], {'speed': 7})
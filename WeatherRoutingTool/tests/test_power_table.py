@@ -0,0 +1,200 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import mariPower
+import WeatherRoutingTool.utils.processes as processes
+from WeatherRoutingTool.ship.power_table import (PowerTable, POWER_TABLE_AXES, get_power_table_conditions,
+                                                 get_relative_angle)
+from WeatherRoutingTool.ship.ship import Tanker
+
+TEST_AXES = {
+    'wind_angle': np.array([0, 90, 180]),
+    'wind_speed': np.array([0, 10, 20]),
+    'wave_angle': np.array([0, 180]),
+    'wave_height': np.array([0, 2, 4]),
+    'wave_period': np.array([4, 10]),
+    'current_speed': np.array([-1, 1]),
+    'speed': np.array([4, 6, 8])
+}
+
+
+# linear in all conditions s.t. the table interpolation is exact
+def evaluate_linear(conditions):
+    power = 1000 + conditions @ np.array([1., 20., 3., 400., 5., 60., 7000.])
+    rpm = 0.1 * conditions[:, 6]
+    return np.stack([power, rpm], axis=-1)
+
+
+# file-based stand-in for mariPower.__main__.PredictPowerOrSpeedRoute that evaluates evaluate_linear for the
+# conditions read from the environmental data at the requested positions; positions in shallow water get NaN
+def predict_linear(ship, courses_path, environment_path, depth_path):
+    ds = xr.load_dataset(courses_path)
+    points = dict(latitude=ds['lat'], longitude=ds['lon'])
+    with xr.open_dataset(environment_path) as environment, xr.open_dataset(depth_path) as depth:
+        env = environment.sel(time=ds['time'], **points, method='nearest').sel(height_above_ground2=10).load()
+        deep_water = depth['depth'].sel(**points, method='nearest').to_numpy() < -100
+
+    courses = np.degrees(ds['courses'].to_numpy()[:, 0]) % 360
+    conditions = get_power_table_conditions(courses, ds['speed'].to_numpy()[:, 0],
+                                            u10=env['u-component_of_wind_height_above_ground'].to_numpy(),
+                                            v10=env['v-component_of_wind_height_above_ground'].to_numpy(),
+                                            VHM0=env['VHM0'].to_numpy(), VMDR=env['VMDR'].to_numpy(),
+                                            VTPK=env['VTPK'].to_numpy(), utotal=env['utotal'].to_numpy(),
+                                            vtotal=env['vtotal'].to_numpy())
+    values = evaluate_linear(np.stack([conditions[axis] for axis in POWER_TABLE_AXES], axis=-1))
+    values[~deep_water] = np.nan
+
+    ds['Power_brake'] = (['it_pos', 'it_course'], values[:, [0]])
+    ds['RotationRate'] = (['it_pos', 'it_course'], values[:, [1]])
+    ds.to_netcdf(courses_path)
+
+
+def get_tanker():
+    dirname = os.path.dirname(__file__)
+    pol = Tanker(2)
+    pol.init_hydro_model_Route(os.path.join(dirname, 'data/reduced_testdata_weather.nc'),
+                               os.path.join(dirname, 'data/CoursesRoute.nc'),
+                               os.path.join(dirname, 'data/reduced_testdata_depth.nc'))
+    return pol
+
+
+# quadratic in the ship speed s.t. the table interpolation is not exact
+def evaluate_quadratic(conditions):
+    power = 1000 * conditions[:, 6] ** 2
+    return np.stack([power, conditions[:, 6]], axis=-1)
+
+
+'''
+    test whether the power table reproduces the generating function at and between the grid points and clips
+    conditions outside of the table
+'''
+
+
+def test_power_table_generate_and_evaluate():
+    power_table = PowerTable.generate(evaluate_linear, axes=TEST_AXES, processes=1, chunk_size=100, n_validation=20)
+
+    conditions = {'wind_angle': np.array([0, 45, 200]), 'wind_speed': np.array([0, 5, 30]),
+                  'wave_angle': np.array([0, 30, 180]), 'wave_height': np.array([0, 1, 5]),
+                  'wave_period': np.array([4, 6, 12]), 'current_speed': np.array([-1, 0.5, 2]),
+                  'speed': np.array([4, 5, 8])}
+    clipped = np.array([[0, 0, 0, 0, 4, -1, 4], [45, 5, 30, 1, 6, 0.5, 5], [180, 20, 180, 4, 10, 1, 8]])
+
+    values = power_table.evaluate(conditions)
+
+    assert power_table.table['power'].shape == tuple(TEST_AXES[axis].shape[0] for axis in POWER_TABLE_AXES)
+    assert np.allclose(values['power'], evaluate_linear(clipped)[:, 0])
+    assert np.allclose(values['rpm'], evaluate_linear(clipped)[:, 1])
+    assert power_table.table.attrs['power_rel_error_max'] < 1e-6
+    assert power_table.table.attrs['n_validation'] == 20
+
+
+'''
+    test whether the power table and its interpolation error are written to and read from file
+'''
+
+
+def test_power_table_write_read(tmp_path):
+    power_table = PowerTable.generate(evaluate_quadratic, axes=TEST_AXES, processes=1, n_validation=50)
+    path = os.path.join(tmp_path, 'power_table.nc')
+    power_table.write(path)
+
+    power_table_read = PowerTable.from_file(path)
+    conditions = {axis: np.array([TEST_AXES[axis][0]]) for axis in POWER_TABLE_AXES}
+    conditions['speed'] = np.array([5.])
+
+    assert power_table.table.attrs['power_rel_error_max'] > 0
+    assert power_table_read.table.attrs['power_rel_error_max'] == pytest.approx(
+        power_table.table.attrs['power_rel_error_max'])
+    assert power_table_read.evaluate(conditions)['power'] == pytest.approx(26000)
+
+
+'''
+    test whether the relative angles and the current along the course are calculated correctly
+'''
+
+
+def test_get_power_table_conditions():
+    courses = np.array([0., 90., 350., 180.])
+    # wind from north, waves from east, current towards north
+    ones = np.ones(4)
+    conditions = get_power_table_conditions(courses, 6, u10=0 * ones, v10=-5 * ones, VHM0=2 * ones, VMDR=90 * ones,
+                                            VTPK=8 * ones, utotal=0 * ones, vtotal=1 * ones)
+
+    assert np.allclose(conditions['wind_angle'], [0, 90, 10, 180])
+    assert np.allclose(conditions['wind_speed'], 5)
+    assert np.allclose(conditions['wave_angle'], [90, 0, 100, 90])
+    assert np.allclose(conditions['current_speed'], [1, 0, np.cos(np.radians(10)), -1])
+    assert np.allclose(conditions['speed'], 6)
+    assert np.allclose(get_relative_angle(np.array([359., 10.]), np.array([1., 350.])), [2, 20])
+
+
+'''
+    test whether Tanker provides the ship parameters of the power table for MARIPOWER_MODE='surrogate'
+'''
+
+
+def test_get_fuel_surrogate():
+    pol = get_tanker()
+    pol.set_boat_speed(6)
+    pol.set_power_mode('surrogate')
+    pol.set_power_table(PowerTable.generate(evaluate_quadratic, axes=TEST_AXES, processes=1, n_validation=0))
+
+    courses = np.array([10., 100., 200.])
+    lats = np.array([54.5, 54.6, 54.7])
+    lons = np.array([13.2, 13.3, 13.4])
+    time = np.full(3, np.datetime64('2023-07-20T12:00', 's'))
+
+    ship_params = pol.get_fuel_per_time_netCDF(courses, lats, lons, time)
+
+    assert np.allclose(ship_params.get_power(), 36000)
+    assert np.allclose(ship_params.get_fuel(), 36000 * 200 / 3.6e9)
+    assert np.allclose(ship_params.get_rpm(), 6)
+    assert ship_params.get_speed().shape == (3,)
+
+
+'''
+    test whether the power table is generated via the file-based interface of mariPower, i.e. whether the synthetic
+    environmental and depth data reproduce the requested conditions in deep water
+'''
+
+
+def test_generate_power_table(monkeypatch):
+    monkeypatch.setattr(mariPower.__main__, 'PredictPowerOrSpeedRoute', predict_linear)
+    monkeypatch.setattr(processes, 'start_method', 'fork')
+    pol = get_tanker()
+    # the wind angle is undefined without wind
+    axes = dict(TEST_AXES, wind_speed=np.array([5, 10, 20]))
+
+    power_table = pol.generate_power_table(axes=axes, processes=2, chunk_size=100, n_validation=20)
+    grid = np.stack([mesh.ravel() for mesh in np.meshgrid(*[axes[axis] for axis in POWER_TABLE_AXES],
+                                                          indexing='ij')], axis=-1)
+
+    assert np.allclose(power_table.table['power'].to_numpy().ravel(), evaluate_linear(grid)[:, 0])
+    assert np.allclose(power_table.table['rpm'].to_numpy().ravel(), evaluate_linear(grid)[:, 1])
+    assert power_table.table.attrs['power_rel_error_max'] < 1e-6
+    assert power_table.table.attrs['sfoc'] == 200
+
+
+'''
+    test whether Tanker.get_fuel_per_time provides the power of the power table for calm sea without currents
+'''
+
+
+def test_get_fuel_per_time():
+    pol = get_tanker()
+    pol.set_boat_speed(6)
+    pol.set_power_table(PowerTable.generate(evaluate_linear, axes=TEST_AXES, processes=1, n_validation=0))
+
+    courses = np.array([10., 100., 350.])
+    wind = {'twa': np.array([40., 100., 20.]), 'tws': np.array([5., 10., 15.])}
+    # wave period clipped to the lower boundary of the table
+    conditions = np.array([[30, 5, 0, 0, 4, 0, 6], [0, 10, 0, 0, 4, 0, 6], [30, 15, 0, 0, 4, 0, 6]])
+
+    assert np.allclose(pol.get_fuel_per_time(courses, wind), evaluate_linear(conditions)[:, 0])
+
+    pol.power_table = None
+    with pytest.raises(ValueError):
+        pol.get_fuel_per_time(courses, wind)
@@ -0,0 +1,188 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from WeatherRoutingTool.algorithms.routingalg_factory import RoutingAlgFactory
+from WeatherRoutingTool.algorithms.routing_pool import RoutingPool, get_route_ranking, get_task_path
+from WeatherRoutingTool.config import Config
+from WeatherRoutingTool.constraints.constraints import ConstraintPars, ConstraintsList, LandCrossing
+from WeatherRoutingTool.routeparams import RouteParams
+from WeatherRoutingTool.ship.power_cache import PowerCache
+from WeatherRoutingTool.ship.power_table import PowerTable
+from WeatherRoutingTool.ship.ship import Tanker
+from WeatherRoutingTool.ship.shipparams import ShipParams
+from WeatherRoutingTool.utils.processes import set_start_method
+
+
+def create_dummy_route(fuel, lat_end):
+    nsteps = 3
+    ship_params = ShipParams(fuel=np.full(nsteps, fuel), power=np.zeros(nsteps), rpm=np.zeros(nsteps),
+                             speed=np.full(nsteps, 6.), r_calm=np.zeros(nsteps), r_wind=np.zeros(nsteps),
+                             r_waves=np.zeros(nsteps), r_shallow=np.zeros(nsteps), r_roughness=np.zeros(nsteps))
+    starttime = np.datetime64('2023-11-01T09:00') + np.arange(0, nsteps) * np.timedelta64(1, 'h')
+    route = RouteParams(count=nsteps, start=(54., 4.), finish=(56., 7.), gcr=None, route_type='min_time_route',
+                        time=2., lats_per_step=np.array([54., 55., lat_end]), lons_per_step=np.array([4., 5., 7.]),
+                        azimuths_per_step=np.zeros(nsteps), dists_per_step=np.zeros(nsteps),
+                        starttime_per_step=starttime, ship_params_per_step=ship_params)
+    return route
+
+
+'''
+    test whether get_route_ranking() sorts the routes by fuel consumption and ranks routes that do not reach the
+    destination and failed routing tasks last
+'''
+
+
+def test_get_route_ranking():
+    routes = [create_dummy_route(3., 56.), None, create_dummy_route(1., 55.5), create_dummy_route(2., 56.)]
+    labels = ['2023-11-01T09:00Z', '2023-11-01T12:00Z', '2023-11-01T15:00Z', '2023-11-01T18:00Z']
+
+    ranking = get_route_ranking(routes, labels)
+
+    assert list(ranking['departure_time']) == [labels[3], labels[0], labels[2], labels[1]]
+    assert list(ranking['arrived']) == [True, True, False, False]
+    assert list(ranking['failed']) == [False, False, False, True]
+    assert np.allclose(ranking['fuel_consumed'][:3], [4., 6., 2.])
+    assert np.isnan(ranking['fuel_consumed'][3])
+    assert ranking['route'][0] is routes[3]
+
+
+'''
+    test whether get_task_path() returns separate file names for the routing tasks
+'''
+
+
+def test_get_task_path():
+    assert get_task_path('/path/CoursesRoute.nc', 3) == '/path/CoursesRoute_3.nc'
+
+
+def create_dummy_config():
+    config = Config(init_mode='dummy')
+    config.DEFAULT_ROUTE = [54., 4., 56., 7.]
+    config.DEPARTURE_TIME = '2023-11-01T09:00Z'
+    config.ALGORITHM_TYPE = 'isofuel'
+    config.DELTA_FUEL = 3000
+    config.ROUTING_STEPS = 10
+    config.ISOCHRONE_PRUNE_SECTOR_DEG_HALF = 91
+    config.ISOCHRONE_PRUNE_SEGMENTS = 20
+    config.ISOCHRONE_PRUNE_BEARING = False
+    config.ISOCHRONE_PRUNE_GCR_CENTERED = True
+    config.ROUTER_HDGS_SEGMENTS = 30
+    config.ROUTER_HDGS_INCREMENTS_DEG = 6
+    config.ISOCHRONE_MINIMISATION_CRITERION = 'squareddist_over_disttodest'
+    config.MULTI_FIDELITY_DEPTH = 0
+    return config
+
+
+'''
+    test whether RoutingAlgFactory.get_routing_jobs() sets up one routing algorithm per job with the route and the
+    departure time of the job
+'''
+
+
+def test_get_routing_jobs():
+    config = create_dummy_config()
+    config.FIGURE_PATH = '/path/to/figures'
+    jobs = [{'DEFAULT_ROUTE': [54., 4., 55., 5.], 'DEPARTURE_TIME': '2023-11-02T10:00Z', 'BOAT_SPEED': 7},
+            {'DEFAULT_ROUTE': [53., 3., 56., 7.], 'DEPARTURE_TIME': '2023-11-03T12:00Z'}]
+
+    routing_algs = RoutingAlgFactory.get_routing_jobs(config, jobs)
+
+    assert len(routing_algs) == 2
+    assert routing_algs[0].start == (54., 4.)
+    assert routing_algs[0].finish == (55., 5.)
+    assert routing_algs[1].start == (53., 3.)
+    assert routing_algs[1].departure_time == datetime.datetime(2023, 11, 3, 12, 0)
+    assert routing_algs[0].figure_path is None
+
+    with pytest.raises(ValueError):
+        RoutingAlgFactory.get_routing_jobs(config, [{'DEFAULT_ROUTE': [54., 4., 55., 5.]}])
+
+
+def evaluate_power_dummy(conditions):
+    power = 10 ** 6 * (1 + 0.1 * np.cos(np.radians(conditions[:, 0])))
+    return np.stack([power, np.ones(conditions.shape[0])], axis=-1)
+
+
+'''
+    test whether RoutingPool.execute_routing() runs the routing algorithms of a departure-time sweep in the worker
+    processes with the boat speed of every job and whether failed routing tasks are returned as None, both for worker
+    processes that inherit the shared objects ('fork') and for worker processes that receive them pickled ('spawn')
+'''
+
+
+def create_sweep_setup(tmp_path):
+    config = create_dummy_config()
+    config.DEFAULT_ROUTE = [54.6, 13.9, 54.8, 15.6]
+    config.DEPARTURE_TIME_SWEEP = ['2023-07-20T10:00Z', '2023-07-20T13:00Z']
+    config.DELTA_FUEL = 200
+    config.FIGURE_PATH = None
+    routing_algs = RoutingAlgFactory.get_departure_sweep(config)
+
+    dirname = os.path.dirname(__file__)
+    boat = Tanker(-99)
+    boat.init_hydro_model_Route(os.path.join(dirname, 'data/reduced_testdata_weather.nc'),
+                                str(tmp_path / 'CoursesRoute.nc'),
+                                os.path.join(dirname, 'data/reduced_testdata_depth.nc'))
+    boat.set_boat_speed(6)
+    boat.set_power_mode('surrogate')
+    boat.set_power_table(PowerTable.generate(evaluate_power_dummy, processes=1, n_validation=0))
+    constraint_list = ConstraintsList(ConstraintPars())
+    constraint_list.add_neg_constraint(LandCrossing())
+    return config, routing_algs, boat, constraint_list
+
+
+@pytest.mark.parametrize('start_method', ['fork', 'spawn'])
+def test_routing_pool_departure_sweep(tmp_path, start_method):
+    config, routing_algs, boat, constraint_list = create_sweep_setup(tmp_path)
+
+    routing_pool = RoutingPool(boat, None, constraint_list, processes=2)
+    set_start_method(start_method)
+    try:
+        routes = routing_pool.execute_routing(routing_algs, [{'BOAT_SPEED': 5}, {'BOAT_SPEED': 7}])
+    finally:
+        set_start_method(None)
+
+    assert len(routes) == 2
+    for route, speed, departure_time in zip(routes, [5, 7], config.DEPARTURE_TIME_SWEEP):
+        assert route.starttime_per_step[0] == np.datetime64(departure_time[:-1], 's')
+        assert np.all(route.ship_params_per_step.get_speed()[:route.count] == speed)
+    assert boat.speed == 6
+
+    routing_algs[1].set_steps('invalid')
+    routes = routing_pool.execute_routing(routing_algs)
+    assert routes[0] is not None
+    assert routes[1] is None
+
+
+'''
+    test whether the entries that the routing tasks insert into the power cache of their worker process are merged
+    into the power cache of the main process such that a repeated sweep is served from the cache
+'''
+
+
+def test_routing_pool_power_cache(tmp_path):
+    config, routing_algs, boat, constraint_list = create_sweep_setup(tmp_path)
+    power_cache = PowerCache(10 ** 6)
+    boat.set_power_cache(power_cache)
+
+    routing_pool = RoutingPool(boat, None, constraint_list, processes=2)
+    set_start_method('fork')
+    try:
+        routes = routing_pool.execute_routing(routing_algs)
+        size = power_cache.get_size()
+        misses = power_cache.misses
+
+        routes_cached = routing_pool.execute_routing(routing_algs)
+    finally:
+        set_start_method(None)
+
+    assert size > 0
+    assert misses >= size
+    assert power_cache.get_size() == size
+    assert power_cache.misses == misses
+    assert power_cache.hits > 0
+    for route, route_cached in zip(routes, routes_cached):
+        assert np.allclose(route.ship_params_per_step.get_fuel(), route_cached.ship_params_per_step.get_fuel())
@@ -1,4 +1,5 @@
 import datetime
+import gc
 import math
 import os
 
@@ -8,9 +9,13 @@ import pandas as pd
 import pytest
 import xarray as xr
 
+import WeatherRoutingTool.utils.processes as processes
 import WeatherRoutingTool.utils.unit_conversion as utils
 
 from WeatherRoutingTool.routeparams import RouteParams
+import mariPower
+from WeatherRoutingTool.ship.maripower_pool import MariPowerPool
+from WeatherRoutingTool.ship.power_cache import PowerCache
 from WeatherRoutingTool.ship.ship import Tanker
 from WeatherRoutingTool.ship.shipparams import ShipParams
 
@@ -218,6 +223,32 @@ def test_shipparams_get_element():
     assert rroughness[idx] == rroughness_test
 
 
+'''
+    test whether the ship parameters are views of the common backing array of ShipParams and whether selection of
+    variants, flipping and setting of parameters act on all parameters
+'''
+
+
+def test_shipparams_backing_array():
+    fuel = np.array([[1., 2., 3.], [4., 5., 6.]])
+    sp = ShipParams(fuel=fuel, power=10 * fuel, rpm=fuel, speed=np.full((2, 3), 6.), r_calm=fuel, r_wind=fuel,
+                    r_waves=fuel, r_shallow=fuel, r_roughness=fuel)
+
+    assert sp.data.shape == (9, 2, 3)
+    assert np.shares_memory(sp.get_power(), sp.data)
+
+    sp.set_rpm(np.zeros((2, 3)))
+    sp.select(np.array([0, 2]))
+    assert np.array_equal(sp.get_fuel(), [[1., 3.], [4., 6.]])
+    assert np.array_equal(sp.get_power(), [[10., 30.], [40., 60.]])
+    assert np.array_equal(sp.get_rpm(), np.zeros((2, 2)))
+
+    sp.select(1)
+    sp.flip()
+    assert np.array_equal(sp.get_fuel(), [3., -99.])
+    assert np.array_equal(sp.get_speed(), [6., -99.])
+
+
 '''
     test whether ShipParams object for single waypoint is correctly returned by ShipParams.get_single_object(idx)
 '''
@@ -334,6 +365,174 @@ def test_get_netCDF_courses_GA():
     ds.close()
 
 
+'''
+    test whether the in-memory courses dataset that is passed to mariPower for MARIPOWER_MODE='in_memory' is identical
+    to the content of the course netCDF
+'''
+
+
+def test_get_netCDF_courses_in_memory():
+    lat = np.array([1., 1., 1, 2, 2, 2])
+    lon = np.array([4., 4., 4, 3, 3, 3])
+    courses = np.array([10., 20., 30., 40., 50., 60.])
+    time = np.array(['2022-12-19T00:00', '2022-12-19T00:00', '2022-12-19T00:00', '2023-12-14T00:00',
+                     '2023-12-14T00:00', '2023-12-14T00:00'], dtype='datetime64[s]')
+
+    pol = get_default_Tanker()
+    pol.set_boat_speed(6)
+    pol.write_netCDF_courses(courses, lat, lon, time, True)
+    ds_file = xr.load_dataset(pol.courses_path)
+    ds_memory = pol.get_netCDF_courses(courses, lat, lon, time, True)
+
+    assert ds_memory['courses'].shape == (2, 3)
+    xr.testing.assert_identical(ds_file, ds_memory)
+
+    with pytest.raises(ValueError):
+        pol.set_power_mode('files')
+
+
+# mimics the file-based interface of mariPower: adds ship parameters that depend on the courses and the id of the
+# process to the courses netCDF
+def predict_file_dummy(ship, courses_path, environment_path, depth_path):
+    with xr.open_dataset(environment_path) as env_data:
+        assert 'VHM0' in env_data
+    assert os.path.exists(depth_path)
+    ds = xr.load_dataset(courses_path)
+    for var in ['Fuel_consumption_rate', 'Wind_resistance', 'Calm_resistance', 'Wave_resistance',
+                'Shallow_water_resistance', 'Hull_roughness_resistance']:
+        ds[var] = xr.zeros_like(ds['courses'])
+    ds['Power_brake'] = ds['courses'] * 1000
+    ds['RotationRate'] = xr.full_like(ds['courses'], os.getpid())
+    ds.to_netcdf(courses_path)
+
+
+'''
+    test whether the power mode 'in_memory' provides the same ship parameters as the communication via the courses
+    netCDF while exchanging all files with mariPower in the RAM-backed directory, whether the directory is removed
+    with the Tanker and whether errors of mariPower are raised
+'''
+
+
+def test_get_fuel_in_memory(monkeypatch, tmp_path):
+    requests = []
+
+    def predict_record(ship, courses_path, environment_path, depth_path):
+        requests.append((courses_path, environment_path, depth_path))
+        predict_file_dummy(ship, courses_path, environment_path, depth_path)
+
+    monkeypatch.setattr(mariPower.__main__, 'PredictPowerOrSpeedRoute', predict_record)
+    lat = np.repeat(np.array([54.1, 54.2, 54.3]), 2)
+    lon = np.repeat(np.array([13.1, 13.2, 13.3]), 2)
+    courses = np.arange(6) * 10.
+    time = np.full(6, np.datetime64('2023-07-20T12:00', 's'))
+
+    pol = get_default_Tanker()
+    pol.set_courses_path(str(tmp_path / 'CoursesRoute.nc'))
+    pol.set_boat_speed(6)
+    ship_params_netCDF = pol.get_fuel_per_time_netCDF(courses, lat, lon, time, True)
+    os.remove(pol.courses_path)
+
+    pol.set_power_mode('in_memory')
+    memory_dir = pol.memory_dir
+    ship_params_memory = pol.get_fuel_per_time_netCDF(courses, lat, lon, time, True)
+
+    assert np.allclose(ship_params_memory.get_power(), ship_params_netCDF.get_power())
+    assert np.allclose(ship_params_memory.get_fuel(), ship_params_netCDF.get_fuel())
+    assert not os.path.exists(pol.courses_path)
+    for path in requests[1]:
+        assert os.path.dirname(path) == memory_dir
+    assert os.path.basename(requests[1][1]) == os.path.basename(pol.environment_path)
+
+    monkeypatch.setattr(mariPower.__main__, 'PredictPowerOrSpeedRoute', predict_error)
+    with pytest.raises(RuntimeError):
+        pol.get_fuel_per_time_netCDF(courses, lat, lon, time, True)
+
+    del pol
+    gc.collect()
+    assert not os.path.exists(memory_dir)
+
+
+def predict_error(ship, courses_path, environment_path, depth_path):
+    raise RuntimeError('NaN in the environmental data')
+
+
+'''
+    test whether the MariPowerPool distributes the courses to several worker processes which request the power
+    estimation via the file-based interface of mariPower, returns the same ship parameters as the communication via
+    the courses netCDF in the order of the courses and removes its directory in the RAM-backed file system on closing
+'''
+
+
+def test_maripower_pool(monkeypatch, tmp_path):
+    # the worker processes inherit the replaced prediction function of mariPower
+    monkeypatch.setattr(mariPower.__main__, 'PredictPowerOrSpeedRoute', predict_file_dummy)
+    monkeypatch.setattr(processes, 'start_method', 'fork')
+    lat = np.repeat(np.array([54.1, 54.2, 54.3, 54.4, 54.5]), 2)
+    lon = np.repeat(np.array([13.1, 13.2, 13.3, 13.4, 13.5]), 2)
+    courses = np.arange(10) * 10.
+    time = np.full(10, np.datetime64('2023-07-20T12:00', 's'))
+
+    pol = get_default_Tanker()
+    pol.set_courses_path(str(tmp_path / 'CoursesRoute.nc'))
+    pol.set_boat_speed(6)
+    ship_params_netCDF = pol.get_fuel_per_time_netCDF(courses, lat, lon, time, True)
+
+    maripower_pool = MariPowerPool(pol.environment_path, pol.depth_path, processes=2)
+    pol.set_maripower_pool(maripower_pool)
+    pol.set_power_mode('in_memory')
+    try:
+        ship_params = pol.get_fuel_per_time_netCDF(courses, lat, lon, time, True)
+    finally:
+        maripower_pool.close()
+
+    assert np.allclose(ship_params.get_power(), ship_params_netCDF.get_power())
+    assert np.allclose(ship_params.get_power(), utils.degree_to_pmpi(courses) * 1000)
+    assert np.unique(ship_params.get_rpm()).shape[0] == 2
+    assert os.getpid() not in ship_params.get_rpm()
+    assert not os.path.exists(maripower_pool.memory_dir)
+
+
+'''
+    test whether the power cache passes 'unique_coords' to the power estimation such that mariPower receives all
+    courses of a position in one row and whether the cached ship parameters agree with the uncached ones
+'''
+
+
+def test_power_cache_unique_coords(monkeypatch):
+    requests = []
+
+    def predict_record(ship, courses_path, environment_path, depth_path):
+        with xr.open_dataset(courses_path) as ds:
+            requests.append(ds['courses'].shape)
+        predict_file_dummy(ship, courses_path, environment_path, depth_path)
+
+    monkeypatch.setattr(mariPower.__main__, 'PredictPowerOrSpeedRoute', predict_record)
+    time = np.full(9, np.datetime64('2023-07-20T12:00', 's'))
+
+    pol_uncached = get_default_Tanker()
+    pol_cached = get_default_Tanker()
+    for pol in [pol_uncached, pol_cached]:
+        pol.set_boat_speed(6)
+        pol.set_power_mode('in_memory')
+    pol_cached.set_power_cache(PowerCache(100))
+
+    # second request: first position fully cached, second position partly cached, third position not cached
+    for lat, lon, courses in [(np.repeat([54.1, 54.2], 3), np.repeat([13.1, 13.2], 3), np.tile([10., 20., 30.], 2)),
+                              (np.repeat([54.1, 54.2, 54.3], 3), np.repeat([13.1, 13.2, 13.3], 3),
+                               np.array([10., 20., 30., 10., 20., 40., 10., 20., 30.]))]:
+        requests.clear()
+        ship_params_uncached = pol_uncached.get_fuel_per_time_netCDF(courses, lat, lon, time[:lat.shape[0]], True)
+        requests_uncached = list(requests)
+        requests.clear()
+        ship_params_cached = pol_cached.get_fuel_per_time_netCDF(courses, lat, lon, time[:lat.shape[0]], True)
+
+        assert np.allclose(ship_params_cached.get_power(), ship_params_uncached.get_power())
+        assert np.allclose(ship_params_cached.get_fuel(), ship_params_uncached.get_fuel())
+        assert np.allclose(ship_params_cached.get_rpm(), ship_params_uncached.get_rpm())
+        assert requests_uncached == [(lat.shape[0] // 3, 3)]
+        assert requests == [(2, 3)]
+
+
 '''
     test whether lat, lon, time and courses are correctly written to course netCDF & wheather start_times_per_step
     and dist_per_step
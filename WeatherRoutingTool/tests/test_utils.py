@@ -1,5 +1,9 @@
+import multiprocessing
+import threading
+
 import pytest
 
+import WeatherRoutingTool.utils.processes as processes
 import WeatherRoutingTool.utils.unit_conversion as unit
 
 
@@ -51,3 +55,34 @@ def test_get_angle_bins_minsmaller0():
     assert result[0] == 320
     assert result[result.shape[0] - 1] == 20
     assert (result[1] - result[0]) == 1
+
+
+'''
+    test whether get_context() uses the configured start method, falls back to the automatic choice if the method is
+    not available and avoids 'fork' while other threads are running
+'''
+
+
+def test_get_context(monkeypatch):
+    with pytest.raises(ValueError):
+        processes.set_start_method('thread')
+
+    monkeypatch.setattr(processes, 'start_method', 'spawn')
+    assert processes.get_context().get_start_method() == 'spawn'
+
+    monkeypatch.setattr(processes, 'start_method', 'fork')
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    assert processes.get_context().get_start_method() == 'spawn'
+
+    monkeypatch.setattr(processes, 'start_method', None)
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['fork', 'spawn'])
+    assert processes.get_context().get_start_method() == 'fork'
+
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        assert processes.get_context().get_start_method() == 'spawn'
+    finally:
+        stop.set()
+        thread.join()